@@ -69,13 +69,17 @@ def run(args: argparse.Namespace) -> None:
 
     evaluate = None
     load_config = None
+    cache = None
     if args.execute_supported:
         # Lazy imports: allow manifest-only mode without full ML dependencies.
         from experiments.evaluate import evaluate as _evaluate  # noqa: WPS433
+        from experiments.run_cache import MARKER_FILE, RunCache, run_key  # noqa: WPS433
         from src.config import load_config as _load_config  # noqa: WPS433
 
         evaluate = _evaluate
         load_config = _load_config
+        if args.run_cache:
+            cache = RunCache(args.run_cache)
 
     for dataset in datasets:
         if dataset not in DATASET_CONFIG_MAP:
@@ -93,6 +97,7 @@ def run(args: argparse.Namespace) -> None:
                     "status": "completed",
                     "reason": "",
                     "output_dir": str(run_dir),
+                    "reused": "0",
                 }
 
                 if args.execute_supported:
@@ -105,12 +110,27 @@ def run(args: argparse.Namespace) -> None:
                         # Keep ablation baseline anchored to YOLO profile.
                         config.detector.model = "yolov8n"
                         mutator(config)
-                        evaluate(
-                            config=config,
-                            output_dir=str(run_dir),
-                            quick=args.quick,
-                            max_videos=args.max_videos,
-                        )
+
+                        # Identical earlier run (any seed under greedy decoding)
+                        key = run_key(config, args.quick, args.max_videos) if cache else None
+                        cached = cache.restore(key, str(run_dir)) if cache else None
+                        if cached is not None:
+                            row["reused"] = "1"
+                            row["reason"] = f"run_cache:{key[:12]} from {cached['meta'].get('run_dir')}"
+                        else:
+                            (run_dir / MARKER_FILE).unlink(missing_ok=True)
+                            evaluate(
+                                config=config,
+                                output_dir=str(run_dir),
+                                quick=args.quick,
+                                max_videos=args.max_videos,
+                            )
+                            if cache:
+                                cache.store(
+                                    key,
+                                    str(run_dir),
+                                    meta={"dataset": dataset, "ablation": ablation_name, "seed": seed},
+                                )
                     except Exception as exc:  # pragma: no cover (runtime failure path)
                         row["status"] = "failed"
                         row["reason"] = str(exc)
@@ -132,11 +152,12 @@ def run(args: argparse.Namespace) -> None:
                         "status": "pending_runtime_support",
                         "reason": reason,
                         "output_dir": str(run_dir),
+                        "reused": "0",
                     }
                 )
 
     manifest_csv = output_root / "ablation_manifest.csv"
-    fieldnames = ["dataset", "ablation", "seed", "status", "reason", "output_dir"]
+    fieldnames = ["dataset", "ablation", "seed", "status", "reason", "output_dir", "reused"]
     with manifest_csv.open("w", encoding="utf-8", newline="") as f:
         writer = csv.DictWriter(f, fieldnames=fieldnames)
         writer.writeheader()
@@ -193,6 +214,12 @@ def main() -> None:
         default=1,
         help="Whether to execute supported ablations (1) or write plan only (0)",
     )
+    parser.add_argument(
+        "--run-cache",
+        type=str,
+        default=str(REPO_ROOT / "outputs/run_cache"),
+        help="Content-addressed run cache reused for identical runs (empty disables)",
+    )
     args = parser.parse_args()
     args.execute_supported = bool(args.execute_supported)
     run(args)
@@ -11,6 +11,7 @@ DEVICE="cuda"
 EXECUTE_SUPPORTED=1
 QUICK=0
 MAX_VIDEOS=""
+RUN_CACHE="${REPO_ROOT}/outputs/run_cache"
 
 usage() {
   cat <<'EOF'
@@ -24,6 +25,7 @@ Options:
   --execute-supported <0|1> Execute supported ablations (default: 1)
   --quick <0|1>             Quick mode flag (default: 0)
   --max-videos <int>        Optional max videos
+  --run-cache <path>        Run cache directory, empty disables (default: outputs/run_cache)
   -h, --help                Show this help
 EOF
 }
@@ -37,6 +39,7 @@ while [[ $# -gt 0 ]]; do
     --execute-supported) EXECUTE_SUPPORTED="$2"; shift 2 ;;
     --quick) QUICK="$2"; shift 2 ;;
     --max-videos) MAX_VIDEOS="$2"; shift 2 ;;
+    --run-cache) RUN_CACHE="$2"; shift 2 ;;
     -h|--help) usage; exit 0 ;;
     *) echo "Unknown argument: $1" >&2; usage; exit 1 ;;
   esac
@@ -57,6 +60,7 @@ CMD=(
   --datasets "${DATASETS}"
   --device "${DEVICE}"
   --execute-supported "${EXECUTE_SUPPORTED}"
+  --run-cache "${RUN_CACHE}"
 )
 
 if [[ "${QUICK}" == "1" ]]; then
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Estimate per-class shape variance for Adaptive Dilation from annotation files.
+Streams YOLO or COCO boxes and writes a `pruning.shape_variance` YAML block.
+
+Example:
+python data/estimate_shape_variance.py \
+  --format yolo --labels data/site/labels/train --names data/site/dataset.yaml \
+  --config experiments/configs/base.yaml --output outputs/shape_variance.yaml
+"""
+
+import argparse
+import json
+import logging
+from pathlib import Path
+
+# Add project root to path
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.pruning.shape_variance import (
+    ShapeVarianceEstimator,
+    iter_coco_boxes,
+    iter_yolo_boxes,
+    load_class_names,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate shape variance for adaptive dilation")
+    parser.add_argument(
+        "--format",
+        type=str,
+        choices=["yolo", "coco"],
+        required=True,
+        help="Annotation format"
+    )
+    parser.add_argument(
+        "--labels",
+        type=str,
+        default=None,
+        help="YOLO label directory (searched recursively for *.txt)"
+    )
+    parser.add_argument(
+        "--names",
+        type=str,
+        default=None,
+        help="YOLO class names (data.yaml or one name per line)"
+    )
+    parser.add_argument(
+        "--annotations",
+        type=str,
+        default=None,
+        help="COCO annotation JSON file"
+    )
+    parser.add_argument(
+        "--config",
+        type=str,
+        default=None,
+        help="Config whose pruning settings are used as the token-impact reference"
+    )
+    parser.add_argument(
+        "--area-weight",
+        type=float,
+        default=0.0,
+        help="Weight of log-area variance in the shape variance"
+    )
+    parser.add_argument(
+        "--min-count",
+        type=int,
+        default=10,
+        help="Minimum boxes per class"
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="Output YAML path (prints to stdout if omitted)"
+    )
+    args = parser.parse_args()
+
+    if args.format == "yolo":
+        if not args.labels or not args.names:
+            parser.error("--labels and --names are required for YOLO format")
+        boxes = iter_yolo_boxes(args.labels, load_class_names(args.names))
+    else:
+        if not args.annotations:
+            parser.error("--annotations is required for COCO format")
+        boxes = iter_coco_boxes(args.annotations)
+
+    estimator = ShapeVarianceEstimator(
+        area_weight=args.area_weight,
+        min_count=args.min_count
+    )
+    num_boxes = estimator.update_from(boxes)
+    logger.info(f"Read {num_boxes} boxes across {len(estimator.stats)} classes")
+
+    impact_kwargs = {}
+    if args.config:
+        from src.config import load_config
+
+        config = load_config(args.config)
+        impact_kwargs = {
+            "reference_variance": config.pruning.shape_variance,
+            "image_size": config.data.image_size,
+            "alpha_base": config.pruning.alpha_base,
+            "beta": config.pruning.beta,
+        }
+    impact = estimator.token_impact(**impact_kwargs)
+
+    for name, row in impact.items():
+        logger.info(
+            f"{name}: n={row['count']}, sigma {row['shape_variance_current']:.3f} -> "
+            f"{row['shape_variance']:.3f}, tokens/box {row['tokens_current']:.0f} -> "
+            f"{row['tokens_estimated']:.0f} ({row['tokens_delta']:+.0f})"
+        )
+
+    skipped = sorted(
+        name for name, stats in estimator.stats.items()
+        if stats.count < args.min_count
+    )
+    if skipped:
+        logger.warning(f"Skipped classes with < {args.min_count} boxes: {skipped}")
+
+    yaml_block = estimator.to_yaml(impact)
+    if args.output:
+        output_path = Path(args.output)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        output_path.write_text(yaml_block, encoding="utf-8")
+        output_path.with_suffix(".json").write_text(json.dumps(impact, indent=2), encoding="utf-8")
+        logger.info(f"Saved shape variance to {output_path}")
+    else:
+        print(yaml_block)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,13 +8,9 @@ import argparse
 import json
 import logging
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import TYPE_CHECKING, Dict, Any, Optional
 from datetime import datetime
 
-import optuna
-from optuna.trial import Trial
-from optuna.samplers import TPESampler
-from optuna.pruners import MedianPruner
 from omegaconf import OmegaConf
 
 # Add src to path
@@ -24,6 +20,11 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 from src.config import load_config, EventVLMConfig
 from experiments.evaluate import evaluate
 
+if TYPE_CHECKING:
+    import optuna
+    from optuna.trial import Trial
+    from experiments.replay import Recording
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -33,6 +34,11 @@ class EventVLMObjective:
     Optuna objective for Event-VLM hyperparameter optimization.
     
     Optimizes for weighted combination of AUC and FPS.
+    
+    With a recording (see experiments/replay.py), trials that only change
+    the detector threshold and pruning parameters are replayed instead of
+    re-running the pipeline; fps is then the modeled latency of the
+    recorded stage timings.
     """
     
     def __init__(
@@ -41,20 +47,23 @@ class EventVLMObjective:
         search_space: Dict[str, Dict],
         objectives: list = ["auc", "fps"],
         objective_weights: list = [1.0, 0.5],
-        quick_eval: bool = True
+        quick_eval: bool = True,
+        recording: Optional["Recording"] = None
     ):
         self.base_config = base_config
         self.search_space = search_space
         self.objectives = objectives
         self.objective_weights = objective_weights
         self.quick_eval = quick_eval
+        self.recording = recording
+        self.max_videos = 50 if quick_eval else None
         
         # Track best results
         self.best_score = float("-inf")
         self.best_config = None
         self.trial_history = []
     
-    def __call__(self, trial: Trial) -> float:
+    def __call__(self, trial: "Trial") -> float:
         """
         Objective function for Optuna.
         
@@ -67,14 +76,16 @@ class EventVLMObjective:
         # Sample hyperparameters
         config = self._sample_config(trial)
         
-        # Run evaluation
+        # Run evaluation (replayed when the recording covers the trial)
         try:
-            metrics = evaluate(
-                config=config,
-                output_dir=None,
-                quick=self.quick_eval,
-                max_videos=50 if self.quick_eval else None
-            )
+            metrics, mode = self._replay(config), "replay"
+            if metrics is None:
+                metrics, mode = evaluate(
+                    config=config,
+                    output_dir=None,
+                    quick=self.quick_eval,
+                    max_videos=self.max_videos
+                ), "live"
         except Exception as e:
             logger.error(f"Trial {trial.number} failed: {e}")
             return float("-inf")
@@ -90,7 +101,8 @@ class EventVLMObjective:
             "trial": trial.number,
             "params": trial.params,
             "metrics": metrics,
-            "score": score
+            "score": score,
+            "mode": mode
         }
         self.trial_history.append(trial_result)
         
@@ -102,7 +114,17 @@ class EventVLMObjective:
         
         return score
     
-    def _sample_config(self, trial: Trial) -> EventVLMConfig:
+    def _replay(self, config: EventVLMConfig) -> Optional[Dict[str, float]]:
+        """Replayed metrics of a trial, or None if it needs a live run."""
+        if self.recording is None or not self.recording.can_replay(config, self.quick_eval, self.max_videos):
+            return None
+        metrics = self.recording.replay(config)
+        # Caption metrics are only replayed when their captions were recorded
+        if not all(obj in metrics for obj in self.objectives):
+            return None
+        return metrics
+    
+    def _sample_config(self, trial: "Trial") -> EventVLMConfig:
         """Sample configuration from search space."""
         # Deep copy base config
         config = OmegaConf.structured(self.base_config)
@@ -162,7 +184,8 @@ def run_optimization(
     study_name: str = "event_vlm_tuning",
     storage: Optional[str] = None,
     output_dir: str = "outputs/tuning",
-    quick: bool = True
+    quick: bool = True,
+    replay: bool = True
 ) -> Dict[str, Any]:
     """
     Run hyperparameter optimization.
@@ -174,10 +197,15 @@ def run_optimization(
         storage: SQLite storage path
         output_dir: Output directory
         quick: Use quick evaluation
+        replay: Record the base config once and replay threshold/pruning trials
         
     Returns:
         Best parameters and results
     """
+    import optuna
+    from optuna.samplers import TPESampler
+    from optuna.pruners import MedianPruner
+    
     # Load base config
     config = load_config(config_path)
     
@@ -190,13 +218,29 @@ def run_optimization(
     logger.info(f"Search space: {list(search_space.keys())}")
     logger.info(f"Objectives: {objectives} (weights: {objective_weights})")
     
+    # Record once at the lowest threshold of the search space
+    output_dir = Path(output_dir)
+    recording = None
+    if replay:
+        conf_floor = config.detector.conf_threshold
+        if "conf_threshold" in search_space:
+            conf_floor = min(conf_floor, search_space["conf_threshold"]["low"])
+        from experiments.replay import Recording
+
+        logger.info(f"Recording detections at conf_threshold={conf_floor} for replay")
+        recording = Recording.record(
+            config, quick=quick, max_videos=50 if quick else None, conf_floor=conf_floor
+        )
+        recording.save(str(output_dir / "replay_recording.json"))
+    
     # Create objective
     objective = EventVLMObjective(
         base_config=config,
         search_space=search_space,
         objectives=objectives,
         objective_weights=objective_weights,
-        quick_eval=quick
+        quick_eval=quick,
+        recording=recording
     )
     
     # Create or load study
@@ -235,7 +279,6 @@ def run_optimization(
         logger.info(f"  {key}: {value}")
     
     # Save results
-    output_dir = Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
     
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -273,7 +316,7 @@ def run_optimization(
     }
 
 
-def visualize_study(study: optuna.Study, output_dir: str):
+def visualize_study(study: "optuna.Study", output_dir: str):
     """Generate visualization plots for the study."""
     try:
         from optuna.visualization import (
@@ -341,6 +384,11 @@ def main():
         action="store_true",
         help="Use quick evaluation (fewer samples per trial)"
     )
+    parser.add_argument(
+        "--no-replay",
+        action="store_true",
+        help="Run the full pipeline for every trial instead of replaying a recording"
+    )
     parser.add_argument(
         "--visualize",
         action="store_true",
@@ -356,7 +404,8 @@ def main():
         study_name=args.study_name,
         storage=args.storage,
         output_dir=args.output_dir,
-        quick=args.quick
+        quick=args.quick,
+        replay=not args.no_replay
     )
     
     # Generate visualizations
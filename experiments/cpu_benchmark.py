@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+CPU throughput benchmark for Stage 3 captioning.
+
+Measures caption latency and decode throughput of the VLM on CPU for each
+weight-only quantization mode and thread count, at the critical-hazard
+token budget, to size edge nodes that caption only critical events locally.
+
+Example:
+python experiments/cpu_benchmark.py \
+  --model llava-1.5-7b \
+  --quantization none,int8,int4 \
+  --threads 4,8,16 \
+  --output outputs/cpu_benchmark.json
+
+CI smoke test:
+python experiments/cpu_benchmark.py --model tiny --num-captions 2
+"""
+
+import argparse
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+import torch
+
+# Add project root to path
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.config import VLMConfig
+from src.vlm.cpu_quant import set_cpu_threads, weight_bytes
+from src.vlm.llava_wrapper import get_vlm
+from src.vlm.prompt_tuning import PromptBank
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def parse_csv(value: str) -> List[str]:
+    """Parse comma-separated argument into a clean list."""
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def benchmark_captions(vlm, images: List[np.ndarray], prompt: str, hazard_level: str) -> Dict[str, float]:
+    """Caption each image once and summarize latency and throughput."""
+    latencies, ttfts, decode_rates, tokens = [], [], [], []
+    for image in images:
+        start = time.time()
+        output = vlm.generate(image, prompt, hazard_level=hazard_level)
+        latencies.append(time.time() - start)
+        ttfts.append(output.time_to_first_token)
+        decode_rates.append(output.decode_tokens_per_sec)
+        tokens.append(output.generated_tokens)
+
+    total_time = float(sum(latencies))
+    return {
+        "mean_latency_s": float(np.mean(latencies)),
+        "p95_latency_s": float(np.percentile(latencies, 95)),
+        "mean_ttft_s": float(np.mean(ttfts)),
+        "decode_tokens_per_sec": float(np.mean(decode_rates)),
+        "mean_generated_tokens": float(np.mean(tokens)),
+        # One node captions events back to back: the sustainable event rate
+        "captions_per_sec": len(images) / total_time if total_time > 0 else 0.0,
+        "captions_per_min": 60.0 * len(images) / total_time if total_time > 0 else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="CPU throughput benchmark for Stage 3")
+    parser.add_argument("--model", type=str, default="llava-1.5-7b",
+                        help="VLM name (tiny for a randomly initialized CI model)")
+    parser.add_argument("--quantization", type=str, default="none,int8,int4",
+                        help="Comma-separated CPU quantization modes")
+    parser.add_argument("--threads", type=str, default="",
+                        help="Comma-separated thread counts (default: PyTorch default)")
+    parser.add_argument("--group-size", type=int, default=64, help="int4 scale group size")
+    parser.add_argument("--hazard-level", type=str, default="critical",
+                        help="Hazard level whose prompt and token budget are used")
+    parser.add_argument("--num-captions", type=int, default=5, help="Timed captions per setting")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed captions per setting")
+    parser.add_argument("--image-size", type=int, default=336)
+    parser.add_argument("--tiny-hidden-size", type=int, default=128,
+                        help="Hidden size of the tiny model (multiple of --group-size)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None, help="Write results JSON here")
+    args = parser.parse_args()
+
+    vlm_config = VLMConfig()
+    hazard_level = args.hazard_level
+    prompt = PromptBank().get_prompt(hazard_level).format()
+    max_new_tokens = vlm_config.token_budgets.get(hazard_level, vlm_config.max_new_tokens)
+    default_threads = torch.get_num_threads()
+    thread_counts = [int(t) for t in parse_csv(args.threads)] or [default_threads]
+
+    rng = np.random.default_rng(args.seed)
+    images = [
+        rng.integers(0, 256, size=(args.image_size, args.image_size, 3), dtype=np.uint8)
+        for _ in range(args.warmup + args.num_captions)
+    ]
+
+    results: List[Dict[str, Any]] = []
+    for mode in parse_csv(args.quantization):
+        vlm_kwargs = dict(
+            quantization=mode,
+            device="cpu",
+            max_new_tokens=max_new_tokens,
+            token_budgets=vlm_config.token_budgets,
+            quant_group_size=args.group_size
+        )
+        if args.model == "tiny":
+            vlm_kwargs.update(hidden_size=args.tiny_hidden_size, image_size=args.image_size, seed=args.seed)
+        vlm = get_vlm(args.model, **vlm_kwargs)
+        vlm.load_model()
+
+        for threads in thread_counts:
+            set_cpu_threads(threads)
+            for image in images[:args.warmup]:
+                vlm.generate(image, prompt, hazard_level=hazard_level)
+
+            stats = benchmark_captions(vlm, images[args.warmup:], prompt, hazard_level)
+            stats.update(
+                model=args.model,
+                quantization=mode,
+                threads=threads,
+                weight_mib=weight_bytes(vlm.model) / 2**20
+            )
+            results.append(stats)
+            logger.info(
+                f"{mode:>5} x{threads:<3} {stats['mean_latency_s']:.2f}s/caption "
+                f"{stats['decode_tokens_per_sec']:.1f} tok/s "
+                f"{stats['captions_per_min']:.1f} captions/min {stats['weight_mib']:.0f} MiB"
+            )
+
+        del vlm
+    set_cpu_threads(default_threads)
+
+    best = max(results, key=lambda r: r["captions_per_sec"])
+    payload = {
+        "hazard_level": hazard_level,
+        "max_new_tokens": max_new_tokens,
+        "num_captions": args.num_captions,
+        "results": results,
+        "best": {key: best[key] for key in ("quantization", "threads", "captions_per_min", "weight_mib")},
+    }
+    print(json.dumps(payload["best"], indent=2))
+
+    if args.output:
+        output_path = Path(args.output)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(output_path, "w") as f:
+            json.dump(payload, f, indent=2)
+        logger.info(f"Wrote {output_path}")
+
+
+if __name__ == "__main__":
+    main()
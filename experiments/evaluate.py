@@ -5,14 +5,15 @@ Evaluates on UCF-Crime or XD-Violence benchmarks.
 """
 
 import argparse
+import hashlib
 import json
 import logging
+import os
 import time
 import random
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from typing import Callable, Dict, Any, List, Optional, Tuple
 
-import torch
 import numpy as np
 from tqdm import tqdm
 from omegaconf import OmegaConf
@@ -21,8 +22,9 @@ from omegaconf import OmegaConf
 import sys
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+# torch and the pipeline are imported where used, so --help and metric
+# helpers start without loading the model stack
 from src.config import load_config, EventVLMConfig
-from src.pipeline import EventVLM
 from src.utils.metrics import (
     AUCMeter, TriggerReliabilityMeter, CaptionMetrics,
     compute_efficiency_metrics
@@ -34,6 +36,8 @@ logger = logging.getLogger(__name__)
 
 def set_global_seed(seed: int) -> None:
     """Set global RNG seed for reproducible evaluation runs."""
+    import torch
+    
     random.seed(seed)
     np.random.seed(seed)
     torch.manual_seed(seed)
@@ -95,47 +99,113 @@ class VideoDataset:
         return self.video_list[idx]
 
 
-def evaluate(
-    config: EventVLMConfig,
-    output_dir: Optional[str] = None,
-    quick: bool = False,
-    max_videos: Optional[int] = None
-) -> Dict[str, float]:
+def video_frame_count(video_path: str) -> int:
+    """Frame count from the video header (0 if unreadable)."""
+    import cv2
+    
+    cap = cv2.VideoCapture(video_path)
+    count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if cap.isOpened() else 0
+    cap.release()
+    return max(count, 0)
+
+
+def build_pipeline(config: EventVLMConfig, device: Optional[str] = None):
+    """Event-VLM pipeline for the configured detector and VLM."""
+    from src.pipeline import EventVLM
+    
+    return EventVLM(
+        config=config,
+        detector=config.detector.model,
+        vlm=config.vlm.model,
+        device=device or config.device
+    )
+
+
+def evaluate_video(model, video_info: Dict, config: EventVLMConfig, quick: bool = False) -> Dict[str, Any]:
     """
-    Run evaluation on dataset.
+    Run the pipeline on one video and summarize it.
     
     Args:
+        model: Event-VLM pipeline
+        video_info: Dataset entry (id, path, label, caption)
         config: Configuration object
-        output_dir: Directory to save results
-        quick: Quick mode with fewer samples
-        max_videos: Maximum videos to evaluate
+        quick: Quick mode with fewer frames
         
     Returns:
-        Dict of metric name to value
+        Record with the video prediction, per-event-frame summary and
+        token counts, frame counts and processing time
     """
-    set_global_seed(config.seed)
-    logger.info(f"Using evaluation seed: {config.seed}")
+    result = model.process_video(
+        video_path=video_info["path"],
+        frame_rate=config.data.frame_rate,
+        max_frames=config.data.max_frames if not quick else 50
+    )
+    return video_record(result, video_info)
+
 
-    # Initialize model
-    logger.info("Initializing Event-VLM...")
-    model = EventVLM(config=config, device=config.device)
+def video_record(result, video_info: Dict) -> Dict[str, Any]:
+    """
+    Summarize a processed video for merge_video_records.
     
-    # Load dataset
-    logger.info(f"Loading dataset: {config.data.name}")
-    dataset = VideoDataset(
-        root_dir=config.data.root_dir,
-        split="test"
-    )
+    Args:
+        result: VideoResult of the pipeline
+        video_info: Dataset entry (id, path, label, caption)
+        
+    Returns:
+        Record with the video prediction, per-event-frame summary and
+        token counts, frame counts and processing time
+    """
+    # Aggregate frame-level results
+    video_pred = {
+        "id": video_info["id"],
+        "score": 0.0,
+        "triggered": any(r.is_event for r in result.frame_results),
+        "caption": "",
+        "reference_caption": video_info.get("caption", ""),
+        "label": int(video_info.get("label", 0)),
+        "fps": result.fps
+    }
+    tokens_used = []
+    frames = []
     
-    if quick:
-        max_videos = min(10, len(dataset))
-    elif max_videos:
-        max_videos = min(max_videos, len(dataset))
-    else:
-        max_videos = len(dataset)
+    # Get max confidence as video score
+    for frame_result in result.frame_results:
+        if frame_result.is_event:
+            score = max(d.confidence for d in frame_result.detections) if frame_result.detections else 0
+            video_pred["score"] = max(video_pred["score"], score)
+            
+            if frame_result.caption:
+                video_pred["caption"] = frame_result.caption
+            
+            tokens_used.append(frame_result.tokens_used)
+            frames.append({
+                "frame_idx": frame_result.frame_idx,
+                "hazard_level": frame_result.hazard_level,
+                "score": float(score),
+                "tokens_used": frame_result.tokens_used
+            })
     
-    logger.info(f"Evaluating on {max_videos} videos")
+    return {
+        "prediction": video_pred,
+        "frames": frames,
+        "tokens_used": tokens_used,
+        "event_frames": len(tokens_used),
+        "processed_frames": result.processed_frames,
+        "total_time": result.total_time
+    }
+
+
+def merge_video_records(records: List[Dict[str, Any]], tokens_total: int) -> Dict[str, float]:
+    """
+    Compute dataset metrics from per-video records, in dataset order.
     
+    Args:
+        records: Outputs of evaluate_video
+        tokens_total: Visual tokens per frame before pruning
+        
+    Returns:
+        Dict of metric name to value
+    """
     # Meters
     auc_meter = AUCMeter()
     trigger_meter = TriggerReliabilityMeter()
@@ -143,72 +213,34 @@ def evaluate(
     
     # Efficiency tracking
     all_tokens_used = []
-    tokens_total = (config.data.image_size // 14) ** 2
     total_time = 0
     total_frames = 0
     event_frames = 0
     
-    # Process videos
-    predictions = []
-    
-    for idx in tqdm(range(max_videos), desc="Evaluating"):
-        video_info = dataset[idx]
+    for record in records:
+        video_pred = record["prediction"]
         
-        try:
-            result = model.process_video(
-                video_path=video_info["path"],
-                frame_rate=config.data.frame_rate,
-                max_frames=config.data.max_frames if not quick else 50
-            )
-            
-            # Aggregate frame-level results
-            video_pred = {
-                "id": video_info["id"],
-                "score": 0.0,
-                "triggered": any(r.is_event for r in result.frame_results),
-                "caption": "",
-                "reference_caption": video_info.get("caption", ""),
-                "label": int(video_info.get("label", 0)),
-                "fps": result.fps
-            }
-            
-            # Get max confidence as video score
-            for frame_result in result.frame_results:
-                if frame_result.is_event:
-                    score = max(d.confidence for d in frame_result.detections) if frame_result.detections else 0
-                    video_pred["score"] = max(video_pred["score"], score)
-                    
-                    if frame_result.caption:
-                        video_pred["caption"] = frame_result.caption
-                    
-                    all_tokens_used.append(frame_result.tokens_used)
-                    event_frames += 1
-            
-            total_frames += result.processed_frames
-            total_time += result.total_time
-            
-            predictions.append(video_pred)
-            
-            # Update meters
-            auc_meter.update(
-                np.array([video_pred["score"]]),
-                np.array([video_info["label"]])
-            )
-            
-            trigger_meter.update(
-                video_pred["triggered"],
-                video_info["label"] > 0
+        all_tokens_used.extend(record["tokens_used"])
+        event_frames += record["event_frames"]
+        total_frames += record["processed_frames"]
+        total_time += record["total_time"]
+        
+        # Update meters
+        auc_meter.update(
+            np.array([video_pred["score"]]),
+            np.array([video_pred["label"]])
+        )
+        
+        trigger_meter.update(
+            video_pred["triggered"],
+            video_pred["label"] > 0
+        )
+        
+        if video_pred["caption"] and video_pred["reference_caption"]:
+            caption_metrics.update(
+                video_pred["caption"],
+                video_pred["reference_caption"]
             )
-            
-            if video_pred["caption"] and video_info["caption"]:
-                caption_metrics.update(
-                    video_pred["caption"],
-                    video_info["caption"]
-                )
-                
-        except Exception as e:
-            logger.error(f"Error processing {video_info['id']}: {e}")
-            continue
     
     # Compute metrics
     metrics = {}
@@ -237,6 +269,376 @@ def evaluate(
     )
     metrics.update(eff_metrics)
     
+    return metrics
+
+
+def pipeline_key(config: EventVLMConfig) -> str:
+    """
+    Identity of the components a configuration builds.
+    
+    Configurations with the same key can share one loaded pipeline
+    (EventVLM.reset swaps in the rest, e.g. seed and prompt strategy).
+    """
+    conf = OmegaConf.to_container(OmegaConf.structured(config), resolve=True)
+    conf["vlm"].pop("prompt_strategy", None)
+    key = {
+        name: conf[name]
+        for name in ("device", "server", "detector", "pruning", "vlm", "mock", "dedup")
+    }
+    key["image_size"] = conf["data"]["image_size"]
+    return json.dumps(key, sort_keys=True)
+
+
+def config_digest(config: EventVLMConfig) -> str:
+    """Hash of the configuration (excluding the model server address)."""
+    conf = OmegaConf.structured(config)
+    conf.server = None
+    return hashlib.sha256(OmegaConf.to_yaml(conf).encode("utf-8")).hexdigest()[:16]
+
+
+def run_identity(config: EventVLMConfig, quick: bool, videos: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Journal identity of a run: configuration, quick mode, and the digests of
+    the evaluation code and dataset manifest that experiments/run_cache.py
+    keys runs by.
+    """
+    from experiments.run_cache import code_digest, videos_digest
+    
+    return {
+        "config": config_digest(config),
+        "quick": quick,
+        "code": code_digest(),
+        "data": videos_digest(videos)
+    }
+
+
+class EvaluationJournal:
+    """
+    Append-only JSONL journal of evaluated videos in the output directory.
+    
+    The first line identifies the run (see run_identity); every further
+    line holds one video's record, or its error. On resume, videos with a
+    record are skipped and failed ones are retried. A line torn by a crash
+    mid-write is ignored.
+    
+    A journal written by other code or for other data is outdated: it is
+    restarted rather than resumed, so its records are never replayed into
+    (or cached as) results of the current code.
+    """
+    
+    FILENAME = "journal.jsonl"
+    
+    # Identity entries that change under an unchanged configuration
+    OUTDATED_KEYS = ("code", "data")
+    
+    def __init__(self, output_dir: str, run: Dict[str, Any], resume: bool = True):
+        """
+        Args:
+            output_dir: Evaluation output directory
+            run: Run identity; resuming a journal of another configuration
+                raises, an outdated one is restarted
+            resume: Reuse an existing journal (False starts a new one)
+        """
+        self.path = Path(output_dir) / self.FILENAME
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.records: Dict[str, Dict[str, Any]] = {}
+        
+        if not (resume and self.path.exists() and self.path.stat().st_size > 0 and self._load(run)):
+            with open(self.path, "w") as f:
+                f.write(json.dumps({"run": run}) + "\n")
+    
+    def _load(self, run: Dict[str, Any]) -> bool:
+        """Load the journal's records; returns False if it is outdated."""
+        with open(self.path) as f:
+            lines = f.read().splitlines()
+        
+        journaled = json.loads(lines[0]).get("run", {})
+        
+        def strip(identity):
+            return {k: v for k, v in identity.items() if k not in self.OUTDATED_KEYS}
+        
+        if strip(journaled) != strip(run):
+            raise ValueError(
+                f"{self.path} belongs to another run ({journaled} != {run}); "
+                "use a new output directory or --no-resume"
+            )
+        if journaled != run:
+            changed = [k for k in self.OUTDATED_KEYS if journaled.get(k) != run.get(k)]
+            logger.warning(f"Restarting {self.path}: written for other {' and '.join(changed)}")
+            return False
+        
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Ignoring torn journal line in {self.path}")
+                continue
+            if "error" in entry["record"]:
+                self.records.pop(entry["id"], None)
+            else:
+                self.records[entry["id"]] = entry["record"]
+        return True
+    
+    def append(self, video_id: str, record: Dict[str, Any]) -> None:
+        """Durably record one evaluated (or failed) video."""
+        with open(self.path, "a") as f:
+            f.write(json.dumps({"id": video_id, "record": record}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        if "error" not in record:
+            self.records[video_id] = record
+
+
+# Pipeline owned by an evaluation worker process
+_WORKER: Dict[str, Any] = {}
+
+
+def _init_worker(config: EventVLMConfig, devices, quick: bool, gpu_memory_fraction: float) -> None:
+    """Build the worker's pipeline on the next free device slot."""
+    import torch
+    
+    device = devices.get()
+    if device.startswith("cuda") and gpu_memory_fraction > 0:
+        # Workers sharing a GPU each stay within their memory budget
+        torch.cuda.set_per_process_memory_fraction(gpu_memory_fraction, torch.device(device))
+    
+    set_global_seed(config.seed)
+    config.device = device
+    _WORKER.update(model=build_pipeline(config, device), config=config, quick=quick)
+
+
+def _evaluate_in_worker(task):
+    """Evaluate one (index, video_info) task in a worker process."""
+    index, video_info = task
+    try:
+        set_global_seed(_WORKER["config"].seed + index)
+        return index, evaluate_video(_WORKER["model"], video_info, _WORKER["config"], _WORKER["quick"])
+    except Exception as e:
+        return index, {"error": f"{type(e).__name__}: {e}"}
+
+
+def select_videos(
+    config: EventVLMConfig,
+    quick: bool = False,
+    max_videos: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Load the test split and select the videos an evaluation covers.
+    
+    Args:
+        config: Configuration object
+        quick: Quick mode (at most 10 videos)
+        max_videos: Maximum videos to evaluate
+        
+    Returns:
+        Dataset entries (id, path, label, caption) in dataset order
+    """
+    logger.info(f"Loading dataset: {config.data.name}")
+    dataset = VideoDataset(
+        root_dir=config.data.root_dir,
+        split="test"
+    )
+    
+    if quick:
+        max_videos = min(10, len(dataset))
+    elif max_videos:
+        max_videos = min(max_videos, len(dataset))
+    else:
+        max_videos = len(dataset)
+    
+    return [dataset[idx] for idx in range(max_videos)]
+
+
+def evaluate(
+    config: EventVLMConfig,
+    output_dir: Optional[str] = None,
+    quick: bool = False,
+    max_videos: Optional[int] = None,
+    num_workers: int = 1,
+    devices: Optional[List[str]] = None,
+    gpu_memory_fraction: float = 0.0,
+    resume: bool = True,
+    model=None
+) -> Dict[str, float]:
+    """
+    Run evaluation on dataset.
+    
+    Args:
+        config: Configuration object
+        output_dir: Directory to save results
+        quick: Quick mode with fewer samples
+        max_videos: Maximum videos to evaluate
+        num_workers: Worker processes, each owning one pipeline (1 = serial)
+        devices: Worker devices, assigned round-robin (default: config.device)
+        gpu_memory_fraction: Per-worker fraction of GPU memory when workers
+            share a GPU (0 = no limit)
+        resume: Skip videos already in output_dir's journal
+        model: Loaded pipeline to reuse (see pipeline_key); runs serially
+        
+    Returns:
+        Dict of metric name to value
+    """
+    set_global_seed(config.seed)
+    logger.info(f"Using evaluation seed: {config.seed}")
+    
+    dataset = select_videos(config, quick, max_videos)
+    logger.info(f"Evaluating on {len(dataset)} videos")
+    tokens_total = (config.data.image_size // 14) ** 2
+    
+    # Process videos, skipping those already journaled
+    records: Dict[int, Dict[str, Any]] = {}
+    tasks = list(enumerate(dataset))
+    
+    journal = None
+    if output_dir:
+        journal = EvaluationJournal(
+            output_dir, run_identity(config, quick, dataset), resume=resume
+        )
+        for idx, video_info in tasks:
+            if video_info["id"] in journal.records:
+                records[idx] = journal.records[video_info["id"]]
+        tasks = [task for task in tasks if task[0] not in records]
+        if records:
+            logger.info(f"Resuming: {len(records)} videos already in {journal.path}")
+    
+    def on_record(idx: int, record: Dict[str, Any]) -> None:
+        records[idx] = record
+        if "error" in record:
+            logger.error(f"Error processing {dataset[idx]['id']}: {record['error']}")
+        if journal is not None:
+            journal.append(dataset[idx]["id"], record)
+    
+    if num_workers > 1 and len(tasks) > 1 and model is None:
+        _evaluate_parallel(config, tasks, quick, num_workers, devices, gpu_memory_fraction, on_record)
+    elif tasks:
+        model = _prepare_pipeline(config, model)
+        
+        for idx, video_info in tqdm(tasks, desc="Evaluating"):
+            try:
+                # Seeded per video, as in worker processes and on resume
+                set_global_seed(config.seed + idx)
+                record = evaluate_video(model, video_info, config, quick)
+            except Exception as e:
+                record = {"error": f"{type(e).__name__}: {e}"}
+            on_record(idx, record)
+    
+    return _finish_run(records, dataset, tokens_total, output_dir)
+
+
+def evaluate_variants(
+    config: EventVLMConfig,
+    variants: Dict[str, str],
+    output_dirs: Optional[Dict[str, str]] = None,
+    quick: bool = False,
+    max_videos: Optional[int] = None,
+    resume: bool = True,
+    model=None
+) -> Dict[str, Dict[str, float]]:
+    """
+    Evaluate several prompt strategies in one pass over the dataset.
+    
+    Stage 1 and the visual encoding run once per frame and every variant
+    is captioned from the same detections. Each variant's results (and
+    journal) are those of evaluate() with its prompt strategy.
+    
+    Args:
+        config: Configuration object (vlm.prompt_strategy is overridden)
+        variants: Variant name to prompt strategy
+        output_dirs: Variant name to output directory
+        quick: Quick mode with fewer samples
+        max_videos: Maximum videos to evaluate
+        resume: Skip videos already in every variant's journal
+        model: Loaded pipeline to reuse (see pipeline_key)
+        
+    Returns:
+        Variant name to dict of metric name to value
+    """
+    set_global_seed(config.seed)
+    logger.info(f"Using evaluation seed: {config.seed}")
+    
+    output_dirs = output_dirs or {}
+    dataset = select_videos(config, quick, max_videos)
+    logger.info(f"Evaluating {list(variants)} on {len(dataset)} videos")
+    tokens_total = (config.data.image_size // 14) ** 2
+    
+    records: Dict[str, Dict[int, Dict[str, Any]]] = {name: {} for name in variants}
+    journals: Dict[str, EvaluationJournal] = {}
+    for name, strategy in variants.items():
+        if not output_dirs.get(name):
+            continue
+        variant_config = OmegaConf.to_object(OmegaConf.structured(config))
+        variant_config.vlm.prompt_strategy = strategy
+        journals[name] = EvaluationJournal(
+            output_dirs[name], run_identity(variant_config, quick, dataset), resume=resume
+        )
+        for idx, video_info in enumerate(dataset):
+            if video_info["id"] in journals[name].records:
+                records[name][idx] = journals[name].records[video_info["id"]]
+    
+    tasks = [
+        (idx, video_info) for idx, video_info in enumerate(dataset)
+        if any(idx not in records[name] for name in variants)
+    ]
+    if tasks:
+        model = _prepare_pipeline(config, model)
+    
+    strategies = sorted(set(variants.values()))
+    for idx, video_info in tqdm(tasks, desc="Evaluating"):
+        try:
+            set_global_seed(config.seed + idx)
+            results = model.process_video_variants(
+                video_path=video_info["path"],
+                prompt_strategies=strategies,
+                frame_rate=config.data.frame_rate,
+                max_frames=config.data.max_frames if not quick else 50
+            )
+            variant_records = {
+                name: video_record(results[strategy], video_info) for name, strategy in variants.items()
+            }
+        except Exception as e:
+            logger.error(f"Error processing {video_info['id']}: {e}")
+            variant_records = {name: {"error": f"{type(e).__name__}: {e}"} for name in variants}
+        
+        for name, record in variant_records.items():
+            if idx in records[name]:
+                continue
+            records[name][idx] = record
+            if name in journals:
+                journals[name].append(video_info["id"], record)
+    
+    return {
+        name: _finish_run(records[name], dataset, tokens_total, output_dirs.get(name))
+        for name in variants
+    }
+
+
+def _prepare_pipeline(config: EventVLMConfig, model=None):
+    """Build a pipeline, or start a new run on a loaded one."""
+    if model is None:
+        logger.info("Initializing Event-VLM...")
+        return build_pipeline(config)
+    model.reset(config)
+    return model
+
+
+def _finish_run(
+    records: Dict[int, Dict[str, Any]],
+    dataset: List[Dict[str, Any]],
+    tokens_total: int,
+    output_dir: Optional[str]
+) -> Dict[str, float]:
+    """Merge per-video records in dataset order, then log and save the results."""
+    # Merge in dataset order so metrics do not depend on scheduling
+    finished = [records[idx] for idx in sorted(records) if "error" not in records[idx]]
+    failed = [
+        {"id": dataset[idx]["id"], "error": records[idx]["error"]}
+        for idx in sorted(records) if "error" in records[idx]
+    ]
+    predictions = [record["prediction"] for record in finished]
+    metrics = merge_video_records(finished, tokens_total)
+    metrics["videos_evaluated"] = len(finished)
+    metrics["videos_failed"] = len(failed)
+    
     # Log results
     logger.info("=" * 50)
     logger.info("Evaluation Results")
@@ -250,7 +652,7 @@ def evaluate(
         output_dir.mkdir(parents=True, exist_ok=True)
         
         with open(output_dir / "metrics.json", "w") as f:
-            json.dump(metrics, f, indent=2)
+            json.dump({**metrics, "failed_videos": failed}, f, indent=2)
         
         with open(output_dir / "predictions.json", "w") as f:
             json.dump(predictions, f, indent=2)
@@ -260,6 +662,48 @@ def evaluate(
     return metrics
 
 
+def _evaluate_parallel(
+    config: EventVLMConfig,
+    tasks: List[Tuple[int, Dict]],
+    quick: bool,
+    num_workers: int,
+    devices: Optional[List[str]],
+    gpu_memory_fraction: float,
+    on_record: Callable[[int, Dict[str, Any]], None]
+) -> None:
+    """
+    Evaluate videos in worker processes, longest first.
+    
+    on_record(dataset index, record) is called in the parent as each
+    video finishes.
+    """
+    import multiprocessing
+    
+    num_workers = min(num_workers, len(tasks))
+    devices = devices or [config.device]
+    
+    # Longest videos first so no worker is left with a long tail
+    frame_counts = {idx: video_frame_count(info["path"]) for idx, info in tasks}
+    tasks = sorted(tasks, key=lambda task: -frame_counts[task[0]])
+    
+    # spawn: CUDA cannot be re-initialized in forked children
+    context = multiprocessing.get_context("spawn")
+    device_slots = context.Queue()
+    for worker in range(num_workers):
+        device_slots.put(devices[worker % len(devices)])
+    
+    logger.info(f"Evaluating with {num_workers} workers on {sorted(set(devices))}")
+    with context.Pool(
+        num_workers,
+        initializer=_init_worker,
+        initargs=(config, device_slots, quick, gpu_memory_fraction)
+    ) as pool:
+        for idx, record in tqdm(
+            pool.imap_unordered(_evaluate_in_worker, tasks), total=len(tasks), desc="Evaluating"
+        ):
+            on_record(idx, record)
+
+
 def main():
     parser = argparse.ArgumentParser(description="Evaluate Event-VLM")
     parser.add_argument(
@@ -304,6 +748,35 @@ def main():
         default=None,
         help="Override random seed for reproducible evaluation"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Worker processes, each owning one pipeline (1 = serial)"
+    )
+    parser.add_argument(
+        "--devices",
+        type=str,
+        default=None,
+        help="Comma-separated worker devices, assigned round-robin (default: --device)"
+    )
+    parser.add_argument(
+        "--gpu-memory-fraction",
+        type=float,
+        default=0.0,
+        help="Per-worker GPU memory fraction when workers share a GPU (0 = no limit)"
+    )
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="Start a new journal instead of skipping videos already evaluated"
+    )
+    parser.add_argument(
+        "--server",
+        type=str,
+        default=None,
+        help="Use a persistent model server (unix:///path or tcp://127.0.0.1:PORT)"
+    )
     
     args = parser.parse_args()
     
@@ -316,13 +789,19 @@ def main():
     config.device = args.device
     if args.seed is not None:
         config.seed = args.seed
+    if args.server:
+        config.server = args.server
     
     # Run evaluation
     metrics = evaluate(
         config=config,
         output_dir=args.output_dir,
         quick=args.quick,
-        max_videos=args.max_videos
+        max_videos=args.max_videos,
+        num_workers=args.workers,
+        devices=[d.strip() for d in args.devices.split(",") if d.strip()] if args.devices else None,
+        gpu_memory_fraction=args.gpu_memory_fraction,
+        resume=not args.no_resume
     )
     
     print(f"\nFinal AUC: {metrics.get('auc', 0):.4f}")
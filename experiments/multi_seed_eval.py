@@ -84,6 +84,12 @@ def write_markdown_report(
     lines.append(f"- Variants: {summary_payload['meta']['variants']}")
     lines.append(f"- Detector: {summary_payload['meta']['detector']}")
     lines.append(f"- Device: {summary_payload['meta']['device']}")
+    reused = [run for run in summary_payload["runs"] if run.get("reused")]
+    if reused:
+        lines.append(
+            f"- Reused cached runs: {len(reused)} of {len(summary_payload['runs'])} "
+            "(identical config, code and data; seed-invariant under greedy decoding)"
+        )
     lines.append("")
 
     for dataset, variant_dict in summary_payload["summary"].items():
@@ -153,14 +159,45 @@ def main() -> None:
         default=None,
         help="Maximum videos to evaluate"
     )
+    parser.add_argument(
+        "--feature-cache-dir",
+        type=str,
+        default=None,
+        help="Share vision features across variants/seeds via a disk feature cache"
+    )
+    parser.add_argument(
+        "--run-cache",
+        type=str,
+        default="outputs/run_cache",
+        help="Content-addressed cache of finished runs, reused for identical runs"
+    )
+    parser.add_argument(
+        "--no-run-cache",
+        action="store_true",
+        help="Run every (config, variant, seed) even if an identical run is cached"
+    )
+    parser.add_argument(
+        "--server",
+        type=str,
+        default=None,
+        help="Persistent model server address (unix:///path or tcp://127.0.0.1:PORT)"
+    )
     args = parser.parse_args()
 
     # Lazy import so `--help` works even before heavy ML deps are installed.
     from src.config import load_config
-    from experiments.evaluate import evaluate
+    from omegaconf import OmegaConf
+    from experiments.evaluate import build_pipeline, evaluate_variants, pipeline_key
+    from experiments.run_cache import MARKER_FILE, RunCache, numeric_metrics, run_key
 
     seeds = [int(seed) for seed in parse_csv(args.seeds)]
     variants = parse_csv(args.variants)
+    for variant in variants:
+        if variant not in PROMPT_STRATEGY_MAP:
+            raise ValueError(
+                f"Unknown variant '{variant}'. "
+                f"Supported: {sorted(PROMPT_STRATEGY_MAP.keys())}"
+            )
     output_root = Path(args.output_dir)
     output_root.mkdir(parents=True, exist_ok=True)
 
@@ -172,51 +209,94 @@ def main() -> None:
             "device": args.device,
             "quick": args.quick,
             "max_videos": args.max_videos,
+            "feature_cache_dir": args.feature_cache_dir,
+            "server": args.server,
+            "run_cache": None if args.no_run_cache else args.run_cache,
         },
         "runs": [],
         "summary": {},
     }
 
+    # Runs differ only in seed and prompt strategy: load each detector/VLM
+    # pair once, and caption all variants in one pass over each video
+    pipelines: Dict[str, Any] = {}
+    cache = None if args.no_run_cache else RunCache(args.run_cache)
+
     for config_path in args.configs:
         dataset_name = Path(config_path).stem
-        summary_payload["summary"][dataset_name] = {}
-
-        for variant in variants:
-            if variant not in PROMPT_STRATEGY_MAP:
-                raise ValueError(
-                    f"Unknown variant '{variant}'. "
-                    f"Supported: {sorted(PROMPT_STRATEGY_MAP.keys())}"
-                )
-
-            variant_runs = []
-            for seed in seeds:
-                config = load_config(config_path)
-                config.device = args.device
-                config.seed = seed
-                config.detector.model = args.detector
-                config.vlm.prompt_strategy = PROMPT_STRATEGY_MAP[variant]
-
-                run_dir = output_root / dataset_name / variant / f"seed_{seed}"
-                run_dir.mkdir(parents=True, exist_ok=True)
-
-                metrics = evaluate(
+        variant_runs: Dict[str, List[Dict[str, float]]] = {variant: [] for variant in variants}
+
+        for seed in seeds:
+            config = load_config(config_path)
+            config.device = args.device
+            config.seed = seed
+            config.detector.model = args.detector
+            if args.feature_cache_dir:
+                # Variants differ only in the prompt: reuse encoded frames
+                config.vlm.feature_cache = True
+                config.vlm.feature_cache_dir = args.feature_cache_dir
+            if args.server:
+                config.server = args.server
+
+            run_dirs = {
+                variant: str(output_root / dataset_name / variant / f"seed_{seed}")
+                for variant in variants
+            }
+
+            # Reuse cached identical runs (with greedy decoding, across seeds)
+            results: Dict[str, Dict[str, float]] = {}
+            cache_keys: Dict[str, str] = {}
+            if cache is not None:
+                for variant in variants:
+                    variant_config = OmegaConf.to_object(OmegaConf.structured(config))
+                    variant_config.vlm.prompt_strategy = PROMPT_STRATEGY_MAP[variant]
+                    cache_keys[variant] = run_key(variant_config, args.quick, args.max_videos)
+                    cached = cache.restore(cache_keys[variant], run_dirs[variant])
+                    if cached is not None:
+                        results[variant] = numeric_metrics(cached["metrics"])
+
+            pending = [variant for variant in variants if variant not in results]
+            if pending:
+                key = pipeline_key(config)
+                if key not in pipelines:
+                    pipelines[key] = build_pipeline(config)
+                for variant in pending:
+                    (Path(run_dirs[variant]) / MARKER_FILE).unlink(missing_ok=True)
+
+                results.update(evaluate_variants(
                     config=config,
-                    output_dir=str(run_dir),
+                    variants={variant: PROMPT_STRATEGY_MAP[variant] for variant in pending},
+                    output_dirs={variant: run_dirs[variant] for variant in pending},
                     quick=args.quick,
-                    max_videos=args.max_videos
-                )
-                variant_runs.append(metrics)
+                    max_videos=args.max_videos,
+                    model=pipelines[key]
+                ))
+
+                if cache is not None:
+                    for variant in pending:
+                        cache.store(
+                            cache_keys[variant],
+                            run_dirs[variant],
+                            meta={"dataset": dataset_name, "variant": variant, "seed": seed}
+                        )
+
+            for variant in variants:
+                variant_runs[variant].append(results[variant])
                 summary_payload["runs"].append(
                     {
                         "dataset": dataset_name,
                         "variant": variant,
                         "seed": seed,
-                        "metrics": metrics,
-                        "output_dir": str(run_dir),
+                        "metrics": results[variant],
+                        "output_dir": run_dirs[variant],
+                        "reused": variant not in pending,
+                        "cache_key": cache_keys.get(variant),
                     }
                 )
 
-            summary_payload["summary"][dataset_name][variant] = aggregate_metrics(variant_runs)
+        summary_payload["summary"][dataset_name] = {
+            variant: aggregate_metrics(runs) for variant, runs in variant_runs.items()
+        }
 
     summary_path = output_root / "summary.json"
     summary_path.write_text(json.dumps(summary_payload, indent=2), encoding="utf-8")
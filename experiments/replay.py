@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+Record-once, replay-many evaluation for threshold and pruning sweeps.
+
+`detector.conf_threshold` only filters detections and the pruning
+parameters only change token masks, so one recording pass at the lowest
+threshold of a sweep stores everything evaluate() derives its metrics from.
+Replay then recomputes AUC, trigger metrics, token reduction and modeled
+latency for any threshold/pruning setting without running the detector or
+the VLM.
+
+Recording format (one JSON document):
+
+    {
+      "format": 1,
+      "digest": hash of the config without the replayable fields,
+      "conf_floor": detector threshold of the recording pass,
+      "quick": ..., "max_videos": ...,
+      "visual_tokens": visual tokens per encoded image,
+      "videos": [{
+        "id", "label", "reference_caption",
+        "frames": [{"frame_idx", "detect_time",
+                    "detections": [[x1, y1, x2, y2, class_id, class_name,
+                                    confidence, hazard_level], ...]}],
+        "captions": {mask key: {"caption", "time"}}
+      }]
+    }
+
+A mask key identifies what the VLM saw for an event frame: frame index,
+hazard level, detected classes (the prompt) and a digest of the token
+mask. Captions are recorded for every distinct mask of the recording's
+`caption_settings`; replay omits caption metrics when a video's caption
+comes from a mask that was not recorded.
+
+Replay assumes detection confidences do not depend on the threshold, as
+for real detectors (the mock detector draws confidences above it).
+"""
+
+import hashlib
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from omegaconf import OmegaConf
+
+# Add project root to path
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.config import EventVLMConfig
+from src.detector.detr_wrapper import BaseDetector, Detection, DetectionResult
+from experiments.evaluate import build_pipeline, merge_video_records, select_videos, set_global_seed
+
+logger = logging.getLogger(__name__)
+
+REPLAY_FORMAT = 1
+
+# Fields replay can vary; every other config field must match the recording.
+# The risk weights only enter detector training, never evaluate().
+REPLAYABLE_FIELDS = (
+    ("detector", "conf_threshold"),
+    ("detector", "risk_weights"),
+    ("pruning", "alpha_base"),
+    ("pruning", "beta"),
+    ("pruning", "min_tokens"),
+)
+
+
+def replay_digest(config: EventVLMConfig) -> str:
+    """Hash of the configuration without the replayable fields and server address."""
+    conf = OmegaConf.to_container(OmegaConf.structured(config), resolve=True)
+    conf.pop("server", None)
+    for section, key in REPLAYABLE_FIELDS:
+        conf[section].pop(key, None)
+    return hashlib.sha256(json.dumps(conf, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def _make_pruner(config: EventVLMConfig):
+    """Token pruner of a configuration, as built by EventVLM.initialize."""
+    from src.pruning.token_pruner import TokenPruner
+
+    return TokenPruner(
+        image_size=config.data.image_size,
+        patch_size=14,
+        alpha_base=config.pruning.alpha_base,
+        beta=config.pruning.beta,
+        min_tokens=config.pruning.min_tokens,
+        preserve_cls_token=config.pruning.preserve_cls_token,
+        shape_variance=config.pruning.shape_variance,
+        num_summary_tokens=config.pruning.num_summary_tokens,
+        summary_pooling=config.pruning.summary_pooling
+    )
+
+
+def _encode_detection(det: Detection) -> list:
+    return [*map(float, det.bbox), det.class_id, det.class_name, float(det.confidence), det.hazard_level]
+
+
+def _decode_detection(item: list) -> Detection:
+    return Detection(
+        bbox=tuple(item[:4]),
+        class_id=item[4],
+        class_name=item[5],
+        confidence=item[6],
+        hazard_level=item[7]
+    )
+
+
+class _FrameView:
+    """A recorded frame under one threshold/pruning setting."""
+
+    def __init__(self, frame_idx: int, detections: List[Detection], threshold: float):
+        self.detections = [d for d in detections if d.confidence >= threshold]
+        self.is_event, self.hazard_level, self.trigger_confidence = BaseDetector.should_trigger(self.detections)
+        self.classes = [d.class_name for d in self.detections]
+        self.frame_idx = frame_idx
+
+    def mask(self, config: EventVLMConfig, pruner) -> Optional[Any]:
+        """Token keep mask of the frame (None without pruning)."""
+        return pruner.keep_mask(self.detections) if config.pruning.enabled else None
+
+    def key(self, mask) -> str:
+        """Caption key: what the VLM saw for this frame."""
+        digest = (
+            hashlib.sha1(mask.numpy().tobytes()).hexdigest()[:16] if mask is not None else "full"
+        )
+        return f"{self.frame_idx}:{self.hazard_level}:{','.join(self.classes)}:{digest}"
+
+    def tokens_used(self, config: EventVLMConfig, pruner, mask, tokens_total: int) -> int:
+        """Visual tokens passed to the VLM, as counted by EventVLM._encode_and_prune."""
+        if mask is None:
+            return tokens_total
+        used = int(mask.sum())
+        if pruner.num_summary_tokens > 0 and not bool(mask.all()):
+            used += pruner.num_summary_tokens
+        return used
+
+
+class Recording:
+    """Raw detections and per-mask captions of one evaluation pass."""
+
+    def __init__(self, payload: Dict[str, Any]):
+        if payload.get("format") != REPLAY_FORMAT:
+            raise ValueError(f"Unsupported recording format: {payload.get('format')}")
+        self.payload = payload
+        self.digest = payload["digest"]
+        self.conf_floor = payload["conf_floor"]
+        self.quick = payload["quick"]
+        self.max_videos = payload["max_videos"]
+        self.visual_tokens = payload["visual_tokens"]
+        self.videos = payload["videos"]
+
+    @classmethod
+    def record(
+        cls,
+        config: EventVLMConfig,
+        quick: bool = False,
+        max_videos: Optional[int] = None,
+        conf_floor: Optional[float] = None,
+        caption_settings: Optional[List[Dict[str, float]]] = None
+    ) -> "Recording":
+        """
+        Run the pipeline once and record what replay needs.
+
+        Args:
+            config: Base configuration
+            quick: Quick mode, as passed to evaluate()
+            max_videos: Maximum videos, as passed to evaluate()
+            conf_floor: Detector threshold of the pass, the lowest a replay
+                can use (default: config.detector.conf_threshold)
+            caption_settings: Threshold/pruning overrides (keys
+                conf_threshold, alpha_base, beta, min_tokens) whose masks
+                are captioned; the base setting is always captioned
+
+        Returns:
+            Recording
+        """
+        if config.vlm.incremental_encoding:
+            raise ValueError("Recording needs stateless encoding; disable vlm.incremental_encoding")
+
+        config = OmegaConf.to_object(OmegaConf.structured(config))
+        floor = config.detector.conf_threshold if conf_floor is None else conf_floor
+        settings = [config] + [_override(config, s) for s in caption_settings or []]
+        pruners = [_make_pruner(setting) for setting in settings]
+
+        record_config = _override(config, {"conf_threshold": floor})
+        set_global_seed(config.seed)
+        model = build_pipeline(record_config)
+        model.initialize()
+        if model.anyres:
+            raise ValueError("Replay does not support anyres (tiled) VLMs")
+
+        videos, visual_tokens = [], [pruners[0].num_patches]
+        for idx, video_info in enumerate(select_videos(config, quick, max_videos)):
+            # Seeded per video, as evaluate() does
+            set_global_seed(config.seed + idx)
+            videos.append(_record_video(model, video_info, config, quick, settings, pruners, visual_tokens))
+
+        return cls({
+            "format": REPLAY_FORMAT,
+            "digest": replay_digest(config),
+            "conf_floor": floor,
+            "quick": quick,
+            "max_videos": max_videos,
+            "visual_tokens": visual_tokens[-1],
+            "videos": videos
+        })
+
+    def can_replay(self, config: EventVLMConfig, quick: bool = False, max_videos: Optional[int] = None) -> bool:
+        """Whether replay reproduces evaluate(config, quick=quick, max_videos=max_videos)."""
+        return (
+            replay_digest(config) == self.digest
+            and config.detector.conf_threshold >= self.conf_floor
+            and quick == self.quick
+            and max_videos == self.max_videos
+        )
+
+    def replay(self, config: EventVLMConfig) -> Dict[str, float]:
+        """
+        Recompute evaluate() metrics for a threshold/pruning setting.
+
+        fps comes from the recorded detection and captioning times (the
+        latency a live run would model), and caption metrics are omitted
+        unless every video's caption was recorded.
+
+        Args:
+            config: Configuration accepted by can_replay
+
+        Returns:
+            Dict of metric name to value
+        """
+        pruner = _make_pruner(config)
+        tokens_total = (config.data.image_size // 14) ** 2
+        records, captions_known = [], True
+
+        for video in self.videos:
+            record, known = self._replay_video(video, config, pruner)
+            records.append(record)
+            captions_known = captions_known and known
+
+        if not captions_known:
+            for record in records:
+                record["prediction"]["caption"] = ""
+
+        return merge_video_records(records, tokens_total)
+
+    def _replay_video(self, video: Dict[str, Any], config: EventVLMConfig, pruner) -> Tuple[Dict[str, Any], bool]:
+        captions = video["captions"]
+        mean_caption_time = (
+            float(np.mean([c["time"] for c in captions.values()])) if captions else 0.0
+        )
+
+        score, total_time, caption, known = 0.0, 0.0, "", True
+        tokens_used, triggered = [], False
+        for frame in video["frames"]:
+            total_time += frame["detect_time"]
+            view = _FrameView(
+                frame["frame_idx"], [_decode_detection(d) for d in frame["detections"]],
+                config.detector.conf_threshold
+            )
+            if not view.is_event:
+                continue
+
+            triggered = True
+            score = max(score, max(d.confidence for d in view.detections))
+            mask = view.mask(config, pruner)
+            tokens_used.append(view.tokens_used(config, pruner, mask, self.visual_tokens))
+
+            entry = captions.get(view.key(mask))
+            total_time += entry["time"] if entry else mean_caption_time
+            # The video caption is the last non-empty frame caption
+            if entry is None:
+                known = False
+            elif entry["caption"]:
+                caption, known = entry["caption"], True
+
+        processed = len(video["frames"])
+        prediction = {
+            "id": video["id"],
+            "score": score,
+            "triggered": triggered,
+            "caption": caption,
+            "reference_caption": video["reference_caption"],
+            "label": video["label"],
+            "fps": processed / max(total_time, 1e-6)
+        }
+        record = {
+            "prediction": prediction,
+            "tokens_used": tokens_used,
+            "event_frames": len(tokens_used),
+            "processed_frames": processed,
+            "total_time": total_time
+        }
+        return record, known
+
+    def save(self, path: str) -> None:
+        """Write the recording as JSON."""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.payload, f)
+
+    @classmethod
+    def load(cls, path: str) -> "Recording":
+        """Read a recording written by save()."""
+        with open(path) as f:
+            return cls(json.load(f))
+
+
+def _override(config: EventVLMConfig, setting: Dict[str, float]) -> EventVLMConfig:
+    """Copy of a config with threshold/pruning overrides."""
+    config = OmegaConf.to_object(OmegaConf.structured(config))
+    for key, value in setting.items():
+        if key == "conf_threshold":
+            config.detector.conf_threshold = value
+        elif key in ("alpha_base", "beta", "min_tokens"):
+            setattr(config.pruning, key, value)
+        else:
+            raise ValueError(f"Not a replayable setting: {key}")
+    return config
+
+
+def _record_video(
+    model,
+    video_info: Dict[str, Any],
+    config: EventVLMConfig,
+    quick: bool,
+    settings: List[EventVLMConfig],
+    pruners: list,
+    visual_tokens: List[int]
+) -> Dict[str, Any]:
+    """
+    Record one video, sampling frames as EventVLM.process_video does.
+
+    Visual token counts of the encoded frames are appended to visual_tokens.
+    """
+    import cv2
+
+    from src.pipeline.event_vlm import FrameResult
+
+    cap = cv2.VideoCapture(video_info["path"])
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video: {video_info['path']}")
+
+    video_fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_interval = max(1, int(video_fps / config.data.frame_rate))
+    max_frames = config.data.max_frames if not quick else 50
+
+    frames, captions = [], {}
+    frame_idx = 0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if frame_idx % frame_interval != 0:
+            frame_idx += 1
+            continue
+
+        start = time.time()
+        detection_result = model.detector.detect(frame)
+        entry = {
+            "frame_idx": frame_idx,
+            "detect_time": time.time() - start,
+            "detections": [_encode_detection(d) for d in detection_result.detections]
+        }
+
+        for setting, pruner in zip(settings, pruners):
+            view = _FrameView(frame_idx, detection_result.detections, setting.detector.conf_threshold)
+            if not view.is_event:
+                continue
+            key = view.key(view.mask(setting, pruner))
+            if key in captions:
+                continue
+
+            start = time.time()
+            model.pruner = pruner
+            result = FrameResult(frame_idx, frame_idx / video_fps, True, view.detections, view.hazard_level)
+            image, pruned_tokens = model._encode_and_prune(
+                frame,
+                DetectionResult(view.detections, True, view.hazard_level, view.trigger_confidence),
+                result,
+                video_info["path"]
+            )
+            prompt, prompt_suffix = model.build_prompt(view.hazard_level, view.classes)
+            output = model.vlm.generate(
+                image=image,
+                prompt=prompt,
+                pruned_tokens=pruned_tokens,
+                prompt_suffix=prompt_suffix,
+                hazard_level=view.hazard_level
+            )
+            captions[key] = {"caption": output.caption, "time": time.time() - start}
+            if not (config.pruning.enabled and config.vlm.input_pruning):
+                visual_tokens.append(result.tokens_total)
+
+        frames.append(entry)
+        if max_frames and len(frames) >= max_frames:
+            break
+        frame_idx += 1
+
+    cap.release()
+    return {
+        "id": video_info["id"],
+        "label": int(video_info.get("label", 0)),
+        "reference_caption": video_info.get("caption", ""),
+        "frames": frames,
+        "captions": captions
+    }
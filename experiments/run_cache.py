@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Content-addressed cache of evaluation runs.
+
+A run is keyed by the hash of its normalized configuration, the evaluation
+code and the dataset manifest, so drivers (multi_seed_eval.py, the CERA
+ablation runner) can reuse the metrics and predictions of an identical
+earlier run instead of spending GPU hours on it again.
+
+evaluate()'s resume journal records the same code and dataset digests, so
+after a code change a cache miss re-runs its videos instead of replaying
+(and then caching) journal records of the old code.
+
+With greedy decoding (`vlm.do_sample: false`) nothing in evaluate()
+depends on the seed: the detector, pruning and decoding are deterministic
+and the mock components use `mock.seed`. The seed is then dropped from the
+key, so the seeds of a multi-seed sweep share one run.
+
+Layout: <root>/<key[:2]>/<key>/{metrics.json, predictions.json, meta.json}
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from omegaconf import OmegaConf
+
+# Add project root to path
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.config import EventVLMConfig
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).parent.parent
+
+# Code whose changes can change evaluation outputs
+CODE_PATHS = ("src", "experiments/evaluate.py")
+
+# Written into a run directory whose results came from the cache
+MARKER_FILE = "run_cache.json"
+
+
+def seed_invariant(config: EventVLMConfig) -> bool:
+    """Whether evaluate() results cannot depend on config.seed."""
+    return not config.vlm.do_sample
+
+
+def normalized_config(config: EventVLMConfig) -> Dict[str, Any]:
+    """
+    Configuration fields that can change evaluation outputs.
+
+    Drops the model server address and cache locations, and the seed when
+    seed_invariant(config).
+    """
+    conf = OmegaConf.to_container(OmegaConf.structured(config), resolve=True)
+    conf.pop("server", None)
+    conf["vlm"].pop("feature_cache_dir", None)
+    if seed_invariant(config):
+        conf.pop("seed", None)
+    return conf
+
+
+@lru_cache(maxsize=None)
+def code_digest(root: str = str(PROJECT_ROOT)) -> str:
+    """Hash of the evaluation code (CODE_PATHS under root)."""
+    digest = hashlib.sha256()
+    for entry in CODE_PATHS:
+        path = Path(root) / entry
+        files = sorted(path.rglob("*.py")) if path.is_dir() else [path]
+        for file in files:
+            digest.update(str(file.relative_to(root)).encode("utf-8"))
+            digest.update(file.read_bytes())
+    return digest.hexdigest()
+
+
+def manifest_digest(config: EventVLMConfig, quick: bool = False, max_videos: Optional[int] = None) -> str:
+    """
+    Hash of the videos an evaluation covers.
+
+    Covers each selected video's id, label, reference caption, size and
+    modification time, so edited annotations or re-encoded videos miss.
+    """
+    from experiments.evaluate import select_videos
+
+    return videos_digest(select_videos(config, quick, max_videos))
+
+
+def videos_digest(videos: List[Dict[str, Any]]) -> str:
+    """manifest_digest of already selected dataset entries."""
+    manifest = []
+    for video in videos:
+        stat = os.stat(video["path"])
+        manifest.append({
+            "id": video["id"],
+            "label": video["label"],
+            "caption": video["caption"],
+            "anomaly_frames": video.get("anomaly_frames", []),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns
+        })
+    return hashlib.sha256(json.dumps(manifest, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def run_key(config: EventVLMConfig, quick: bool = False, max_videos: Optional[int] = None) -> str:
+    """Content address of an evaluate(config, quick=quick, max_videos=max_videos) run."""
+    payload = {
+        "config": normalized_config(config),
+        "code": code_digest(),
+        "data": manifest_digest(config, quick, max_videos),
+        "quick": quick,
+        "max_videos": max_videos
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class RunCache:
+    """Directory of finished runs' metrics and predictions, keyed by run_key."""
+
+    def __init__(self, root: str):
+        """
+        Args:
+            root: Cache directory (created on first store)
+        """
+        self.root = Path(root)
+
+    def _entry(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Cached {"metrics", "predictions", "meta"} of a run, or None."""
+        entry = self._entry(key)
+        if not (entry / "meta.json").exists():
+            return None
+        return {
+            name: json.loads((entry / f"{name}.json").read_text())
+            for name in ("metrics", "predictions", "meta")
+        }
+
+    def store(self, key: str, run_dir: str, meta: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        Cache a finished run from the metrics.json/predictions.json it wrote.
+
+        Runs with failed videos are not cached.
+
+        Args:
+            key: run_key of the run
+            run_dir: Output directory of evaluate()
+            meta: Provenance recorded with the entry (e.g. seed, variant)
+
+        Returns:
+            Whether the run was cached
+        """
+        run_dir = Path(run_dir)
+        metrics = json.loads((run_dir / "metrics.json").read_text())
+        if metrics.get("failed_videos"):
+            logger.warning(f"Not caching {run_dir}: {len(metrics['failed_videos'])} videos failed")
+            return False
+
+        entry = self._entry(key)
+        if entry.exists():
+            return True
+        entry.parent.mkdir(parents=True, exist_ok=True)
+
+        # Write to a temporary directory, then rename into place
+        staging = Path(tempfile.mkdtemp(dir=entry.parent, prefix=f".{key[:8]}-"))
+        shutil.copy(run_dir / "metrics.json", staging / "metrics.json")
+        shutil.copy(run_dir / "predictions.json", staging / "predictions.json")
+        (staging / "meta.json").write_text(json.dumps({**(meta or {}), "run_dir": str(run_dir)}, indent=2))
+        try:
+            staging.rename(entry)
+        except OSError:
+            # Another process stored the same run first
+            shutil.rmtree(staging, ignore_errors=True)
+        return True
+
+    def restore(self, key: str, run_dir: str) -> Optional[Dict[str, Any]]:
+        """
+        Write a cached run's results into run_dir, marked as reused.
+
+        Returns:
+            The cached entry, or None on a cache miss
+        """
+        cached = self.get(key)
+        if cached is None:
+            return None
+
+        run_dir = Path(run_dir)
+        run_dir.mkdir(parents=True, exist_ok=True)
+        (run_dir / "metrics.json").write_text(json.dumps(cached["metrics"], indent=2))
+        (run_dir / "predictions.json").write_text(json.dumps(cached["predictions"], indent=2))
+        (run_dir / MARKER_FILE).write_text(
+            json.dumps({"cache_key": key, "reused_from": cached["meta"]}, indent=2)
+        )
+        logger.info(f"Reused cached run {key[:12]} from {cached['meta'].get('run_dir')}")
+        return cached
+
+
+def numeric_metrics(metrics: Dict[str, Any]) -> Dict[str, float]:
+    """Metrics as returned by evaluate() (drops the failed-video list of metrics.json)."""
+    return {key: value for key, value in metrics.items() if isinstance(value, (int, float))}
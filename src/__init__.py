@@ -2,13 +2,14 @@
 Event-VLM: Scalable Vision-Language Models for Real-Time Industrial Surveillance
 """
 
+from src.utils.lazy import lazy_getattr
+
 __version__ = "0.1.0"
-__all__ = ["EventVLM"]
 
+# Imported on first attribute access to avoid a hard dependency at package import time
+_LAZY_IMPORTS = {
+    "EventVLM": "src.pipeline.event_vlm",
+}
 
-def __getattr__(name):
-    """Lazy import heavy modules to avoid hard dependency at package import time."""
-    if name == "EventVLM":
-        from src.pipeline.event_vlm import EventVLM
-        return EventVLM
-    raise AttributeError(f"module 'src' has no attribute '{name}'")
+__all__ = list(_LAZY_IMPORTS)
+__getattr__ = lazy_getattr(__name__, globals(), _LAZY_IMPORTS)
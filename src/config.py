@@ -42,6 +42,10 @@ class PruningConfig:
     min_tokens: int = 64         # Minimum tokens to preserve
     preserve_cls_token: bool = True
     
+    # Background summary tokens pooled from pruned patches (0 disables)
+    num_summary_tokens: int = 0
+    summary_pooling: str = "spatial"  # spatial; attention only via TokenPruner.prune(attention_scores=...)
+    
     # Intraclass shape variance (precomputed from training data)
     shape_variance: Dict[str, float] = field(default_factory=lambda: {
         "fire": 0.42,
@@ -57,11 +61,70 @@ class PruningConfig:
 class VLMConfig:
     """Configuration for Stage 3: VLM with Hazard-Priority Prompting."""
     model: str = "llava-1.5-7b"
-    quantization: str = "4bit"  # 4bit, 8bit, none
+    quantization: str = "4bit"  # 4bit, 8bit, none (weight-only int4/int8 on CPU)
     max_new_tokens: int = 256
     temperature: float = 0.2
     do_sample: bool = False
     
+    # Incremental encoding: reuse cached features of unchanged frames per stream
+    incremental_encoding: bool = False
+    incremental_pixel_threshold: float = 0.1  # Mean patch delta counted as change
+    incremental_refresh_ratio: float = 0.1    # Changed background fraction forcing a full encode (any change inside the pruning mask always does)
+    incremental_validate_every: int = 0       # Approximation-error check period (0 = off)
+    incremental_recompute_changed: bool = True  # Re-encode changed background patches on reuse
+    
+    # Input-level pruning: encode only kept patches in the vision tower
+    input_pruning: bool = False
+    input_pruning_layer: int = 0          # ViT layers run on all patches before dropping
+    input_pruning_compare_every: int = 0  # Quality check vs full encode period (0 = off)
+    
+    # Prefix KV-cache for the image-independent prompt templates
+    prefix_cache: bool = False
+    prefix_cache_size: int = 8
+    prompt_token_cache_size: int = 256  # Memoized prompt tokenizations (0 = off)
+    
+    # Continuous batching: events join/leave the decode batch per token
+    continuous_batching: bool = False
+    max_batch_size: int = 8
+    kv_block_size: int = 16     # Tokens per KV block
+    kv_num_blocks: int = 512    # KV blocks in the engine pool
+    
+    # Decode budgets: max new tokens per hazard level (max_new_tokens otherwise),
+    # e.g. {"critical": 256, "high": 160, "standard": 96}
+    token_budgets: Dict[str, int] = field(default_factory=dict)
+    # Early stopping (off by default): numbered fields filled, section
+    # terminator (e.g. ["USER:", "###"]), or repetition
+    structured_stop: bool = False
+    stop_sequences: List[str] = field(default_factory=list)
+    repetition_ngram: int = 0   # 0 = off
+    repetition_max: int = 3
+    
+    # Tensor-native preprocessing: resize/crop/normalize frames as torch ops
+    tensor_preprocess: bool = False
+    
+    # Visual feature cache keyed by preprocessed-image hash + vision tower
+    feature_cache: bool = False
+    feature_cache_size: int = 64              # In-memory LRU entries
+    feature_cache_dir: Optional[str] = None   # fp16 memmap disk tier (None = off)
+    feature_cache_disk_entries: int = 4096
+    
+    # KV-cache policy for single-caption decoding (batched paths stay dense)
+    kv_policy: str = "dense"         # dense, visual_topk, sink_window
+    kv_int8: bool = False            # Simulate int8 KV precision (accuracy only: the cache stays in the model dtype)
+    kv_visual_keep_ratio: float = 0.25
+    kv_sink_tokens: int = 4
+    kv_window: int = 256
+    
+    # Speculative decoding of greedy captions (identical outputs)
+    speculative: str = "off"             # off, draft, prompt_lookup
+    draft_model: Optional[str] = None    # Draft LM sharing the VLM tokenizer
+    num_draft_tokens: int = 4
+    prompt_lookup_ngram: int = 3
+    
+    # CPU inference (device "cpu"): thread count and int4 scale group size
+    cpu_threads: int = 0        # 0 = PyTorch default
+    quant_group_size: int = 64  # 32, 64, 128 or 256 for the int4 kernel
+    
     # Prompt configuration
     prompt_strategy: str = "hazard_priority"  # hazard_priority, standard
     prompt_bank: Dict[str, str] = field(default_factory=lambda: {
@@ -142,6 +205,41 @@ class AutoTuneConfig:
     objective_weights: List[float] = field(default_factory=lambda: [1.0, 0.5])
 
 
+@dataclass
+class MockConfig:
+    """Synthetic components used when detector.model / vlm.model is "mock"."""
+    seed: int = 0
+    
+    # Detector: bursty events with random boxes
+    event_rate: float = 0.1          # Fraction of event frames
+    mean_event_length: float = 5.0   # Mean consecutive event frames
+    max_boxes: int = 3
+    box_scale: List[float] = field(default_factory=lambda: [0.05, 0.3])
+    class_weights: Optional[Dict[str, float]] = None  # None = uniform over hazard classes
+    
+    # Latency model (seconds; 0 = no waiting)
+    detect_latency: float = 0.0             # Per frame
+    encode_latency: float = 0.0             # Vision encoding per image
+    prefill_latency_per_token: float = 0.0
+    decode_latency_per_token: float = 0.0
+    latency_jitter: float = 0.0             # Relative std of log-normal noise
+    
+    # VLM: generated tokens per caption (capped by the token budget)
+    caption_tokens: List[int] = field(default_factory=lambda: [24, 96])
+
+
+@dataclass
+class DedupConfig:
+    """Near-duplicate caption suppression in stream_video."""
+    enabled: bool = False
+    mode: str = "collapse"      # collapse (clear caption, keep frame), suppress (drop frame)
+    threshold: float = 0.8      # Estimated Jaccard similarity counted as duplicate
+    window: int = 16            # Recently emitted captions compared per stream
+    max_age: float = 0.0        # Max age (s) of compared captions (0 = no limit)
+    num_perm: int = 64          # MinHash functions
+    shingle_size: int = 3       # Words per shingle
+
+
 @dataclass
 class EventVLMConfig:
     """Main configuration for Event-VLM."""
@@ -151,18 +249,42 @@ class EventVLMConfig:
     data: DataConfig = field(default_factory=DataConfig)
     training: TrainingConfig = field(default_factory=TrainingConfig)
     auto_tune: AutoTuneConfig = field(default_factory=AutoTuneConfig)
+    mock: MockConfig = field(default_factory=MockConfig)
+    dedup: DedupConfig = field(default_factory=DedupConfig)
     
     # Device configuration
     device: str = "cuda"
     seed: int = 42
+    
+    # Persistent model server (unix:///path or tcp://127.0.0.1:port); when
+    # set, the detector and VLM run in the server instead of being loaded
+    server: Optional[str] = None
+
+
+def validate_config(config: EventVLMConfig) -> None:
+    """
+    Reject settings the pipeline cannot honour.
+    
+    Raises:
+        ValueError: If summary tokens use attention pooling; no vision
+            tower in the pipeline returns per-patch attention scores
+    """
+    pruning = config.pruning
+    if pruning.num_summary_tokens > 0 and pruning.summary_pooling == "attention":
+        raise ValueError(
+            "pruning.summary_pooling 'attention' is not supported by the pipeline "
+            "(the vision towers return no per-patch attention scores); use 'spatial'"
+        )
 
 
 def load_config(config_path: str) -> EventVLMConfig:
-    """Load configuration from YAML file."""
+    """Load and validate configuration from YAML file."""
     schema = OmegaConf.structured(EventVLMConfig)
     file_conf = OmegaConf.load(config_path)
     merged = OmegaConf.merge(schema, file_conf)
-    return OmegaConf.to_object(merged)
+    config = OmegaConf.to_object(merged)
+    validate_config(config)
+    return config
 
 
 def save_config(config: EventVLMConfig, path: str) -> None:
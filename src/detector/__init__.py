@@ -1,6 +1,15 @@
 """Detector module for Stage 1: Event-Triggered Gating."""
 
-from src.detector.detr_wrapper import DETRDetector, YOLODetector
-from src.detector.risk_loss import RiskSensitiveLoss
+from src.utils.lazy import lazy_getattr
 
-__all__ = ["DETRDetector", "YOLODetector", "RiskSensitiveLoss"]
+# Public names -> defining module, imported on first attribute access so
+# importing the package does not load torch
+_LAZY_IMPORTS = {
+    "DETRDetector": "src.detector.detr_wrapper",
+    "YOLODetector": "src.detector.detr_wrapper",
+    "MockDetector": "src.detector.mock",
+    "RiskSensitiveLoss": "src.detector.risk_loss",
+}
+
+__all__ = list(_LAZY_IMPORTS)
+__getattr__ = lazy_getattr(__name__, globals(), _LAZY_IMPORTS)
@@ -94,7 +94,8 @@ class BaseDetector(ABC):
         """Get hazard level for a class."""
         return self.HAZARD_MAPPING.get(class_name.lower(), "none")
     
-    def should_trigger(self, detections: List[Detection]) -> Tuple[bool, str, float]:
+    @staticmethod
+    def should_trigger(detections: List[Detection]) -> Tuple[bool, str, float]:
         """Determine if VLM should be triggered based on detections."""
         if not detections:
             return False, "none", 0.0
@@ -310,8 +311,11 @@ class YOLODetector(BaseDetector):
 
 
 def get_detector(model_name: str, **kwargs) -> BaseDetector:
-    """Factory function to get detector by name."""
-    if model_name.startswith("detr"):
+    """Factory function to get detector by name ("mock" for the synthetic detector)."""
+    if model_name == "mock":
+        from src.detector.mock import MockDetector
+        return MockDetector(model_name=model_name, **kwargs)
+    elif model_name.startswith("detr"):
         return DETRDetector(model_name=model_name, **kwargs)
     elif model_name.startswith("yolo"):
         return YOLODetector(model_name=model_name, **kwargs)
@@ -0,0 +1,125 @@
+"""
+Mock detector for CPU load testing.
+Emits seeded, bursty events with configurable box distributions and
+detection latency, without loading a detection model.
+"""
+
+from typing import Dict, Optional, Tuple
+import logging
+
+import numpy as np
+
+from src.detector.detr_wrapper import BaseDetector, Detection, DetectionResult
+from src.utils.latency import LatencyModel
+
+logger = logging.getLogger(__name__)
+
+
+class MockDetector(BaseDetector):
+    """
+    Deterministic synthetic detector.
+
+    Event frames follow a two-state Markov chain whose stationary rate is
+    `event_rate` and whose mean run length is `mean_event_length` frames.
+    Event frames carry 1..max_boxes boxes with classes drawn from
+    `class_weights` and side lengths uniform in `box_scale`. The same seed
+    replays the same sequence of results, whatever the latency model.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "mock",
+        seed: int = 0,
+        event_rate: float = 0.1,
+        mean_event_length: float = 5.0,
+        class_weights: Optional[Dict[str, float]] = None,
+        max_boxes: int = 3,
+        box_scale: Tuple[float, float] = (0.05, 0.3),
+        latency: Optional[LatencyModel] = None,
+        **kwargs
+    ):
+        """
+        Args:
+            model_name: Detector name (for logging)
+            seed: Random seed of the event/box sequence
+            event_rate: Fraction of frames that are events
+            mean_event_length: Mean consecutive event frames
+            class_weights: Sampling weight per class (default: uniform over
+                the hazard classes)
+            max_boxes: Maximum boxes per event frame
+            box_scale: Range of normalized box side lengths
+            latency: Detection latency model (per_call = cost per frame)
+        """
+        kwargs.setdefault("device", "cpu")
+        super().__init__(**kwargs)
+        self.model_name = model_name
+        self.seed = seed
+        self.event_rate = event_rate
+        self.mean_event_length = mean_event_length
+        self.max_boxes = max_boxes
+        self.box_scale = box_scale
+        self.latency = latency or LatencyModel()
+
+        weights = class_weights or {name: 1.0 for name in self.HAZARD_MAPPING}
+        self.class_names = list(weights)
+        probs = np.array([weights[name] for name in self.class_names], dtype=np.float64)
+        self.class_probs = probs / probs.sum()
+
+        # Markov chain with stationary rate event_rate and mean run length
+        self.p_stay = 1.0 - 1.0 / max(mean_event_length, 1.0)
+        self.p_start = (
+            event_rate * (1.0 - self.p_stay) / (1.0 - event_rate)
+            if event_rate < 1.0 else 1.0
+        )
+
+        self.load_model()
+
+    def load_model(self) -> None:
+        """Reset the seeded event sequence and latency noise."""
+        self.rng = np.random.default_rng(self.seed)
+        # Separate stream: latency jitter must not shift the event sequence
+        self.latency_rng = np.random.default_rng([self.seed, 1])
+        self.in_event = False
+        self.frames = 0
+
+    def reset(self) -> None:
+        """Restart the seeded event sequence for a new run."""
+        self.load_model()
+
+    def detect(self, image: np.ndarray) -> DetectionResult:
+        """Emit the next synthetic detection result."""
+        self.frames += 1
+        p_event = self.p_stay if self.in_event else self.p_start
+        self.in_event = bool(self.rng.random() < p_event)
+
+        detections = []
+        if self.in_event:
+            num_boxes = int(self.rng.integers(1, self.max_boxes + 1))
+            for _ in range(num_boxes):
+                detections.append(self._sample_detection())
+
+        self.latency.wait(self.latency.cost(rng=self.latency_rng))
+
+        is_event, max_hazard, max_conf = self.should_trigger(detections)
+        return DetectionResult(
+            detections=detections,
+            is_event=is_event,
+            max_hazard_level=max_hazard,
+            trigger_confidence=max_conf
+        )
+
+    def _sample_detection(self) -> Detection:
+        class_id = int(self.rng.choice(len(self.class_names), p=self.class_probs))
+        class_name = self.class_names[class_id]
+
+        w, h = self.rng.uniform(*self.box_scale, size=2)
+        x1 = self.rng.uniform(0.0, 1.0 - w)
+        y1 = self.rng.uniform(0.0, 1.0 - h)
+
+        return Detection(
+            bbox=(float(x1), float(y1), float(x1 + w), float(y1 + h)),
+            class_id=class_id,
+            class_name=class_name,
+            confidence=float(self.rng.uniform(self.conf_threshold, 1.0)),
+            hazard_level=self.get_hazard_level(class_name)
+        )
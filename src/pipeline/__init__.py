@@ -1,5 +1,13 @@
 """Pipeline module for end-to-end Event-VLM inference."""
 
-from src.pipeline.event_vlm import EventVLM
+from src.utils.lazy import lazy_getattr
 
-__all__ = ["EventVLM"]
+# Public names -> defining module, imported on first attribute access so
+# importing the package does not load torch/cv2
+_LAZY_IMPORTS = {
+    "EventVLM": "src.pipeline.event_vlm",
+    "CaptionDeduplicator": "src.pipeline.dedup",
+}
+
+__all__ = list(_LAZY_IMPORTS)
+__getattr__ = lazy_getattr(__name__, globals(), _LAZY_IMPORTS)
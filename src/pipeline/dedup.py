@@ -0,0 +1,192 @@
+"""
+Caption deduplication after Stage 3.
+Compares each caption's MinHash signature over word shingles with the
+captions recently emitted on the same stream and collapses near-identical
+ones, so downstream alerting does not store every event frame's caption.
+"""
+
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Optional
+import logging
+import re
+import zlib
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+HAZARD_RANK = {"none": 0, "standard": 1, "high": 2, "critical": 3}
+
+# Mersenne prime of the universal hash family (a * x + b) mod p
+_PRIME = (1 << 31) - 1
+
+
+def word_shingles(text: str, size: int = 3) -> set:
+    """Lower-cased word n-grams of a text (the whole text if shorter than size)."""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class MinHasher:
+    """MinHash signatures whose agreement estimates shingle-set Jaccard similarity."""
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 3, seed: int = 0):
+        """
+        Args:
+            num_perm: Hash functions per signature
+            shingle_size: Words per shingle
+            seed: Seed of the hash functions
+        """
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, _PRIME, size=(num_perm, 1), dtype=np.uint64)
+        self.b = rng.integers(0, _PRIME, size=(num_perm, 1), dtype=np.uint64)
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """Signature [num_perm] of a text, or None if it has no words."""
+        shingles = word_shingles(text, self.shingle_size)
+        if not shingles:
+            return None
+        hashes = np.array(
+            [zlib.crc32(s.encode("utf-8")) % _PRIME for s in shingles], dtype=np.uint64
+        )
+        return ((self.a * hashes[None, :] + self.b) % _PRIME).min(axis=1)
+
+    @staticmethod
+    def similarity(a: np.ndarray, b: np.ndarray) -> float:
+        """Estimated Jaccard similarity of two signatures."""
+        return float(np.mean(a == b))
+
+
+@dataclass
+class _Emitted:
+    """A caption emitted on a stream."""
+    signature: np.ndarray
+    hazard_level: str
+    frame_idx: int
+    timestamp: float
+
+
+@dataclass
+class DedupDecision:
+    """Outcome of checking one caption."""
+    duplicate: bool
+    duplicate_of: Optional[int] = None  # Frame index of the matching emitted caption
+    similarity: float = 0.0
+    escalation: bool = False            # Passed because the hazard level rose
+
+
+class CaptionDeduplicator:
+    """
+    Per-stream sliding-window near-duplicate filter for captions.
+
+    A caption is a duplicate when its estimated Jaccard similarity to a
+    caption among the last `window` emitted on the stream (and at most
+    `max_age` seconds older) reaches `threshold`. Only emitted captions
+    with the same or a higher hazard level can suppress a caption, so
+    hazard escalations always pass.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        window: int = 16,
+        max_age: float = 0.0,
+        num_perm: int = 64,
+        shingle_size: int = 3,
+        seed: int = 0
+    ):
+        """
+        Args:
+            threshold: Estimated Jaccard similarity counted as a duplicate
+            window: Recently emitted captions compared per stream
+            max_age: Maximum age (s) of compared captions (0 = no limit)
+            num_perm: MinHash functions per signature
+            shingle_size: Words per shingle
+            seed: MinHash seed
+        """
+        self.threshold = threshold
+        self.window = window
+        self.max_age = max_age
+        self.hasher = MinHasher(num_perm, shingle_size, seed)
+        self._streams: Dict[str, Deque[_Emitted]] = {}
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    def reset(self, stream_id: Optional[str] = None) -> None:
+        """Forget the window and counts of one stream (all streams if None)."""
+        if stream_id is None:
+            self._streams.clear()
+            self._counts.clear()
+        else:
+            self._streams.pop(stream_id, None)
+            self._counts.pop(stream_id, None)
+
+    def check(
+        self,
+        stream_id: str,
+        caption: str,
+        hazard_level: str,
+        frame_idx: int = 0,
+        timestamp: float = 0.0
+    ) -> DedupDecision:
+        """
+        Decide whether a caption duplicates one recently emitted on its stream.
+
+        Captions that are not duplicates are recorded as emitted.
+
+        Args:
+            stream_id: Camera/stream identifier
+            caption: Generated caption
+            hazard_level: Hazard level of the frame
+            frame_idx: Frame index (reported as duplicate_of)
+            timestamp: Frame timestamp in seconds
+
+        Returns:
+            DedupDecision
+        """
+        recent = self._streams.setdefault(stream_id, deque(maxlen=self.window))
+        counts = self._counts.setdefault(stream_id, {"emitted": 0, "suppressed": 0, "escalations": 0})
+        signature = self.hasher.signature(caption)
+        rank = HAZARD_RANK.get(hazard_level, 0)
+
+        decision = DedupDecision(duplicate=False)
+        if signature is not None:
+            for entry in reversed(recent):
+                if self.max_age > 0 and timestamp - entry.timestamp > self.max_age:
+                    break
+                similarity = self.hasher.similarity(signature, entry.signature)
+                if similarity < self.threshold:
+                    continue
+                if HAZARD_RANK.get(entry.hazard_level, 0) >= rank:
+                    decision = DedupDecision(True, entry.frame_idx, similarity)
+                    break
+                decision.escalation = True
+
+        if decision.duplicate:
+            counts["suppressed"] += 1
+        else:
+            counts["emitted"] += 1
+            counts["escalations"] += int(decision.escalation)
+            if signature is not None:
+                recent.append(_Emitted(signature, hazard_level, frame_idx, timestamp))
+        return decision
+
+    def stats(self, stream_id: Optional[str] = None) -> Dict[str, float]:
+        """Emitted/suppressed caption counts of one stream (all streams if None)."""
+        streams = [stream_id] if stream_id is not None else list(self._counts)
+        totals = {"emitted": 0, "suppressed": 0, "escalations": 0}
+        for sid in streams:
+            for key, value in self._counts.get(sid, {}).items():
+                totals[key] += value
+
+        checked = totals["emitted"] + totals["suppressed"]
+        return {
+            "emitted": float(totals["emitted"]),
+            "suppressed": float(totals["suppressed"]),
+            "escalations": float(totals["escalations"]),
+            "suppression_rate": totals["suppressed"] / max(checked, 1),
+        }
@@ -4,7 +4,7 @@ Cascaded three-stage framework for efficient video understanding.
 """
 
 from dataclasses import dataclass, field
-from typing import List, Optional, Dict, Any, Generator, Union
+from typing import List, Optional, Dict, Any, Callable, Generator, Tuple, Union
 from pathlib import Path
 import time
 import logging
@@ -14,11 +14,13 @@ import numpy as np
 import cv2
 from PIL import Image
 
-from src.config import EventVLMConfig, DetectorConfig, PruningConfig, VLMConfig
-from src.detector import DETRDetector, YOLODetector
+from src.config import EventVLMConfig, DetectorConfig, PruningConfig, VLMConfig, validate_config
 from src.detector.detr_wrapper import Detection, DetectionResult, get_detector
-from src.pruning import TokenPruner
-from src.vlm import LLaVAWrapper, HazardPriorityPrompting
+from src.pipeline.dedup import CaptionDeduplicator
+from src.pruning import TokenPruner, AnyResTokenPruner
+from src.utils.latency import LatencyModel
+from src.vlm import LLaVAWrapper, HazardPriorityPrompting, IncrementalEncoder
+from src.vlm.llava_wrapper import get_vlm
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +37,10 @@ class FrameResult:
     tokens_used: int = 0
     tokens_total: int = 576
     processing_time: float = 0.0
+    features_reused: bool = False
+    tokens_generated: int = 0
+    time_to_first_token: float = 0.0
+    duplicate_of: Optional[int] = None  # Frame whose caption this one duplicated (caption cleared)
     
     @property
     def token_reduction(self) -> float:
@@ -104,6 +110,14 @@ class EventVLM:
         self.pruner = None
         self.vlm = None
         self.prompting = None
+        self.incremental_encoder = None
+        self.deduplicator = None
+        self.anyres = False
+        self._image_newline = None  # (row separator or None,) once fetched
+        
+        # Input-level pruning quality checks (see _compare_input_pruning)
+        self.input_pruning_quality: List[Dict[str, float]] = []
+        self._input_pruning_frames = 0
         
         self._initialized = False
     
@@ -113,52 +127,192 @@ class EventVLM:
             return
         
         logger.info("Initializing Event-VLM pipeline...")
+        validate_config(self.config)
+        
+        # Client mode: the detector and VLM live in a persistent model server
+        client = None
+        if self.config.server:
+            from src.pipeline.server import ModelClient, RemoteDetector, RemoteVLM
+            logger.info(f"Using model server at {self.config.server}")
+            client = ModelClient(self.config.server)
+            client.validate(self.config)
         
         # Stage 1: Detector
-        logger.info(f"Loading detector: {self.config.detector.model}")
-        self.detector = get_detector(
-            model_name=self.config.detector.model,
+        detector_kwargs = dict(
             conf_threshold=self.config.detector.conf_threshold,
             iou_threshold=self.config.detector.iou_threshold,
             hazard_classes=self.config.detector.hazard_classes,
             device=self.device
         )
+        if client is not None:
+            self.detector = RemoteDetector(client, self.config.detector.model, **detector_kwargs)
+        else:
+            logger.info(f"Loading detector: {self.config.detector.model}")
+            self.detector = get_detector(
+                model_name=self.config.detector.model,
+                **detector_kwargs,
+                **self._mock_kwargs("detector")
+            )
         
-        # Stage 2: Token Pruner
+        # Stage 2: Token Pruner (anyres models prune every tile grid)
         logger.info("Initializing token pruner")
-        self.pruner = TokenPruner(
+        self.anyres = self.config.vlm.model in LLaVAWrapper.ANYRES_MODELS
+        pruner_cls = AnyResTokenPruner if self.anyres else TokenPruner
+        self.pruner = pruner_cls(
             image_size=self.config.data.image_size,
             patch_size=14,  # ViT default
             alpha_base=self.config.pruning.alpha_base,
             beta=self.config.pruning.beta,
             min_tokens=self.config.pruning.min_tokens,
             preserve_cls_token=self.config.pruning.preserve_cls_token,
-            shape_variance=self.config.pruning.shape_variance
+            shape_variance=self.config.pruning.shape_variance,
+            num_summary_tokens=self.config.pruning.num_summary_tokens,
+            summary_pooling=self.config.pruning.summary_pooling
         )
         
         # Stage 3: VLM
-        logger.info(f"Loading VLM: {self.config.vlm.model}")
-        self.vlm = LLaVAWrapper(
+        vlm_kwargs = dict(
             model_name=self.config.vlm.model,
             quantization=self.config.vlm.quantization,
             device=self.device,
             max_new_tokens=self.config.vlm.max_new_tokens,
             temperature=self.config.vlm.temperature,
-            do_sample=self.config.vlm.do_sample
+            do_sample=self.config.vlm.do_sample,
+            prefix_cache=self.config.vlm.prefix_cache,
+            prefix_cache_size=self.config.vlm.prefix_cache_size,
+            max_batch_size=self.config.vlm.max_batch_size,
+            kv_block_size=self.config.vlm.kv_block_size,
+            kv_num_blocks=self.config.vlm.kv_num_blocks,
+            token_budgets=self.config.vlm.token_budgets,
+            structured_stop=self.config.vlm.structured_stop,
+            stop_sequences=self.config.vlm.stop_sequences,
+            repetition_ngram=self.config.vlm.repetition_ngram,
+            repetition_max=self.config.vlm.repetition_max,
+            tensor_preprocess=self.config.vlm.tensor_preprocess,
+            feature_cache=self.config.vlm.feature_cache,
+            feature_cache_size=self.config.vlm.feature_cache_size,
+            feature_cache_dir=self.config.vlm.feature_cache_dir,
+            feature_cache_disk_entries=self.config.vlm.feature_cache_disk_entries,
+            kv_policy=self.config.vlm.kv_policy,
+            kv_int8=self.config.vlm.kv_int8,
+            kv_visual_keep_ratio=self.config.vlm.kv_visual_keep_ratio,
+            kv_sink_tokens=self.config.vlm.kv_sink_tokens,
+            kv_window=self.config.vlm.kv_window,
+            speculative=self.config.vlm.speculative,
+            draft_model=self.config.vlm.draft_model,
+            num_draft_tokens=self.config.vlm.num_draft_tokens,
+            prompt_lookup_ngram=self.config.vlm.prompt_lookup_ngram,
+            cpu_threads=self.config.vlm.cpu_threads,
+            quant_group_size=self.config.vlm.quant_group_size,
+            prompt_token_cache_size=self.config.vlm.prompt_token_cache_size
         )
+        if client is not None:
+            self.vlm = RemoteVLM(client, **vlm_kwargs)
+        else:
+            logger.info(f"Loading VLM: {self.config.vlm.model}")
+            self.vlm = get_vlm(**vlm_kwargs, **self._mock_kwargs("vlm"))
+        
+        if self.anyres and self.config.vlm.input_pruning:
+            logger.warning(
+                "Input-level pruning is not supported for anyres models; "
+                "pruning after encoding instead"
+            )
+        
+        if self.anyres and self.config.vlm.incremental_encoding:
+            logger.warning(
+                "Incremental encoding is not supported for anyres models "
+                "(per-tile features and change detection); encoding every frame instead"
+            )
+        
+        # Optional incremental encoding for static cameras
+        if self.config.vlm.incremental_encoding and not self.anyres:
+            self.incremental_encoder = IncrementalEncoder(
+                self.vlm,
+                patch_size=14,
+                pixel_threshold=self.config.vlm.incremental_pixel_threshold,
+                refresh_ratio=self.config.vlm.incremental_refresh_ratio,
+                validate_every=self.config.vlm.incremental_validate_every,
+                recompute_changed=self.config.vlm.incremental_recompute_changed
+            )
         
         # Hazard-Priority Prompting
         self.prompting = HazardPriorityPrompting()
         
+        # Near-duplicate caption suppression for streamed results
+        if self.config.dedup.enabled:
+            self.deduplicator = CaptionDeduplicator(
+                threshold=self.config.dedup.threshold,
+                window=self.config.dedup.window,
+                max_age=self.config.dedup.max_age,
+                num_perm=self.config.dedup.num_perm,
+                shingle_size=self.config.dedup.shingle_size,
+                seed=self.config.seed
+            )
+        
         self._initialized = True
         logger.info("Event-VLM pipeline initialized")
     
+    def _mock_kwargs(self, stage: str) -> Dict[str, Any]:
+        """Constructor arguments of the synthetic detector/VLM (empty for real models)."""
+        mock = self.config.mock
+        if stage == "detector" and self.config.detector.model == "mock":
+            return dict(
+                seed=mock.seed,
+                event_rate=mock.event_rate,
+                mean_event_length=mock.mean_event_length,
+                class_weights=mock.class_weights,
+                max_boxes=mock.max_boxes,
+                box_scale=tuple(mock.box_scale),
+                latency=LatencyModel(per_call=mock.detect_latency, jitter=mock.latency_jitter)
+            )
+        if stage == "vlm" and self.config.vlm.model == "mock":
+            return dict(
+                seed=mock.seed,
+                caption_tokens=tuple(mock.caption_tokens),
+                latency=LatencyModel(
+                    per_call=mock.encode_latency,
+                    per_prefill_token=mock.prefill_latency_per_token,
+                    per_decode_token=mock.decode_latency_per_token,
+                    jitter=mock.latency_jitter
+                )
+            )
+        return {}
+    
+    def reset(self, config: Optional[EventVLMConfig] = None) -> None:
+        """
+        Start a new run on the loaded detector and VLM.
+        
+        Clears per-run state (stream encodings, caption windows, seeded
+        mock sequences) so the run matches one on a freshly built pipeline.
+        
+        Args:
+            config: Configuration of the new run (e.g. another seed or
+                prompt strategy); its detector, pruning and VLM settings
+                must be those the components were built with
+        """
+        if config is not None:
+            self.config = config
+        if not self._initialized:
+            return
+        
+        if self.incremental_encoder is not None:
+            self.incremental_encoder.reset()
+        if self.deduplicator is not None:
+            self.deduplicator.reset()
+        for component in (self.detector, self.vlm):
+            if hasattr(component, "reset"):
+                component.reset()
+        self.input_pruning_quality = []
+        self._input_pruning_frames = 0
+    
     def process_frame(
         self,
         frame: np.ndarray,
         frame_idx: int = 0,
         timestamp: float = 0.0,
-        force_vlm: bool = False
+        force_vlm: bool = False,
+        stream_id: str = "default",
+        on_caption_chunk: Optional[Callable[[FrameResult, str], None]] = None
     ) -> FrameResult:
         """
         Process a single frame through the pipeline.
@@ -168,6 +322,9 @@ class EventVLM:
             frame_idx: Frame index in video
             timestamp: Timestamp in seconds
             force_vlm: Force VLM processing regardless of trigger
+            stream_id: Camera/stream identifier for incremental encoding
+            on_caption_chunk: Optional callback receiving (result, text) for
+                each decoded caption chunk as it is generated
             
         Returns:
             FrameResult with detections and optional caption
@@ -192,53 +349,364 @@ class EventVLM:
             return result
         
         # Stage 2: Knowledge-Guided Token Pruning
-        # First encode image to get visual tokens
-        image_pil = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-        visual_tokens = self.vlm.encode_image(image_pil)
+        image, pruned_tokens = self._encode_and_prune(
+            frame, detection_result, result, stream_id
+        )
+        
+        # Stage 3: Context-Aware Generation
+        detected_classes = [d.class_name for d in detection_result.detections]
+        prompt, prompt_suffix = self.build_prompt(
+            detection_result.max_hazard_level,
+            detected_classes
+        )
         
-        result.tokens_total = visual_tokens.shape[1]
+        generate_kwargs = dict(
+            image=image,
+            prompt=prompt,
+            pruned_tokens=pruned_tokens,
+            prompt_suffix=prompt_suffix,
+            hazard_level=detection_result.max_hazard_level
+        )
         
-        if self.config.pruning.enabled:
-            pruned_tokens, pruning_result = self.pruner.prune(
-                visual_tokens,
-                detection_result.detections,
-                return_mask=True
-            )
-            result.tokens_used = pruning_result.num_kept if pruning_result else result.tokens_total
+        if on_caption_chunk is not None:
+            # Stream partial captions (e.g. push critical alerts early)
+            for chunk in self.vlm.generate_stream(**generate_kwargs):
+                if chunk.text:
+                    on_caption_chunk(result, chunk.text)
+            vlm_output = chunk.output
         else:
-            pruned_tokens = visual_tokens
-            result.tokens_used = result.tokens_total
+            vlm_output = self.vlm.generate(**generate_kwargs)
         
-        # Stage 3: Context-Aware Generation
+        result.caption = vlm_output.caption
+        result.tokens_generated = vlm_output.generated_tokens
+        result.time_to_first_token = vlm_output.time_to_first_token
+        result.processing_time = time.time() - start_time
+        
+        return result
+    
+    def process_frame_variants(
+        self,
+        frame: np.ndarray,
+        prompt_strategies: List[str],
+        frame_idx: int = 0,
+        timestamp: float = 0.0,
+        stream_id: str = "default"
+    ) -> Dict[str, FrameResult]:
+        """
+        Process a frame once per prompt strategy, sharing Stages 1-2.
+        
+        The detector and the vision encoder run once; every strategy is
+        captioned from the same detections and pruned tokens. Each result's
+        processing time is the shared stage time plus its own Stage 3 time.
+        
+        Args:
+            frame: Input frame (BGR)
+            prompt_strategies: Prompt strategies to caption with
+            frame_idx: Frame index in video
+            timestamp: Timestamp in seconds
+            stream_id: Camera/stream identifier for incremental encoding
+            
+        Returns:
+            FrameResult per prompt strategy
+        """
+        self.initialize()
+        start_time = time.time()
+        
+        detection_result = self.detector.detect(frame)
+        
+        def new_result() -> FrameResult:
+            return FrameResult(
+                frame_idx=frame_idx,
+                timestamp=timestamp,
+                is_event=detection_result.is_event,
+                detections=detection_result.detections,
+                hazard_level=detection_result.max_hazard_level
+            )
+        
+        shared = new_result()
+        if not detection_result.is_event:
+            shared.processing_time = time.time() - start_time
+            results = {}
+            for strategy in prompt_strategies:
+                results[strategy] = new_result()
+                results[strategy].processing_time = shared.processing_time
+            return results
+        
+        image, pruned_tokens = self._encode_and_prune(
+            frame, detection_result, shared, stream_id
+        )
+        shared_time = time.time() - start_time
         detected_classes = [d.class_name for d in detection_result.detections]
-        prompt_strategy = getattr(self.config.vlm, "prompt_strategy", "hazard_priority")
-
-        if prompt_strategy == "standard":
-            prompt = self.prompting.select_prompt(
-                hazard_level="standard",
-                detected_classes=detected_classes
+        
+        results = {}
+        for strategy in prompt_strategies:
+            stage_start = time.time()
+            prompt, prompt_suffix = self.build_prompt(
+                detection_result.max_hazard_level,
+                detected_classes,
+                prompt_strategy=strategy
+            )
+            vlm_output = self.vlm.generate(
+                image=image,
+                prompt=prompt,
+                pruned_tokens=pruned_tokens,
+                prompt_suffix=prompt_suffix,
+                hazard_level=detection_result.max_hazard_level
+            )
+            
+            result = new_result()
+            result.tokens_used = shared.tokens_used
+            result.tokens_total = shared.tokens_total
+            result.features_reused = shared.features_reused
+            result.caption = vlm_output.caption
+            result.tokens_generated = vlm_output.generated_tokens
+            result.time_to_first_token = vlm_output.time_to_first_token
+            result.processing_time = shared_time + time.time() - stage_start
+            results[strategy] = result
+        
+        return results
+    
+    def _encode_and_prune(
+        self,
+        frame: np.ndarray,
+        detection_result,
+        result: FrameResult,
+        stream_id: str
+    ) -> Tuple[Union[Image.Image, torch.Tensor], torch.Tensor]:
+        """
+        Run Stage 2 for an event frame, filling token counts in result.
+        
+        Returns:
+            (RGB image, pruned visual tokens)
+        """
+        image = self._frame_to_image(frame)
+        
+        if self.config.pruning.enabled and self.config.vlm.input_pruning and not self.anyres:
+            # Input-level pruning: the mask is known before encoding
+            mask = self.pruner.keep_mask(detection_result.detections)
+            num_summary = self.pruner.num_summary_tokens if not mask.all() else 0
+            summary_weights = (
+                self.pruner.summary_weights(mask, num_summary)[0] if num_summary else None
+            )
+            pruned_tokens = self.vlm.encode_image_masked(
+                image,
+                mask,
+                prune_after_layer=self.config.vlm.input_pruning_layer,
+                summary_weights=summary_weights
+            )
+            result.tokens_total = self.pruner.num_patches
+            result.tokens_used = int(mask.sum()) + num_summary
+            self._compare_input_pruning(image, mask, pruned_tokens[:, :int(mask.sum())])
+        else:
+            # First encode image to get visual tokens
+            if self.incremental_encoder is not None:
+                watch_mask = (
+                    self.pruner.create_mask(detection_result.detections)
+                    if self.config.pruning.enabled else None
+                )
+                visual_tokens, encode_stats = self.incremental_encoder.encode(
+                    image,
+                    stream_id=stream_id,
+                    mask=watch_mask
+                )
+                result.features_reused = encode_stats.reused
+            else:
+                visual_tokens = self.vlm.encode_image(image)
+            
+            result.tokens_total = visual_tokens.shape[1]
+            
+            if self.config.pruning.enabled:
+                pruned_tokens, pruning_result = self.pruner.prune(
+                    visual_tokens,
+                    detection_result.detections,
+                    return_mask=True,
+                    **self._prune_kwargs(frame)
+                )
+                result.tokens_used = pruning_result.tokens_used if pruning_result else result.tokens_total
+            else:
+                pruned_tokens = visual_tokens
+                result.tokens_used = result.tokens_total
+        
+        return image, pruned_tokens
+    
+    def _prune_kwargs(self, frame: np.ndarray) -> Dict[str, Any]:
+        """Frame-dependent pruner arguments (anyres layout and row separator)."""
+        if not self.anyres:
+            return {}
+        if self._image_newline is None:
+            self._image_newline = (self.vlm.image_newline(),)
+        return {
+            "original_size": (frame.shape[1], frame.shape[0]),
+            "image_newline": self._image_newline[0]
+        }
+    
+    def _frame_to_image(self, frame: np.ndarray) -> Union[Image.Image, torch.Tensor]:
+        """
+        Convert a BGR frame to the VLM's image input.
+        
+        With tensor preprocessing the frame becomes an RGB uint8 tensor on
+        the target device (no OpenCV/PIL conversion); otherwise a PIL image.
+        """
+        if self.config.vlm.tensor_preprocess:
+            return torch.from_numpy(frame).to(self.device).flip(-1)
+        return Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    
+    def process_frames(
+        self,
+        frames: List[np.ndarray],
+        frame_indices: Optional[List[int]] = None,
+        timestamps: Optional[List[float]] = None,
+        stream_ids: Optional[List[str]] = None,
+        force_vlm: bool = False
+    ) -> List[FrameResult]:
+        """
+        Process a burst of frames (e.g. one per camera) with batched Stage 3.
+        
+        Stages 1-2 run per frame; all event frames are then captioned in a
+        single left-padded generate_batch call, or submitted to the
+        continuous-batching engine when it is enabled.
+        
+        Args:
+            frames: Input frames (BGR)
+            frame_indices: Frame index per frame
+            timestamps: Timestamp per frame in seconds
+            stream_ids: Camera/stream identifier per frame
+            force_vlm: Force VLM processing regardless of trigger
+            
+        Returns:
+            FrameResult per input frame
+        """
+        self.initialize()
+        start_time = time.time()
+        
+        num_frames = len(frames)
+        frame_indices = frame_indices or list(range(num_frames))
+        timestamps = timestamps or [0.0] * num_frames
+        stream_ids = stream_ids or ["default"] * num_frames
+        
+        results = []
+        batch_indices, batch_tokens, batch_prompts, batch_levels = [], [], [], []
+        
+        for i, frame in enumerate(frames):
+            detection_result = self.detector.detect(frame)
+            
+            result = FrameResult(
+                frame_idx=frame_indices[i],
+                timestamp=timestamps[i],
+                is_event=detection_result.is_event,
+                detections=detection_result.detections,
+                hazard_level=detection_result.max_hazard_level
+            )
+            results.append(result)
+            
+            if not detection_result.is_event and not force_vlm:
+                continue
+            
+            _, pruned_tokens = self._encode_and_prune(
+                frame, detection_result, result, stream_ids[i]
+            )
+            
+            prompt, prompt_suffix = self.build_prompt(
+                detection_result.max_hazard_level,
+                [d.class_name for d in detection_result.detections]
             )
-        elif prompt_strategy == "none":
+            if prompt_suffix:
+                prompt = f"{prompt}\n{prompt_suffix}"
+            
+            batch_indices.append(i)
+            batch_tokens.append(pruned_tokens)
+            batch_prompts.append(prompt)
+            batch_levels.append(detection_result.max_hazard_level)
+        
+        if batch_indices and self.config.vlm.continuous_batching:
+            futures = [
+                self.vlm.submit(None, prompt, tokens, hazard_level=level)
+                for tokens, prompt, level in zip(batch_tokens, batch_prompts, batch_levels)
+            ]
+            vlm_outputs = [future.result() for future in futures]
+        elif batch_indices:
+            vlm_outputs = self.vlm.generate_batch(batch_tokens, batch_prompts, batch_levels)
+        
+        if batch_indices:
+            for i, vlm_output in zip(batch_indices, vlm_outputs):
+                results[i].caption = vlm_output.caption
+                results[i].tokens_generated = vlm_output.generated_tokens
+                results[i].time_to_first_token = vlm_output.time_to_first_token
+        
+        # Amortize the burst's wall time over its frames
+        elapsed = (time.time() - start_time) / max(num_frames, 1)
+        for result in results:
+            result.processing_time = elapsed
+        
+        return results
+    
+    def build_prompt(
+        self,
+        hazard_level: str,
+        detected_classes: List[str],
+        prompt_strategy: Optional[str] = None
+    ) -> Tuple[str, Optional[str]]:
+        """
+        Build the Stage 3 prompt for the configured prompt strategy.
+        
+        With the prefix KV-cache enabled the prompt is returned split into
+        the shared template and the per-frame suffix; otherwise the suffix
+        is None and the prompt is the full text.
+        
+        Args:
+            hazard_level: Maximum hazard level from detections
+            detected_classes: Detected class names
+            prompt_strategy: Override of config.vlm.prompt_strategy
+            
+        Returns:
+            (prompt, prompt_suffix)
+        """
+        if prompt_strategy is None:
+            prompt_strategy = getattr(self.config.vlm, "prompt_strategy", "hazard_priority")
+        
+        if prompt_strategy == "none":
             prompt = (
                 "Describe what is happening in this surveillance footage. "
                 "Focus on safety-relevant observations."
             )
-        else:
-            prompt = self.prompting(
-                hazard_level=detection_result.max_hazard_level,
-                detected_classes=detected_classes
-            )
+            return prompt, ("" if self.config.vlm.prefix_cache else None)
         
-        vlm_output = self.vlm.generate(
-            image=image_pil,
-            prompt=prompt,
-            pruned_tokens=pruned_tokens
-        )
+        if prompt_strategy == "standard":
+            hazard_level = "standard"
         
-        result.caption = vlm_output.caption
-        result.processing_time = time.time() - start_time
+        if self.config.vlm.prefix_cache:
+            return self.prompting.select_prompt_parts(hazard_level, detected_classes)
         
-        return result
+        return self.prompting.select_prompt(hazard_level, detected_classes), None
+    
+    def _compare_input_pruning(
+        self,
+        image: Union[Image.Image, torch.Tensor],
+        mask: torch.Tensor,
+        pruned_tokens: torch.Tensor
+    ) -> None:
+        """Periodically compare input-level pruning against a full encode."""
+        every = self.config.vlm.input_pruning_compare_every
+        if not every:
+            return
+        
+        self._input_pruning_frames += 1
+        if self._input_pruning_frames % every != 0:
+            return
+        
+        from src.vlm.masked_vision import compare_encodings
+        
+        full_tokens = self.vlm.encode_image(image)
+        offset = full_tokens.shape[1] - mask.shape[0]  # Skip CLS if present
+        quality = compare_encodings(
+            full_tokens[:, offset:],
+            pruned_tokens,
+            mask.nonzero(as_tuple=True)[0]
+        )
+        self.input_pruning_quality.append(quality)
+        
+        if self.verbose:
+            logger.info(f"Input pruning quality: {quality}")
     
     def process_video(
         self,
@@ -262,65 +730,31 @@ class EventVLM:
         self.initialize()
         start_time = time.time()
         
-        frame_rate = frame_rate or self.config.data.frame_rate
-        max_frames = max_frames or self.config.data.max_frames
-        
-        # Open video
-        cap = cv2.VideoCapture(video_path)
-        if not cap.isOpened():
-            raise IOError(f"Cannot open video: {video_path}")
-        
-        video_fps = cap.get(cv2.CAP_PROP_FPS)
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        frame_interval = max(1, int(video_fps / frame_rate))
-        
-        logger.info(f"Processing video: {video_path}")
-        logger.info(f"Total frames: {total_frames}, Interval: {frame_interval}")
-        
         frame_results = []
-        frame_idx = 0
-        processed = 0
         events = 0
         
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            # Sample at specified frame rate
-            if frame_idx % frame_interval != 0:
-                frame_idx += 1
-                continue
-            
-            timestamp = frame_idx / video_fps
-            
+        total_frames = 0
+        for frame_idx, timestamp, frame, total_frames in self._sample_frames(video_path, frame_rate, max_frames):
             # Process frame
             result = self.process_frame(
                 frame=frame,
                 frame_idx=frame_idx,
-                timestamp=timestamp
+                timestamp=timestamp,
+                stream_id=video_path
             )
             
             frame_results.append(result)
-            processed += 1
             if result.is_event:
                 events += 1
             
             if callback:
                 callback(result)
             
-            if self.verbose and processed % 10 == 0:
-                logger.info(f"Processed {processed} frames, {events} events")
-            
-            # Check max frames
-            if max_frames and processed >= max_frames:
-                break
-            
-            frame_idx += 1
-        
-        cap.release()
+            if self.verbose and len(frame_results) % 10 == 0:
+                logger.info(f"Processed {len(frame_results)} frames, {events} events")
         
         total_time = time.time() - start_time
+        processed = len(frame_results)
         fps = processed / max(total_time, 1e-6)
         
         return VideoResult(
@@ -333,10 +767,111 @@ class EventVLM:
             fps=fps
         )
     
+    def process_video_variants(
+        self,
+        video_path: str,
+        prompt_strategies: List[str],
+        frame_rate: Optional[int] = None,
+        max_frames: Optional[int] = None
+    ) -> Dict[str, VideoResult]:
+        """
+        Process a video once for several prompt strategies.
+        
+        Stages 1-2 run once per frame (see process_frame_variants); each
+        strategy's total time is the sum of its frames' processing times.
+        
+        Args:
+            video_path: Path to video file
+            prompt_strategies: Prompt strategies to caption with
+            frame_rate: Frames per second to extract (default: from config)
+            max_frames: Maximum frames to process (default: from config)
+            
+        Returns:
+            VideoResult per prompt strategy
+        """
+        self.initialize()
+        
+        frame_results: Dict[str, List[FrameResult]] = {s: [] for s in prompt_strategies}
+        
+        total_frames = 0
+        for frame_idx, timestamp, frame, total_frames in self._sample_frames(video_path, frame_rate, max_frames):
+            results = self.process_frame_variants(
+                frame, prompt_strategies, frame_idx, timestamp, stream_id=video_path
+            )
+            for strategy, result in results.items():
+                frame_results[strategy].append(result)
+        
+        video_results = {}
+        for strategy, results in frame_results.items():
+            total_time = sum(r.processing_time for r in results)
+            video_results[strategy] = VideoResult(
+                video_path=video_path,
+                total_frames=total_frames,
+                processed_frames=len(results),
+                event_frames=sum(r.is_event for r in results),
+                frame_results=results,
+                total_time=total_time,
+                fps=len(results) / max(total_time, 1e-6)
+            )
+        return video_results
+    
+    def _sample_frames(
+        self,
+        video_path: str,
+        frame_rate: Optional[int] = None,
+        max_frames: Optional[int] = None
+    ) -> Generator[Tuple[int, float, np.ndarray, int], None, None]:
+        """
+        Read a video at the evaluation frame rate.
+        
+        Yields:
+            (frame index, timestamp, BGR frame, total frames in the video)
+        """
+        frame_rate = frame_rate or self.config.data.frame_rate
+        max_frames = max_frames or self.config.data.max_frames
+        
+        # Open video
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise IOError(f"Cannot open video: {video_path}")
+        
+        video_fps = cap.get(cv2.CAP_PROP_FPS)
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        frame_interval = max(1, int(video_fps / frame_rate))
+        
+        logger.info(f"Processing video: {video_path}")
+        logger.info(f"Total frames: {total_frames}, Interval: {frame_interval}")
+        
+        frame_idx = 0
+        processed = 0
+        
+        try:
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                
+                # Sample at specified frame rate
+                if frame_idx % frame_interval != 0:
+                    frame_idx += 1
+                    continue
+                
+                yield frame_idx, frame_idx / video_fps, frame, total_frames
+                processed += 1
+                
+                # Check max frames
+                if max_frames and processed >= max_frames:
+                    break
+                
+                frame_idx += 1
+        finally:
+            cap.release()
+    
     def stream_video(
         self,
         video_path: str,
-        frame_rate: Optional[int] = None
+        frame_rate: Optional[int] = None,
+        on_caption_chunk: Optional[Callable[[FrameResult, str], None]] = None
     ) -> Generator[FrameResult, None, None]:
         """
         Stream video processing as a generator.
@@ -344,11 +879,18 @@ class EventVLM:
         Args:
             video_path: Path to video file
             frame_rate: Frames per second to extract
+            on_caption_chunk: Optional callback receiving (result, text) for
+                each caption chunk before the frame's result is yielded
             
         Yields:
-            FrameResult for each processed frame
+            FrameResult for each processed frame. With dedup enabled, a
+            caption near-identical to one recently emitted on the stream at
+            the same or a higher hazard level is cleared (duplicate_of set)
+            in collapse mode, or the frame is skipped in suppress mode.
         """
         self.initialize()
+        if self.deduplicator is not None:
+            self.deduplicator.reset(video_path)
         
         frame_rate = frame_rate or self.config.data.frame_rate
         
@@ -372,7 +914,24 @@ class EventVLM:
                     continue
                 
                 timestamp = frame_idx / video_fps
-                result = self.process_frame(frame, frame_idx, timestamp)
+                result = self.process_frame(
+                    frame,
+                    frame_idx,
+                    timestamp,
+                    stream_id=video_path,
+                    on_caption_chunk=on_caption_chunk
+                )
+                
+                if self.deduplicator is not None and result.caption:
+                    decision = self.deduplicator.check(
+                        video_path, result.caption, result.hazard_level, frame_idx, timestamp
+                    )
+                    if decision.duplicate:
+                        if self.config.dedup.mode == "suppress":
+                            frame_idx += 1
+                            continue
+                        result.caption = None
+                        result.duplicate_of = decision.duplicate_of
                 
                 yield result
                 
@@ -429,19 +988,19 @@ class EventVLM:
             if result.is_event:
                 # Encoding
                 t2 = time.time()
-                image_pil = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-                tokens = self.vlm.encode_image(image_pil)
+                image = self._frame_to_image(frame)
+                tokens = self.vlm.encode_image(image)
                 times["encoding"].append(time.time() - t2)
                 
                 # Pruning
                 t3 = time.time()
-                pruned, _ = self.pruner.prune(tokens, result.detections)
+                pruned, _ = self.pruner.prune(tokens, result.detections, **self._prune_kwargs(frame))
                 times["pruning"].append(time.time() - t3)
                 
                 # Generation
                 t4 = time.time()
                 prompt = self.prompting(result.max_hazard_level)
-                self.vlm.generate(image_pil, prompt, pruned)
+                self.vlm.generate(image, prompt, pruned)
                 times["generation"].append(time.time() - t4)
             
             times["total"].append(time.time() - t0)
@@ -455,4 +1014,8 @@ class EventVLM:
         
         metrics["fps"] = 1.0 / metrics.get("total_mean", 1.0)
         
+        feature_cache = getattr(self.vlm, "feature_cache", None)
+        if feature_cache is not None:
+            metrics["feature_cache_hit_rate"] = feature_cache.stats()["hit_rate"]
+        
         return metrics
@@ -0,0 +1,603 @@
+"""
+Persistent local model server for Event-VLM.
+Holds the detector and VLM in one long-lived process and serves detect,
+encode and generate calls over a Unix socket or localhost TCP port, so
+evaluation runs skip model loading. A client-mode EventVLM (config.server)
+uses RemoteDetector/RemoteVLM proxies transparently.
+
+Usage:
+    python -m src.pipeline.server --config experiments/configs/base.yaml \
+        --address unix:///tmp/event-vlm.sock
+"""
+
+from concurrent.futures import Future
+from contextlib import contextmanager
+from dataclasses import asdict, is_dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+import argparse
+import json
+import logging
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+
+from src.config import EventVLMConfig
+from src.detector.detr_wrapper import BaseDetector, Detection, DetectionResult
+from src.vlm.llava_wrapper import LLaVAWrapper, StreamChunk, VLMOutput
+
+logger = logging.getLogger(__name__)
+
+# Frame header: header length, payload length
+_FRAME = struct.Struct("!II")
+
+_DATACLASSES = {
+    "Detection": lambda fields: Detection(**{**fields, "bbox": tuple(fields["bbox"])}),
+    "DetectionResult": lambda fields: DetectionResult(**fields),
+    "VLMOutput": lambda fields: VLMOutput(**fields),
+}
+
+# VLM settings a client run applies to the shared server VLM per call
+GENERATION_OPTIONS = [
+    "max_new_tokens", "temperature", "do_sample", "token_budgets",
+    "structured_stop", "stop_sequences", "repetition_ngram", "repetition_max",
+]
+
+# VLM settings fixed when the server builds its model (clients must match)
+SERVER_VLM_SETTINGS = [
+    "model", "quantization", "quant_group_size", "prefix_cache", "tensor_preprocess",
+    "kv_policy", "kv_int8", "kv_visual_keep_ratio", "kv_sink_tokens", "kv_window",
+    "speculative", "draft_model", "num_draft_tokens", "prompt_lookup_ngram",
+]
+
+
+def server_settings(config: EventVLMConfig) -> Dict[str, Dict[str, Any]]:
+    """Model settings a server built from config applies to every client."""
+    settings = {
+        "detector": {
+            "model": config.detector.model,
+            "hazard_classes": config.detector.hazard_classes,
+        },
+        "vlm": {name: getattr(config.vlm, name) for name in SERVER_VLM_SETTINGS},
+    }
+    if "mock" in (config.detector.model, config.vlm.model):
+        settings["mock"] = asdict(config.mock)
+    # Compare in wire form (tuples as lists)
+    return json.loads(json.dumps(settings))
+
+
+def parse_address(address: str) -> Tuple[int, Union[str, Tuple[str, int]]]:
+    """
+    Parse "unix:///path/to.sock", "tcp://host:port" or "host:port".
+
+    Returns:
+        (socket family, socket address)
+    """
+    if address.startswith("unix://"):
+        return socket.AF_UNIX, address[len("unix://"):]
+    if address.startswith("tcp://"):
+        address = address[len("tcp://"):]
+    host, _, port = address.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+def _pack(obj: Any, blobs: List[bytes]) -> Any:
+    """JSON-compatible form of obj; arrays/tensors go to binary blobs."""
+    if isinstance(obj, torch.Tensor):
+        tensor = obj.detach().cpu()
+        if tensor.dtype == torch.bfloat16:
+            tensor = tensor.float()
+        packed = _pack(tensor.numpy(), blobs)
+        packed["tensor"] = True
+        return packed
+    if isinstance(obj, Image.Image):
+        obj = np.asarray(obj)
+    if isinstance(obj, np.ndarray):
+        array = np.ascontiguousarray(obj)
+        blobs.append(array.tobytes())
+        return {"__nd__": len(blobs) - 1, "dtype": array.dtype.str, "shape": list(array.shape)}
+    if is_dataclass(obj) and type(obj).__name__ in _DATACLASSES:
+        fields = {name: getattr(obj, name) for name in obj.__dataclass_fields__}
+        return {"__dc__": type(obj).__name__, "fields": _pack(fields, blobs)}
+    if isinstance(obj, dict):
+        return {key: _pack(value, blobs) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_pack(value, blobs) for value in obj]
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return obj
+
+
+def _unpack(obj: Any, blobs: List[bytes]) -> Any:
+    if isinstance(obj, dict):
+        if "__nd__" in obj:
+            array = np.frombuffer(blobs[obj["__nd__"]], dtype=np.dtype(obj["dtype"]))
+            array = array.reshape(obj["shape"]).copy()
+            return torch.from_numpy(array) if obj.get("tensor") else array
+        if "__dc__" in obj:
+            return _DATACLASSES[obj["__dc__"]](_unpack(obj["fields"], blobs))
+        return {key: _unpack(value, blobs) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [_unpack(value, blobs) for value in obj]
+    return obj
+
+
+def send_message(sock: socket.socket, message: Dict[str, Any]) -> None:
+    """Send a message: JSON header plus concatenated array buffers."""
+    blobs: List[bytes] = []
+    header = _pack(message, blobs)
+    header["__blobs__"] = [len(b) for b in blobs]
+    header_bytes = json.dumps(header).encode()
+    payload = b"".join(blobs)
+    sock.sendall(_FRAME.pack(len(header_bytes), len(payload)) + header_bytes + payload)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = sock.recv(min(size - len(buffer), 1 << 20))
+        if not chunk:
+            raise ConnectionError("Connection closed")
+        buffer.extend(chunk)
+    return bytes(buffer)
+
+
+def recv_message(sock: socket.socket) -> Dict[str, Any]:
+    """Receive a message sent by send_message."""
+    header_size, payload_size = _FRAME.unpack(_recv_exact(sock, _FRAME.size))
+    header = json.loads(_recv_exact(sock, header_size))
+    payload = _recv_exact(sock, payload_size)
+
+    blobs, offset = [], 0
+    for size in header.pop("__blobs__"):
+        blobs.append(payload[offset:offset + size])
+        offset += size
+    return _unpack(header, blobs)
+
+
+class _ReusableTCPServer(socketserver.ThreadingTCPServer):
+    """Threading TCP server that can rebind a port in TIME_WAIT after a restart."""
+    allow_reuse_address = True
+
+
+class ModelServer:
+    """
+    Long-lived holder of the Stage 1 detector and Stage 3 VLM.
+
+    Requests from all connections are served one at a time (the models
+    share one device); per-run detector thresholds and generation options
+    arrive with each call and only apply to it. Other model settings are
+    the server's (see server_settings); clients check them on connect.
+    """
+
+    def __init__(self, config: EventVLMConfig, address: str):
+        """
+        Args:
+            config: Configuration selecting and building the models
+            address: Listening address (unix:///path or tcp://127.0.0.1:port)
+        """
+        self.config = config
+        self.address = address
+        self.detector: Optional[BaseDetector] = None
+        self.vlm: Optional[LLaVAWrapper] = None
+        self.load_time = 0.0
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server: Optional[socketserver.BaseServer] = None
+
+        self._methods: Dict[str, Callable[..., Any]] = {
+            "info": self.info,
+            "reset": self.reset,
+            "detect": self.detect,
+            "preprocess": self.preprocess,
+            "encode_pixels": self.encode_pixels,
+            "encode": self.encode,
+            "encode_masked": self.encode_masked,
+            "image_newline": self.image_newline,
+            "generate": self.generate,
+            "generate_batch": self.generate_batch,
+        }
+
+    def load(self) -> None:
+        """Build the detector and VLM (once)."""
+        from src.pipeline.event_vlm import EventVLM
+
+        start = time.time()
+        pipeline = EventVLM(
+            config=self.config,
+            detector=self.config.detector.model,
+            vlm=self.config.vlm.model,
+            device=self.config.device
+        )
+        pipeline.initialize()
+        self.detector = pipeline.detector
+        self.vlm = pipeline.vlm
+        self.vlm.load_model()
+        self.load_time = time.time() - start
+        logger.info(f"Models loaded in {self.load_time:.1f}s")
+
+    def handle(self, method: str, params: Dict[str, Any]) -> Any:
+        """Run one request."""
+        if method not in self._methods:
+            raise ValueError(f"Unknown method: {method}")
+        with self._lock:
+            self.requests += 1
+            return self._methods[method](**params)
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "detector": self.config.detector.model,
+            "vlm": self.config.vlm.model,
+            "device": self.config.device,
+            "load_time": self.load_time,
+            "requests": self.requests,
+            "settings": server_settings(self.config),
+        }
+
+    def detect(
+        self,
+        frames: List[np.ndarray],
+        conf_threshold: Optional[float] = None,
+        iou_threshold: Optional[float] = None
+    ) -> List[DetectionResult]:
+        thresholds = {"conf_threshold": conf_threshold, "iou_threshold": iou_threshold}
+        with self._overrides(self.detector, thresholds, list(thresholds)):
+            return [self.detector.detect(frame) for frame in frames]
+
+    def preprocess(self, image: Any) -> torch.Tensor:
+        return self.vlm.preprocess_image(image)
+
+    def encode_pixels(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        return self.vlm.encode_pixels(pixel_values.to(self.vlm.device))
+
+    def encode(self, images: List[Any]) -> List[torch.Tensor]:
+        return [self.vlm.encode_image(image) for image in images]
+
+    def encode_masked(
+        self,
+        image: Any,
+        mask: torch.Tensor,
+        prune_after_layer: int = 0,
+        summary_weights: Optional[torch.Tensor] = None
+    ) -> torch.Tensor:
+        return self.vlm.encode_image_masked(image, mask, prune_after_layer, summary_weights)
+
+    def image_newline(self) -> Optional[torch.Tensor]:
+        return self.vlm.image_newline()
+
+    def reset(self, component: str) -> None:
+        """Restart the per-run state (e.g. seeded mock sequences) of "detector" or "vlm"."""
+        model = {"detector": self.detector, "vlm": self.vlm}[component]
+        if hasattr(model, "reset"):
+            model.reset()
+
+    def generate(
+        self,
+        image: Any,
+        prompt: str,
+        pruned_tokens: Optional[torch.Tensor] = None,
+        prompt_suffix: Optional[str] = None,
+        hazard_level: Optional[str] = None,
+        options: Optional[Dict[str, Any]] = None
+    ) -> VLMOutput:
+        if pruned_tokens is not None:
+            pruned_tokens = pruned_tokens.to(self.vlm.device)
+        with self._overrides(self.vlm, options, GENERATION_OPTIONS):
+            return self.vlm.generate(image, prompt, pruned_tokens, prompt_suffix, hazard_level)
+
+    def generate_batch(
+        self,
+        items: List[Any],
+        prompts: List[str],
+        hazard_levels: Optional[List[str]] = None,
+        options: Optional[Dict[str, Any]] = None
+    ) -> List[VLMOutput]:
+        items = [i.to(self.vlm.device) if isinstance(i, torch.Tensor) else i for i in items]
+        with self._overrides(self.vlm, options, GENERATION_OPTIONS):
+            return self.vlm.generate_batch(items, prompts, hazard_levels)
+
+    @staticmethod
+    @contextmanager
+    def _overrides(model: Any, values: Optional[Dict[str, Any]], allowed: List[str]):
+        """Set a call's attributes on a shared model, restoring them afterwards."""
+        values = {
+            name: value for name, value in (values or {}).items()
+            if name in allowed and value is not None
+        }
+        previous = {name: getattr(model, name) for name in values}
+        try:
+            for name, value in values.items():
+                setattr(model, name, value)
+            yield
+        finally:
+            for name, value in previous.items():
+                setattr(model, name, value)
+
+    def serve_forever(self) -> None:
+        """Load the models and serve until shutdown()."""
+        if self.vlm is None:
+            self.load()
+
+        server = self
+
+        class _Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                while True:
+                    try:
+                        request = recv_message(self.request)
+                    except ConnectionError:
+                        return
+                    try:
+                        response = {"result": server.handle(request["method"], request.get("params", {}))}
+                    except Exception as e:
+                        logger.exception(f"Request {request.get('method')} failed")
+                        response = {"error": f"{type(e).__name__}: {e}"}
+                    send_message(self.request, response)
+
+        family, address = parse_address(self.address)
+        if family == socket.AF_UNIX:
+            if os.path.exists(address):
+                os.unlink(address)
+            self._server = socketserver.ThreadingUnixStreamServer(address, _Handler)
+        else:
+            self._server = _ReusableTCPServer(address, _Handler)
+        self._server.daemon_threads = True
+
+        logger.info(f"Model server listening on {self.address}")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if family == socket.AF_UNIX and os.path.exists(address):
+                os.unlink(address)
+
+    def shutdown(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+
+
+class ModelClient:
+    """Blocking RPC client of a ModelServer (one connection, thread-safe)."""
+
+    def __init__(self, address: str, connect_timeout: float = 10.0):
+        """
+        Args:
+            address: Server address (unix:///path or tcp://host:port)
+            connect_timeout: Seconds to wait for the server to accept
+        """
+        self.address = address
+        self.connect_timeout = connect_timeout
+        self._sock: Optional[socket.socket] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> socket.socket:
+        family, address = parse_address(self.address)
+        deadline = time.time() + self.connect_timeout
+        while True:
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            try:
+                sock.connect(address)
+                return sock
+            except (FileNotFoundError, ConnectionRefusedError):
+                sock.close()
+                if time.time() > deadline:
+                    raise ConnectionError(f"No model server at {self.address}")
+                time.sleep(0.1)
+
+    def call(self, method: str, **params) -> Any:
+        """Call a server method and return its result."""
+        with self._lock:
+            if self._sock is None:
+                self._sock = self._connect()
+            send_message(self._sock, {"method": method, "params": params})
+            response = recv_message(self._sock)
+
+        if "error" in response:
+            raise RuntimeError(f"Model server error in {method}: {response['error']}")
+        return response["result"]
+
+    def validate(self, config: EventVLMConfig) -> Dict[str, Any]:
+        """
+        Check the server holds the models and settings of a run's config.
+
+        Args:
+            config: Configuration of the client run
+
+        Returns:
+            Server info
+
+        Raises:
+            ValueError: If any server_settings differ from the server's
+        """
+        info = self.call("info")
+        served = info.get("settings", {})
+        mismatches = [
+            f"{section}.{name} (server: {served.get(section, {}).get(name)!r}, run: {value!r})"
+            for section, values in server_settings(config).items()
+            for name, value in values.items()
+            if served.get(section, {}).get(name) != value
+        ]
+        if mismatches:
+            raise ValueError(
+                f"Model server at {self.address} does not match this run's config: "
+                + "; ".join(mismatches)
+            )
+        return info
+
+    def close(self) -> None:
+        with self._lock:
+            if self._sock is not None:
+                self._sock.close()
+                self._sock = None
+
+
+class RemoteDetector(BaseDetector):
+    """Detector proxy forwarding detect() to a ModelServer."""
+
+    def __init__(self, client: ModelClient, model_name: str = "remote", **kwargs):
+        super().__init__(**kwargs)
+        self.client = client
+        self.model_name = model_name
+
+    def load_model(self) -> None:
+        pass  # Loaded by the server
+
+    def reset(self) -> None:
+        """Restart the server detector's per-run state (shared by all its clients)."""
+        self.client.call("reset", component="detector")
+
+    def detect(self, image: np.ndarray) -> DetectionResult:
+        return self.detect_batch([image])[0]
+
+    def detect_batch(self, frames: List[np.ndarray]) -> List[DetectionResult]:
+        return self.client.call(
+            "detect",
+            frames=frames,
+            conf_threshold=self.conf_threshold,
+            iou_threshold=self.iou_threshold
+        )
+
+
+class RemoteVLM(LLaVAWrapper):
+    """
+    VLM proxy forwarding encoding and generation to a ModelServer.
+
+    Generation options of this run (token budgets, stopping rules) are
+    sent with each call. generate_stream delivers the caption as a single
+    chunk.
+    """
+
+    def __init__(self, client: ModelClient, **kwargs):
+        super().__init__(**kwargs)
+        self.client = client
+        self._loaded = True  # Loaded by the server
+
+    def load_model(self) -> None:
+        pass
+
+    def reset(self) -> None:
+        """Restart the server VLM's per-run state (shared by all its clients)."""
+        self.client.call("reset", component="vlm")
+
+    def _options(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in GENERATION_OPTIONS}
+
+    def preprocess_image(self, image: Union[np.ndarray, Image.Image, torch.Tensor]) -> torch.Tensor:
+        return self.client.call("preprocess", image=image)
+
+    def encode_pixels(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        return self.client.call("encode_pixels", pixel_values=pixel_values)
+
+    def encode_image(self, image: Union[np.ndarray, Image.Image]) -> torch.Tensor:
+        return self.client.call("encode", images=[image])[0]
+
+    def image_newline(self) -> Optional[torch.Tensor]:
+        return self.client.call("image_newline")
+
+    def encode_image_masked(
+        self,
+        image: Union[np.ndarray, Image.Image],
+        mask: torch.Tensor,
+        prune_after_layer: int = 0,
+        summary_weights: Optional[torch.Tensor] = None
+    ) -> torch.Tensor:
+        return self.client.call(
+            "encode_masked",
+            image=image,
+            mask=mask,
+            prune_after_layer=prune_after_layer,
+            summary_weights=summary_weights
+        )
+
+    def generate(
+        self,
+        image: Union[np.ndarray, Image.Image],
+        prompt: str,
+        pruned_tokens: Optional[torch.Tensor] = None,
+        prompt_suffix: Optional[str] = None,
+        hazard_level: Optional[str] = None
+    ) -> VLMOutput:
+        return self.client.call(
+            "generate",
+            image=image if pruned_tokens is None else None,
+            prompt=prompt,
+            pruned_tokens=pruned_tokens,
+            prompt_suffix=prompt_suffix,
+            hazard_level=hazard_level,
+            options=self._options()
+        )
+
+    def generate_batch(
+        self,
+        images_or_features: List[Union[np.ndarray, Image.Image, torch.Tensor]],
+        prompts: List[str],
+        hazard_levels: Optional[List[str]] = None
+    ) -> List[VLMOutput]:
+        return self.client.call(
+            "generate_batch",
+            items=images_or_features,
+            prompts=prompts,
+            hazard_levels=hazard_levels,
+            options=self._options()
+        )
+
+    def generate_stream(
+        self,
+        image: Union[np.ndarray, Image.Image],
+        prompt: str,
+        pruned_tokens: Optional[torch.Tensor] = None,
+        prompt_suffix: Optional[str] = None,
+        hazard_level: Optional[str] = None
+    ) -> Iterator[StreamChunk]:
+        output = self.generate(image, prompt, pruned_tokens, prompt_suffix, hazard_level)
+        yield StreamChunk(text=output.caption, num_tokens=output.generated_tokens, output=output)
+
+    def submit(
+        self,
+        image: Union[np.ndarray, Image.Image],
+        prompt: str,
+        pruned_tokens: Optional[torch.Tensor] = None,
+        hazard_level: Optional[str] = None
+    ) -> Future:
+        future: Future = Future()
+        future.set_result(self.generate(image, prompt, pruned_tokens, hazard_level=hazard_level))
+        return future
+
+
+def main():
+    from src.config import load_config
+
+    parser = argparse.ArgumentParser(description="Serve Event-VLM models to local runs")
+    parser.add_argument("--config", type=str, default=None, help="Path to config file")
+    parser.add_argument(
+        "--address",
+        type=str,
+        default="unix:///tmp/event-vlm.sock",
+        help="unix:///path/to.sock or tcp://127.0.0.1:PORT"
+    )
+    parser.add_argument("--detector", type=str, default=None, help="Override detector model")
+    parser.add_argument("--vlm", type=str, default=None, help="Override VLM model")
+    parser.add_argument("--device", type=str, default=None, help="Device to use")
+    args = parser.parse_args()
+
+    config = load_config(args.config) if args.config else EventVLMConfig()
+    if args.detector:
+        config.detector.model = args.detector
+    if args.vlm:
+        config.vlm.model = args.vlm
+    if args.device:
+        config.device = args.device
+    config.server = None
+
+    ModelServer(config, args.address).serve_forever()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
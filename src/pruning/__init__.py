@@ -1,6 +1,14 @@
 """Pruning module for Stage 2: Knowledge-Guided Token Pruning."""
 
-from src.pruning.token_pruner import TokenPruner
-from src.pruning.adaptive_dilation import AdaptiveDilation
+from src.utils.lazy import lazy_getattr
 
-__all__ = ["TokenPruner", "AdaptiveDilation"]
+# Public names -> defining module, imported on first attribute access so
+# importing the package does not load torch
+_LAZY_IMPORTS = {
+    "TokenPruner": "src.pruning.token_pruner",
+    "AnyResTokenPruner": "src.pruning.token_pruner",
+    "AdaptiveDilation": "src.pruning.adaptive_dilation",
+}
+
+__all__ = list(_LAZY_IMPORTS)
+__getattr__ = lazy_getattr(__name__, globals(), _LAZY_IMPORTS)
@@ -0,0 +1,260 @@
+"""
+Shape-variance estimation for Adaptive Dilation.
+Streams annotation boxes and computes per-class shape statistics in a single pass.
+"""
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+import json
+import logging
+import math
+
+from src.pruning.adaptive_dilation import AdaptiveDilation
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RunningStats:
+    """Welford single-pass mean/variance accumulator."""
+    count: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+
+    def update(self, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self) -> float:
+        """Sample variance (0 for fewer than two samples)."""
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+
+@dataclass
+class ClassShapeStats:
+    """Running shape statistics for one class."""
+    log_aspect: RunningStats = field(default_factory=RunningStats)
+    log_area: RunningStats = field(default_factory=RunningStats)
+    width: RunningStats = field(default_factory=RunningStats)
+    height: RunningStats = field(default_factory=RunningStats)
+
+    @property
+    def count(self) -> int:
+        return self.log_aspect.count
+
+
+class ShapeVarianceEstimator:
+    """
+    Per-class shape-variance estimator.
+
+    Boxes are reduced to log aspect ratio log(w / h) and log area log(w * h).
+    Both are invariant to a constant image rescale, so normalized YOLO boxes
+    from a fixed camera give the same variances as pixel boxes. The
+    normalized shape variance used by AdaptiveDilation is
+
+        σ_shape = 1 - exp(-(Var[log aspect] + λ_area * Var[log area]))
+
+    which lies in [0, 1) and grows with intraclass shape spread.
+    """
+
+    def __init__(self, area_weight: float = 0.0, min_count: int = 10):
+        """
+        Args:
+            area_weight: Weight λ_area of the log-area variance (scale spread
+                is mostly camera distance, so it is excluded by default)
+            min_count: Minimum boxes for a class to get an estimate
+        """
+        self.area_weight = area_weight
+        self.min_count = min_count
+        self.stats: Dict[str, ClassShapeStats] = {}
+
+    def update(self, class_name: str, width: float, height: float) -> None:
+        """
+        Add one box.
+
+        Args:
+            class_name: Class name
+            width: Box width (normalized to image width)
+            height: Box height (normalized to image height)
+        """
+        if width <= 0 or height <= 0:
+            return
+
+        stats = self.stats.setdefault(class_name.lower(), ClassShapeStats())
+        stats.log_aspect.update(math.log(width / height))
+        stats.log_area.update(math.log(width * height))
+        stats.width.update(width)
+        stats.height.update(height)
+
+    def update_from(self, boxes: Iterator[Tuple[str, float, float]]) -> int:
+        """Consume an iterator of (class_name, width, height); returns box count."""
+        num_boxes = 0
+        for class_name, width, height in boxes:
+            self.update(class_name, width, height)
+            num_boxes += 1
+        return num_boxes
+
+    def shape_variance(self, class_name: str) -> float:
+        """Normalized shape variance σ_shape for a class."""
+        stats = self.stats[class_name.lower()]
+        spread = stats.log_aspect.variance + self.area_weight * stats.log_area.variance
+        return 1.0 - math.exp(-spread)
+
+    def estimate(self) -> Dict[str, float]:
+        """Shape variance for every class with at least min_count boxes."""
+        return {
+            name: round(self.shape_variance(name), 4)
+            for name, stats in sorted(self.stats.items())
+            if stats.count >= self.min_count
+        }
+
+    def token_impact(
+        self,
+        reference_variance: Optional[Dict[str, float]] = None,
+        image_size: int = 336,
+        patch_size: int = 14,
+        alpha_base: float = 1.2,
+        beta: float = 0.5
+    ) -> Dict[str, Dict[str, float]]:
+        """
+        Estimate kept tokens per box with the current vs estimated variance.
+
+        The mean box of each class is dilated with
+        α = α_base * (1 + β * σ) and rasterized onto the patch grid.
+
+        Args:
+            reference_variance: Currently configured shape variances
+                (merged over AdaptiveDilation defaults)
+            image_size: Input image size
+            patch_size: ViT patch size
+            alpha_base: Base dilation factor
+            beta: Adaptive dilation coefficient
+
+        Returns:
+            Dict of class name to impact statistics
+        """
+        current = AdaptiveDilation(alpha_base, beta, reference_variance)
+        side = image_size // patch_size
+
+        def tokens_per_box(width: float, height: float, sigma: float) -> float:
+            alpha = alpha_base * (1 + beta * sigma)
+            cols = min(math.ceil(min(1.0, width * alpha) * side) + 1, side)
+            rows = min(math.ceil(min(1.0, height * alpha) * side) + 1, side)
+            return float(rows * cols)
+
+        impact = {}
+        for name, sigma in self.estimate().items():
+            stats = self.stats[name]
+            sigma_current = current.get_shape_variance(name)
+            before = tokens_per_box(stats.width.mean, stats.height.mean, sigma_current)
+            after = tokens_per_box(stats.width.mean, stats.height.mean, sigma)
+            impact[name] = {
+                "count": stats.count,
+                "aspect_variance": stats.log_aspect.variance,
+                "area_variance": stats.log_area.variance,
+                "shape_variance_current": sigma_current,
+                "shape_variance": sigma,
+                "tokens_current": before,
+                "tokens_estimated": after,
+                "tokens_delta": after - before,
+            }
+        return impact
+
+    def to_yaml(self, impact: Optional[Dict[str, Dict[str, float]]] = None) -> str:
+        """Render a `pruning.shape_variance` YAML block ready to merge into a config."""
+        import yaml
+
+        lines = ["# Estimated by ShapeVarianceEstimator (Welford, single pass)"]
+        for name, row in (impact or {}).items():
+            lines.append(
+                f"# {name}: n={row['count']}, tokens/box "
+                f"{row['tokens_current']:.0f} -> {row['tokens_estimated']:.0f} "
+                f"({row['tokens_delta']:+.0f})"
+            )
+
+        block = yaml.safe_dump(
+            {"pruning": {"shape_variance": self.estimate()}},
+            default_flow_style=False,
+            sort_keys=False
+        )
+        return "\n".join(lines) + "\n" + block
+
+
+def load_class_names(path: str) -> List[str]:
+    """Load class names from a YOLO data.yaml (`names`) or a one-per-line text file."""
+    path = Path(path)
+    if path.suffix in (".yaml", ".yml"):
+        import yaml
+
+        with open(path) as f:
+            names = yaml.safe_load(f)["names"]
+        if isinstance(names, dict):
+            return [names[k] for k in sorted(names)]
+        return list(names)
+
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def iter_yolo_boxes(
+    label_dir: str,
+    class_names: List[str]
+) -> Iterator[Tuple[str, float, float]]:
+    """
+    Stream boxes from YOLO label files (`class cx cy w h`, normalized).
+
+    Files are read line by line, so memory stays bounded by a single line.
+    """
+    for label_file in sorted(Path(label_dir).rglob("*.txt")):
+        with open(label_file) as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 5:
+                    continue
+                class_id = int(parts[0])
+                if class_id >= len(class_names):
+                    continue
+                yield class_names[class_id], float(parts[3]), float(parts[4])
+
+
+def _iter_json_items(path: str, prefix: str) -> Iterator[dict]:
+    """Stream items of a top-level JSON array with ijson, else load the file."""
+    try:
+        import ijson
+    except ImportError:
+        logger.warning("ijson not installed; loading COCO file into memory")
+        with open(path) as f:
+            yield from json.load(f).get(prefix, [])
+        return
+
+    with open(path, "rb") as f:
+        yield from ijson.items(f, f"{prefix}.item", use_float=True)
+
+
+def iter_coco_boxes(annotation_file: str) -> Iterator[Tuple[str, float, float]]:
+    """
+    Stream boxes from a COCO annotation file (`bbox` = [x, y, w, h] pixels).
+
+    Categories and image sizes are indexed first; annotations are then
+    streamed and normalized by their image size.
+    """
+    categories = {
+        item["id"]: item["name"]
+        for item in _iter_json_items(annotation_file, "categories")
+    }
+    image_sizes = {
+        item["id"]: (item["width"], item["height"])
+        for item in _iter_json_items(annotation_file, "images")
+    }
+
+    for ann in _iter_json_items(annotation_file, "annotations"):
+        name = categories.get(ann.get("category_id"))
+        size = image_sizes.get(ann.get("image_id"))
+        if name is None or size is None:
+            continue
+        _, _, width, height = ann["bbox"]
+        yield name, float(width) / size[0], float(height) / size[1]
@@ -23,10 +23,17 @@ class PruningResult:
     num_kept: int
     num_total: int
     reduction_ratio: float
+    num_summary: int = 0         # Background summary tokens appended after kept tokens
+    num_newline: int = 0         # LLaVA-1.6 image_newline row separators
     
     @property
     def num_pruned(self) -> int:
         return self.num_total - self.num_kept
+    
+    @property
+    def tokens_used(self) -> int:
+        """Visual tokens passed to the VLM (kept + summary + row separators)."""
+        return self.num_kept + self.num_summary + self.num_newline
 
 
 class TokenPruner(nn.Module):
@@ -35,8 +42,13 @@ class TokenPruner(nn.Module):
     
     Uses bounding box priors from the detector to create binary masks
     for preserving only relevant visual tokens.
+    
+    Optionally, the discarded patches are pooled into a small fixed number
+    of background summary tokens so the VLM keeps coarse scene context.
     """
     
+    SUMMARY_POOLING_MODES = ("spatial", "attention")
+    
     def __init__(
         self,
         image_size: int = 336,
@@ -45,7 +57,9 @@ class TokenPruner(nn.Module):
         beta: float = 0.5,
         min_tokens: int = 64,
         preserve_cls_token: bool = True,
-        shape_variance: Optional[Dict[str, float]] = None
+        shape_variance: Optional[Dict[str, float]] = None,
+        num_summary_tokens: int = 0,
+        summary_pooling: str = "spatial"
     ):
         """
         Args:
@@ -56,6 +70,8 @@ class TokenPruner(nn.Module):
             min_tokens: Minimum tokens to preserve
             preserve_cls_token: Whether to always preserve CLS token
             shape_variance: Dict of class name to shape variance
+            num_summary_tokens: Number of background summary tokens (0 disables)
+            summary_pooling: Pooling for summary tokens (spatial, attention)
         """
         super().__init__()
         
@@ -66,6 +82,14 @@ class TokenPruner(nn.Module):
         self.min_tokens = min_tokens
         self.preserve_cls_token = preserve_cls_token
         
+        if summary_pooling not in self.SUMMARY_POOLING_MODES:
+            raise ValueError(
+                f"Unknown summary pooling: {summary_pooling}. "
+                f"Available: {list(self.SUMMARY_POOLING_MODES)}"
+            )
+        self.num_summary_tokens = num_summary_tokens
+        self.summary_pooling = summary_pooling
+        
         # Adaptive dilation module
         self.adaptive_dilation = AdaptiveDilation(
             alpha_base=alpha_base,
@@ -73,20 +97,20 @@ class TokenPruner(nn.Module):
             shape_variance=shape_variance
         )
     
-    def bbox_to_patch_indices(
-        self,
+    @staticmethod
+    def dilate_bbox(
         bbox: Tuple[float, float, float, float],
         dilation: float = 1.0
-    ) -> List[int]:
+    ) -> Tuple[float, float, float, float]:
         """
-        Convert normalized bounding box to patch indices.
+        Dilate a normalized bounding box around its center.
         
         Args:
             bbox: (x1, y1, x2, y2) normalized coordinates
             dilation: Dilation factor for expanding bbox
             
         Returns:
-            List of patch indices covered by the (dilated) bbox
+            Dilated bbox clamped to [0, 1]
         """
         x1, y1, x2, y2 = bbox
         
@@ -99,16 +123,54 @@ class TokenPruner(nn.Module):
         h_dilated = h * dilation
         
         # New bbox coordinates (clamped to [0, 1])
-        x1_d = max(0, cx - w_dilated / 2)
-        y1_d = max(0, cy - h_dilated / 2)
-        x2_d = min(1, cx + w_dilated / 2)
-        y2_d = min(1, cy + h_dilated / 2)
+        return (
+            max(0, cx - w_dilated / 2),
+            max(0, cy - h_dilated / 2),
+            min(1, cx + w_dilated / 2),
+            min(1, cy + h_dilated / 2)
+        )
+    
+    @staticmethod
+    def grid_cell_range(
+        bbox: Tuple[float, float, float, float],
+        rows: int,
+        cols: int
+    ) -> Tuple[int, int, int, int]:
+        """
+        Convert a normalized bbox to a half-open cell range on a rows x cols grid.
         
+        Returns:
+            (row_start, row_end, col_start, col_end)
+        """
+        x1, y1, x2, y2 = bbox
+        return (
+            int(y1 * rows),
+            min(int(y2 * rows) + 1, rows),
+            int(x1 * cols),
+            min(int(x2 * cols) + 1, cols)
+        )
+    
+    def bbox_to_patch_indices(
+        self,
+        bbox: Tuple[float, float, float, float],
+        dilation: float = 1.0
+    ) -> List[int]:
+        """
+        Convert normalized bounding box to patch indices.
+        
+        Args:
+            bbox: (x1, y1, x2, y2) normalized coordinates
+            dilation: Dilation factor for expanding bbox
+            
+        Returns:
+            List of patch indices covered by the (dilated) bbox
+        """
         # Convert to patch grid coordinates
-        p1_x = int(x1_d * self.num_patches_side)
-        p1_y = int(y1_d * self.num_patches_side)
-        p2_x = min(int(x2_d * self.num_patches_side) + 1, self.num_patches_side)
-        p2_y = min(int(y2_d * self.num_patches_side) + 1, self.num_patches_side)
+        p1_y, p2_y, p1_x, p2_x = self.grid_cell_range(
+            self.dilate_bbox(bbox, dilation),
+            self.num_patches_side,
+            self.num_patches_side
+        )
         
         # Generate patch indices (row-major order)
         indices = []
@@ -150,11 +212,141 @@ class TokenPruner(nn.Module):
         
         return mask
     
+    def keep_mask(
+        self,
+        detections: List[Detection],
+        device: torch.device = torch.device("cpu")
+    ) -> torch.Tensor:
+        """
+        Create the final keep mask, applying the min_tokens safety fallback.
+        
+        Args:
+            detections: List of Detection objects
+            device: Target device
+            
+        Returns:
+            Binary mask [L] where L = num_patches
+        """
+        mask = self.create_mask(detections, device)
+        
+        # If not enough tokens, keep all (safety fallback)
+        if mask.sum() < self.min_tokens:
+            mask = torch.ones_like(mask)
+        
+        return mask
+    
+    def summary_region_ids(
+        self,
+        num_regions: int,
+        device: torch.device = torch.device("cpu")
+    ) -> torch.Tensor:
+        """
+        Assign every patch to one of `num_regions` coarse spatial regions.
+        
+        The patch grid is split into rows x cols regions with
+        rows * cols == num_regions (rows is the largest divisor of
+        num_regions not exceeding its square root).
+        
+        Args:
+            num_regions: Number of coarse regions
+            device: Target device
+            
+        Returns:
+            Region id per patch [L] (row-major)
+        """
+        rows = max(d for d in range(1, math.isqrt(num_regions) + 1) if num_regions % d == 0)
+        cols = num_regions // rows
+        
+        coords = torch.arange(self.num_patches_side, device=device)
+        row_ids = coords * rows // self.num_patches_side
+        col_ids = coords * cols // self.num_patches_side
+        
+        return (row_ids[:, None] * cols + col_ids[None, :]).flatten()
+    
+    def summary_weights(
+        self,
+        mask: torch.Tensor,
+        num_summary_tokens: int,
+        attention_scores: Optional[torch.Tensor] = None
+    ) -> torch.Tensor:
+        """
+        Pooling weights of the background summary tokens.
+        
+        Each summary token averages the discarded patches of one coarse
+        region. With attention pooling the average is weighted by
+        softmax(attention_scores) within the region. Regions whose patches
+        were all kept fall back to the mean of all discarded patches so the
+        number of summary tokens stays fixed.
+        
+        Args:
+            mask: Binary keep mask [L]
+            num_summary_tokens: Number of summary tokens to produce
+            attention_scores: Optional per-patch scores [B, L] or [L]
+                (e.g. CLS attention), used by attention pooling
+            
+        Returns:
+            Row-normalized weights [B, num_summary_tokens, L] (B = 1
+            without attention scores)
+        """
+        device = mask.device
+        
+        region_ids = self.summary_region_ids(num_summary_tokens, device)
+        discarded = (~mask.bool()).float()
+        
+        # Assignment matrix [K, L]: region membership of discarded patches
+        regions = torch.arange(num_summary_tokens, device=device)
+        assign = (region_ids[None, :] == regions[:, None]).float() * discarded[None, :]
+        
+        # Empty regions fall back to all discarded patches
+        empty = assign.sum(dim=1) == 0
+        assign[empty] = discarded
+        assign = assign.unsqueeze(0)
+        
+        if self.summary_pooling == "attention" and attention_scores is not None:
+            scores = attention_scores.to(device=device, dtype=torch.float32)
+            if scores.dim() == 1:
+                scores = scores.unsqueeze(0)
+            weights = torch.exp(scores - scores.max(dim=-1, keepdim=True).values)
+            assign = assign * weights[:, None, :]
+        
+        return assign / assign.sum(dim=-1, keepdim=True).clamp(min=1e-8)
+    
+    def pool_summary_tokens(
+        self,
+        patch_tokens: torch.Tensor,
+        mask: torch.Tensor,
+        num_summary_tokens: int,
+        attention_scores: Optional[torch.Tensor] = None
+    ) -> torch.Tensor:
+        """
+        Pool discarded patch tokens into background summary tokens.
+        
+        Args:
+            patch_tokens: Patch tokens [B, L, D] (without CLS)
+            mask: Binary keep mask [L]
+            num_summary_tokens: Number of summary tokens to produce
+            attention_scores: Optional per-patch scores [B, L] or [L]
+                (e.g. CLS attention), used by attention pooling
+            
+        Returns:
+            Summary tokens [B, num_summary_tokens, D] (see summary_weights)
+        """
+        B = patch_tokens.shape[0]
+        weights = self.summary_weights(
+            mask.to(patch_tokens.device),
+            num_summary_tokens,
+            attention_scores=attention_scores
+        )
+        
+        return torch.bmm(weights.expand(B, -1, -1).to(patch_tokens.dtype), patch_tokens)
+    
     def prune(
         self,
         tokens: torch.Tensor,
         detections: List[Detection],
-        return_mask: bool = False
+        return_mask: bool = False,
+        num_summary_tokens: Optional[int] = None,
+        attention_scores: Optional[torch.Tensor] = None
     ) -> Tuple[torch.Tensor, Optional[PruningResult]]:
         """
         Prune visual tokens based on detector priors.
@@ -163,10 +355,16 @@ class TokenPruner(nn.Module):
             tokens: Visual tokens [B, L, D] or [L, D]
             detections: List of Detection objects
             return_mask: Whether to return pruning result
+            num_summary_tokens: Override for the number of background
+                summary tokens appended after the kept tokens
+            attention_scores: Optional per-patch scores for attention pooling
             
         Returns:
             Pruned tokens and optional PruningResult
         """
+        if num_summary_tokens is None:
+            num_summary_tokens = self.num_summary_tokens
+        
         # Handle batch dimension
         if tokens.dim() == 2:
             tokens = tokens.unsqueeze(0)
@@ -186,18 +384,25 @@ class TokenPruner(nn.Module):
             cls_token = None
             patch_tokens = tokens
         
-        # Create mask from detections
-        mask = self.create_mask(detections, device)
-        
-        # Ensure minimum tokens
-        if mask.sum() < self.min_tokens:
-            # If not enough tokens, keep all (safety fallback)
-            mask = torch.ones_like(mask)
+        # Create mask from detections (with minimum-token fallback)
+        mask = self.keep_mask(detections, device)
         
         # Gather kept tokens
         kept_indices = mask.nonzero(as_tuple=True)[0]
         pruned_tokens = patch_tokens[:, kept_indices, :]
         
+        # Append background summary tokens for the discarded patches
+        num_summary = 0
+        if num_summary_tokens > 0 and not mask.all():
+            summary_tokens = self.pool_summary_tokens(
+                patch_tokens,
+                mask,
+                num_summary_tokens,
+                attention_scores=attention_scores
+            )
+            pruned_tokens = torch.cat([pruned_tokens, summary_tokens], dim=1)
+            num_summary = num_summary_tokens
+        
         # Add CLS token back
         if has_cls and self.preserve_cls_token:
             pruned_tokens = torch.cat([cls_token, pruned_tokens], dim=1)
@@ -212,7 +417,8 @@ class TokenPruner(nn.Module):
                 kept_indices=kept_indices,
                 num_kept=len(kept_indices),
                 num_total=self.num_patches,
-                reduction_ratio=1.0 - len(kept_indices) / self.num_patches
+                reduction_ratio=1.0 - (len(kept_indices) + num_summary) / self.num_patches,
+                num_summary=num_summary
             )
             return pruned_tokens, result
         
@@ -283,3 +489,342 @@ class TokenPruner(nn.Module):
             vis = cv2.addWeighted(image_resized, 0.6, vis, 0.4, 0)
         
         return vis
+
+
+@dataclass
+class AnyResLayout:
+    """Tile layout of a LLaVA-1.6 anyres encoding."""
+    rows: int                                     # Tile rows
+    cols: int                                     # Tile columns
+    resolution: Tuple[int, int]                   # Selected (width, height) canvas
+    content: Tuple[float, float, float, float]    # Frame region in the canvas (normalized x1, y1, x2, y2)
+    original_size: Optional[Tuple[int, int]] = None  # Frame (width, height)
+    
+    @property
+    def num_tiles(self) -> int:
+        return self.rows * self.cols
+
+
+class AnyResTokenPruner(TokenPruner):
+    """
+    Token pruner for LLaVA-1.6 anyres encodings.
+    
+    Input is the vision-tower output before LLaVA-1.6's spatial_unpad
+    packing: the base image (the frame resized to one tile) followed by
+    rows x cols high-resolution tiles in row-major order, each with its own
+    square patch grid. Detection boxes are dilated in frame coordinates,
+    mapped onto the base grid directly and onto the padded anyres canvas
+    for the tiles.
+    
+    Output follows the packed LLaVA-1.6 sequence: the kept base tokens,
+    then the kept tile tokens in canvas row-major order with the padding
+    rows/columns removed (unpad_image) and `image_newline` after every
+    canvas row that keeps a token. With a full mask this is exactly the
+    sequence LLaVA-1.6 builds.
+    """
+    
+    # LLaVA-1.6 image_grid_pinpoints as (width, height)
+    DEFAULT_GRID_PINPOINTS = [
+        (336, 672),
+        (672, 336),
+        (672, 672),
+        (1008, 336),
+        (336, 1008),
+    ]
+    
+    def __init__(
+        self,
+        grid_pinpoints: Optional[List[Tuple[int, int]]] = None,
+        **kwargs
+    ):
+        """
+        Args:
+            grid_pinpoints: Candidate anyres canvas resolutions (width, height)
+            **kwargs: TokenPruner arguments
+        """
+        super().__init__(**kwargs)
+        self.grid_pinpoints = [tuple(p) for p in (grid_pinpoints or self.DEFAULT_GRID_PINPOINTS)]
+    
+    def select_best_resolution(self, original_size: Tuple[int, int]) -> Tuple[int, int]:
+        """
+        Pick the canvas resolution LLaVA-1.6 uses for a frame (mirrors llava.mm_utils).
+        
+        Args:
+            original_size: Frame (width, height)
+            
+        Returns:
+            Selected (width, height)
+        """
+        original_width, original_height = original_size
+        best_fit = self.grid_pinpoints[0]
+        max_effective = 0
+        min_wasted = float("inf")
+        
+        for width, height in self.grid_pinpoints:
+            scale = min(width / original_width, height / original_height)
+            downscaled = int(original_width * scale) * int(original_height * scale)
+            effective = min(downscaled, original_width * original_height)
+            wasted = width * height - effective
+            
+            if effective > max_effective or (effective == max_effective and wasted < min_wasted):
+                max_effective = effective
+                min_wasted = wasted
+                best_fit = (width, height)
+        
+        return best_fit
+    
+    def get_layout(self, original_size: Tuple[int, int]) -> AnyResLayout:
+        """
+        Compute tile grid and padded content region for a frame.
+        
+        Args:
+            original_size: Frame (width, height)
+        """
+        original_width, original_height = original_size
+        target_width, target_height = self.select_best_resolution(original_size)
+        
+        # Aspect-preserving resize + center padding (resize_and_pad_image)
+        scale_w = target_width / original_width
+        scale_h = target_height / original_height
+        if scale_w < scale_h:
+            new_width = target_width
+            new_height = min(math.ceil(original_height * scale_w), target_height)
+        else:
+            new_height = target_height
+            new_width = min(math.ceil(original_width * scale_h), target_width)
+        
+        paste_x = (target_width - new_width) // 2
+        paste_y = (target_height - new_height) // 2
+        
+        return AnyResLayout(
+            rows=target_height // self.image_size,
+            cols=target_width // self.image_size,
+            resolution=(target_width, target_height),
+            content=(
+                paste_x / target_width,
+                paste_y / target_height,
+                (paste_x + new_width) / target_width,
+                (paste_y + new_height) / target_height
+            ),
+            original_size=(original_width, original_height)
+        )
+    
+    def unpad_bounds(self, layout: AnyResLayout) -> Tuple[int, int, int, int]:
+        """
+        Canvas patch rows/columns LLaVA-1.6 keeps after unpadding (mirrors llava unpad_image).
+        
+        Args:
+            layout: AnyResLayout of the frame
+            
+        Returns:
+            Half-open (row_start, row_end, col_start, col_end) on the canvas patch grid
+        """
+        height = layout.rows * self.num_patches_side
+        width = layout.cols * self.num_patches_side
+        
+        if layout.original_size is None:
+            cx1, cy1, cx2, cy2 = layout.content
+            return round(cy1 * height), round(cy2 * height), round(cx1 * width), round(cx2 * width)
+        
+        original_width, original_height = layout.original_size
+        if original_width / original_height > width / height:
+            new_height = int(original_height * (width / original_width))
+            padding = (height - new_height) // 2
+            return padding, height - padding, 0, width
+        
+        new_width = int(original_width * (height / original_height))
+        padding = (width - new_width) // 2
+        return 0, height, padding, width - padding
+    
+    def packed_order(
+        self,
+        mask: torch.Tensor,
+        layout: AnyResLayout,
+        newline: bool = True
+    ) -> torch.Tensor:
+        """
+        Kept tokens in packed LLaVA-1.6 order.
+        
+        Args:
+            mask: Binary mask over the vision-tower sequence [(1 + T) * L]
+            layout: AnyResLayout of the frame
+            newline: Whether to emit a row separator after each canvas row
+                that keeps a token
+            
+        Returns:
+            Indices into the vision-tower sequence; -1 marks image_newline
+        """
+        side = self.num_patches_side
+        device = mask.device
+        r1, r2, c1, c2 = self.unpad_bounds(layout)
+        
+        # Vision-tower index of every canvas patch (tiles are row-major)
+        grid = torch.arange(layout.num_tiles * self.num_patches, device=device) + self.num_patches
+        grid = grid.view(layout.rows, layout.cols, side, side).permute(0, 2, 1, 3)
+        grid = grid.reshape(layout.rows * side, layout.cols * side)[r1:r2, c1:c2]
+        
+        keep = mask[grid]
+        separators = torch.full((grid.shape[0], 1), -1, dtype=grid.dtype, device=device)
+        row_kept = keep.any(dim=1, keepdim=True) & newline
+        tiles = torch.cat([grid, separators], dim=1)[torch.cat([keep, row_kept], dim=1)]
+        
+        base = mask[:self.num_patches].nonzero(as_tuple=True)[0]
+        return torch.cat([base, tiles])
+    
+    def create_tiled_mask(
+        self,
+        detections: List[Detection],
+        layout: AnyResLayout,
+        device: torch.device = torch.device("cpu")
+    ) -> torch.Tensor:
+        """
+        Create binary mask over the base image and all tiles.
+        
+        Args:
+            detections: List of Detection objects
+            layout: AnyResLayout of the frame
+            device: Target device
+            
+        Returns:
+            Binary mask [(1 + num_tiles) * num_patches]
+        """
+        side = self.num_patches_side
+        grid_rows = layout.rows * side
+        grid_cols = layout.cols * side
+        cx1, cy1, cx2, cy2 = layout.content
+        
+        base_mask = self.create_mask(detections, device)
+        canvas = torch.zeros(grid_rows, grid_cols, dtype=torch.bool, device=device)
+        
+        for det in detections:
+            dilation = self.adaptive_dilation.get_dilation(det.class_name)
+            x1, y1, x2, y2 = self.dilate_bbox(det.bbox, dilation)
+            
+            # Frame coordinates -> padded canvas coordinates
+            box = (
+                cx1 + x1 * (cx2 - cx1),
+                cy1 + y1 * (cy2 - cy1),
+                cx1 + x2 * (cx2 - cx1),
+                cy1 + y2 * (cy2 - cy1)
+            )
+            r1, r2, c1, c2 = self.grid_cell_range(box, grid_rows, grid_cols)
+            canvas[r1:r2, c1:c2] = True
+        
+        # [rows*S, cols*S] -> [rows, cols, S, S] -> row-major tiles
+        tiles = canvas.view(layout.rows, side, layout.cols, side).permute(0, 2, 1, 3)
+        
+        return torch.cat([base_mask, tiles.reshape(-1)])
+    
+    def prune(
+        self,
+        tokens: torch.Tensor,
+        detections: List[Detection],
+        return_mask: bool = False,
+        num_summary_tokens: Optional[int] = None,
+        attention_scores: Optional[torch.Tensor] = None,
+        original_size: Optional[Tuple[int, int]] = None,
+        layout: Optional[AnyResLayout] = None,
+        image_newline: Optional[torch.Tensor] = None
+    ) -> Tuple[torch.Tensor, Optional[PruningResult]]:
+        """
+        Prune an anyres visual sequence based on detector priors.
+        
+        Background summary tokens are pooled from the base image grid,
+        which covers the whole frame, and appended after the kept tokens.
+        
+        Args:
+            tokens: Visual tokens [B, (1 + T) * L, D], [(1 + T) * L, D]
+                or per-tile [1 + T, L, D]
+            detections: List of Detection objects
+            return_mask: Whether to return pruning result
+            num_summary_tokens: Override for the number of background
+                summary tokens appended after the kept tokens
+            attention_scores: Optional per-patch scores for attention pooling
+                (base grid [L] or [B, L] on the tiled path)
+            original_size: Frame (width, height), used to derive the layout
+            layout: Precomputed AnyResLayout (overrides original_size)
+            image_newline: LLaVA-1.6 row separator [D] in the token space
+                (None: no separators)
+            
+        Returns:
+            Pruned tokens [B, K, D] (or [K, D]) in packed order and
+            optional PruningResult (kept_indices in packed order)
+        """
+        if layout is None and original_size is None:
+            # Single-tile sequence: behave like the square-grid pruner
+            return super().prune(
+                tokens,
+                detections,
+                return_mask=return_mask,
+                num_summary_tokens=num_summary_tokens,
+                attention_scores=attention_scores
+            )
+        
+        if num_summary_tokens is None:
+            num_summary_tokens = self.num_summary_tokens
+        
+        layout = layout or self.get_layout(original_size)
+        num_total = (1 + layout.num_tiles) * self.num_patches
+        
+        squeeze_output = False
+        if tokens.dim() == 2:
+            tokens = tokens.unsqueeze(0)
+            squeeze_output = True
+        elif tokens.shape[0] == 1 + layout.num_tiles and tokens.shape[1] == self.num_patches:
+            tokens = tokens.reshape(1, num_total, tokens.shape[-1])
+        
+        if tokens.shape[1] != num_total:
+            raise ValueError(
+                f"Expected {num_total} anyres tokens for a {layout.rows}x{layout.cols} "
+                f"tile grid, got {tokens.shape[1]}"
+            )
+        
+        mask = self.create_tiled_mask(detections, layout, tokens.device)
+        
+        # Safety fallback, as in the single-grid pruner
+        if mask.sum() < self.min_tokens:
+            mask = torch.ones_like(mask)
+        
+        # Pack as LLaVA-1.6 does; padding patches are dropped by unpadding
+        order = self.packed_order(mask, layout, newline=image_newline is not None)
+        separators = order < 0
+        kept_indices = order[~separators]
+        mask = torch.zeros_like(mask)
+        mask[kept_indices] = True
+        
+        if image_newline is not None:
+            newline = image_newline.to(device=tokens.device, dtype=tokens.dtype)
+            tokens = torch.cat([tokens, newline.expand(tokens.shape[0], 1, -1)], dim=1)
+            order = torch.where(separators, num_total, order)
+        pruned_tokens = tokens[:, order, :]
+        num_newline = int(separators.sum())
+        
+        # Summary tokens for the discarded background of the base grid
+        num_summary = 0
+        base_mask = mask[:self.num_patches]
+        if num_summary_tokens > 0 and not base_mask.all():
+            summary_tokens = self.pool_summary_tokens(
+                tokens[:, :self.num_patches],
+                base_mask,
+                num_summary_tokens,
+                attention_scores=attention_scores
+            )
+            pruned_tokens = torch.cat([pruned_tokens, summary_tokens], dim=1)
+            num_summary = num_summary_tokens
+        
+        if squeeze_output:
+            pruned_tokens = pruned_tokens.squeeze(0)
+        
+        if return_mask:
+            result = PruningResult(
+                mask=mask,
+                kept_indices=kept_indices,
+                num_kept=len(kept_indices),
+                num_total=num_total,
+                reduction_ratio=1.0 - (len(kept_indices) + num_summary + num_newline) / num_total,
+                num_summary=num_summary,
+                num_newline=num_newline
+            )
+            return pruned_tokens, result
+        
+        return pruned_tokens, None
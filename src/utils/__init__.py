@@ -1,12 +1,17 @@
 """Utils module for Event-VLM."""
 
-from src.utils.metrics import compute_metrics, AUCMeter, CaptionMetrics
-from src.utils.visualization import visualize_detections, visualize_pruning
+from src.utils.lazy import lazy_getattr
 
-__all__ = [
-    "compute_metrics",
-    "AUCMeter", 
-    "CaptionMetrics",
-    "visualize_detections",
-    "visualize_pruning"
-]
+# Public names -> defining module, imported on first attribute access so
+# metrics do not load the detector stack
+_LAZY_IMPORTS = {
+    "compute_metrics": "src.utils.metrics",
+    "AUCMeter": "src.utils.metrics",
+    "CaptionMetrics": "src.utils.metrics",
+    "LatencyModel": "src.utils.latency",
+    "visualize_detections": "src.utils.visualization",
+    "visualize_pruning": "src.utils.visualization",
+}
+
+__all__ = list(_LAZY_IMPORTS)
+__getattr__ = lazy_getattr(__name__, globals(), _LAZY_IMPORTS)
@@ -0,0 +1,56 @@
+"""
+Latency models for mock pipeline components.
+Lets CPU-only load tests reproduce the timing of the real detector and VLM.
+"""
+
+from dataclasses import dataclass
+from typing import Optional
+import time
+
+import numpy as np
+
+
+@dataclass
+class LatencyModel:
+    """
+    Linear latency model with optional seeded jitter.
+
+    cost = per_call + per_prefill_token * prefill tokens
+           + per_decode_token * decode tokens,
+    scaled by a log-normal factor with relative std `jitter`.
+    """
+    per_call: float = 0.0           # Fixed cost per call (s), e.g. detection per frame
+    per_prefill_token: float = 0.0  # Prefill cost per input token (s)
+    per_decode_token: float = 0.0   # Decode cost per output token (s)
+    jitter: float = 0.0             # Relative std of multiplicative noise
+
+    def cost(
+        self,
+        prefill_tokens: int = 0,
+        decode_tokens: int = 0,
+        rng: Optional[np.random.Generator] = None,
+        include_call: bool = True
+    ) -> float:
+        """
+        Simulated duration in seconds.
+
+        Args:
+            prefill_tokens: Input tokens processed
+            decode_tokens: Output tokens generated
+            rng: Generator for jitter (no jitter if None)
+            include_call: Whether to add the fixed per-call cost
+        """
+        seconds = (
+            (self.per_call if include_call else 0.0)
+            + self.per_prefill_token * prefill_tokens
+            + self.per_decode_token * decode_tokens
+        )
+        if self.jitter > 0 and rng is not None and seconds > 0:
+            seconds *= float(rng.lognormal(mean=0.0, sigma=self.jitter))
+        return seconds
+
+    @staticmethod
+    def wait(seconds: float) -> None:
+        """Block for a simulated duration."""
+        if seconds > 0:
+            time.sleep(seconds)
@@ -0,0 +1,26 @@
+"""Lazy attribute imports for package __init__ modules."""
+
+from importlib import import_module
+from typing import Any, Callable, Dict
+
+
+def lazy_getattr(package: str, namespace: Dict[str, Any], imports: Dict[str, str]) -> Callable[[str], Any]:
+    """
+    Build a module-level __getattr__ that imports public names on first access.
+
+    Args:
+        package: Name of the package (its __name__)
+        namespace: The package's globals(), where resolved names are cached
+        imports: Public name -> defining module
+
+    Returns:
+        Function to assign to the package's __getattr__
+    """
+    def __getattr__(name: str) -> Any:
+        if name in imports:
+            value = getattr(import_module(imports[name]), name)
+            namespace[name] = value
+            return value
+        raise AttributeError(f"module {package!r} has no attribute {name!r}")
+
+    return __getattr__
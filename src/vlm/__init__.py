@@ -1,6 +1,16 @@
 """VLM module for Stage 3: Context-Aware Generation with Hazard-Priority Prompting."""
 
-from src.vlm.llava_wrapper import LLaVAWrapper
-from src.vlm.prompt_tuning import HazardPriorityPrompting, PromptBank
+from src.utils.lazy import lazy_getattr
 
-__all__ = ["LLaVAWrapper", "HazardPriorityPrompting", "PromptBank"]
+# Public names -> defining module, imported on first attribute access so
+# importing the package does not load torch/transformers
+_LAZY_IMPORTS = {
+    "LLaVAWrapper": "src.vlm.llava_wrapper",
+    "HazardPriorityPrompting": "src.vlm.prompt_tuning",
+    "PromptBank": "src.vlm.prompt_tuning",
+    "IncrementalEncoder": "src.vlm.incremental_encoder",
+    "ContinuousBatchingEngine": "src.vlm.continuous_batching",
+}
+
+__all__ = list(_LAZY_IMPORTS)
+__getattr__ = lazy_getattr(__name__, globals(), _LAZY_IMPORTS)
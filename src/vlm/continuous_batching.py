@@ -0,0 +1,527 @@
+"""
+Continuous-batching generation engine for Stage 3.
+Requests join the running decode batch at token boundaries and leave as soon
+as they finish; KV states live in a pool of fixed-size blocks.
+"""
+
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+import itertools
+import logging
+import threading
+import time
+
+import torch
+
+from src.vlm.decoding import select_next_token
+
+logger = logging.getLogger(__name__)
+
+
+def cache_to_tensors(cache: Any) -> List[Tuple[torch.Tensor, torch.Tensor]]:
+    """Per-layer (keys, values) [B, H_kv, T, D] of an HF KV cache (any version)."""
+    if hasattr(cache, "layers"):
+        return [(layer.keys, layer.values) for layer in cache.layers]
+    if hasattr(cache, "key_cache"):
+        return list(zip(cache.key_cache, cache.value_cache))
+    return [(k, v) for k, v in cache]
+
+
+def replace_cache_tensors(cache: Any, layers: List[Tuple[torch.Tensor, torch.Tensor]]) -> None:
+    """Swap the per-layer (keys, values) of an HF KV cache in place."""
+    if hasattr(cache, "layers"):
+        for layer, (keys, values) in zip(cache.layers, layers):
+            layer.keys, layer.values = keys, values
+    else:
+        cache.key_cache[:] = [keys for keys, _ in layers]
+        cache.value_cache[:] = [values for _, values in layers]
+
+
+def tensors_to_cache(layers: List[Tuple[torch.Tensor, torch.Tensor]]) -> Any:
+    """Build an HF DynamicCache from per-layer (keys, values)."""
+    from transformers import DynamicCache
+
+    cache = DynamicCache()
+    for layer_idx, (keys, values) in enumerate(layers):
+        cache.update(keys, values, layer_idx)
+    return cache
+
+
+class BlockAllocator:
+    """Free-list allocator of fixed-size KV blocks."""
+
+    def __init__(self, num_blocks: int, block_size: int):
+        """
+        Args:
+            num_blocks: Total blocks in the pool
+            block_size: Tokens per block
+        """
+        self.num_blocks = num_blocks
+        self.block_size = block_size
+        self._free: Deque[int] = deque(range(num_blocks))
+        self.peak_used = 0
+
+    @property
+    def num_free(self) -> int:
+        return len(self._free)
+
+    @property
+    def num_used(self) -> int:
+        return self.num_blocks - len(self._free)
+
+    def blocks_for(self, num_tokens: int) -> int:
+        """Blocks needed to hold num_tokens."""
+        return -(-num_tokens // self.block_size)
+
+    def allocate(self, num: int) -> List[int]:
+        if num > len(self._free):
+            raise RuntimeError(f"Out of KV blocks: need {num}, {len(self._free)} free")
+        blocks = [self._free.popleft() for _ in range(num)]
+        self.peak_used = max(self.peak_used, self.num_used)
+        return blocks
+
+    def free(self, blocks: List[int]) -> None:
+        self._free.extend(blocks)
+
+
+@dataclass
+class EngineResult:
+    """Result of one engine request."""
+    token_ids: List[int]
+    queue_time: float     # Submission until first prefill
+    prefill_time: float   # Prefill of the request (summed over preemptions)
+    decode_time: float    # First decode step until finish
+    num_preemptions: int = 0
+
+
+@dataclass
+class _Sequence:
+    """Engine-side state of one request."""
+    request_id: int
+    inputs_embeds: torch.Tensor  # [1, T, H] prompt embeddings
+    max_new_tokens: int
+    future: Future
+    submit_time: float
+    stop_fn: Optional[Callable[[List[int]], bool]] = None
+    token_ids: List[int] = field(default_factory=list)
+    block_table: List[int] = field(default_factory=list)
+    num_cached: int = 0                 # Positions whose KV is in the pool
+    next_token: Optional[int] = None    # Sampled, not yet fed to the model
+    first_prefill: Optional[float] = None
+    decode_start: Optional[float] = None
+    prefill_time: float = 0.0
+    num_preemptions: int = 0
+
+    @property
+    def prompt_len(self) -> int:
+        """Length of the prefill input, including tokens kept across preemption."""
+        return self.inputs_embeds.shape[1] + len(self.token_ids)
+
+
+@dataclass
+class _BatchCache:
+    """Left-padded HF cache of the last decode batch, reused while it stays valid."""
+    sequences: List[_Sequence]
+    lengths: List[int]              # num_cached of each row the cache holds
+    cache: Any
+    attention_mask: torch.Tensor    # [B, width] over the cached positions
+
+
+class ContinuousBatchingEngine:
+    """
+    Token-level scheduler over a causal LM with block-managed KV memory.
+
+    Each step admits waiting requests (prefilled one at a time), then runs
+    one decode step for all running sequences. KV states of every sequence
+    are stored in a shared pool of `num_blocks` blocks of `block_size`
+    tokens; a sequence that cannot get a new block preempts the most
+    recently admitted one, which is re-prefilled later (recompute).
+
+    Decode steps run on a left-padded HF cache of the batch, so any HF
+    causal LM works unchanged. The cache is kept between steps (each step
+    only writes its new position into the pool), dropping the rows of
+    finished sequences; it is gathered from the pool again only when a
+    sequence joins the batch.
+    """
+
+    def __init__(
+        self,
+        model,
+        eos_token_id: Optional[int] = None,
+        max_new_tokens: int = 256,
+        max_batch_size: int = 8,
+        block_size: int = 16,
+        num_blocks: int = 512,
+        do_sample: bool = False,
+        temperature: float = 1.0
+    ):
+        """
+        Args:
+            model: HF causal LM accepting inputs_embeds
+            eos_token_id: End-of-sequence token id
+            max_new_tokens: Default per-request generation budget
+            max_batch_size: Maximum concurrently decoding sequences
+            block_size: Tokens per KV block
+            num_blocks: KV blocks in the pool
+            do_sample: Whether to sample or use greedy decoding
+            temperature: Sampling temperature
+        """
+        self.model = model
+        self.eos_token_id = eos_token_id
+        self.max_new_tokens = max_new_tokens
+        self.max_batch_size = max_batch_size
+        self.do_sample = do_sample
+        self.temperature = temperature
+
+        self.allocator = BlockAllocator(num_blocks, block_size)
+        self.key_pool: Optional[torch.Tensor] = None    # [layers, slots, H_kv, D]
+        self.value_pool: Optional[torch.Tensor] = None
+
+        self.waiting: Deque[_Sequence] = deque()
+        self.running: List[_Sequence] = []
+        self._batch: Optional[_BatchCache] = None
+
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread: Optional[threading.Thread] = None
+        self._stop = False
+
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """Reset scheduling statistics."""
+        self.num_steps = 0
+        self.batch_size_sum = 0
+        self.num_finished = 0
+        self.num_preemptions = 0
+
+    def submit(
+        self,
+        inputs_embeds: torch.Tensor,
+        max_new_tokens: Optional[int] = None,
+        stop_fn: Optional[Callable[[List[int]], bool]] = None
+    ) -> Future:
+        """
+        Queue a request; it joins the decode batch at the next token boundary.
+
+        Args:
+            inputs_embeds: Prompt embeddings [1, T, H]
+            max_new_tokens: Generation budget (engine default if None)
+            stop_fn: Optional early-stop check on the generated ids
+
+        Returns:
+            Future resolving to an EngineResult
+        """
+        future: Future = Future()
+        sequence = _Sequence(
+            request_id=next(self._ids),
+            inputs_embeds=inputs_embeds.detach(),
+            max_new_tokens=max_new_tokens or self.max_new_tokens,
+            future=future,
+            submit_time=time.time(),
+            stop_fn=stop_fn
+        )
+        with self._wakeup:
+            self.waiting.append(sequence)
+            self._wakeup.notify()
+        return future
+
+    def has_work(self) -> bool:
+        with self._lock:
+            return bool(self.waiting or self.running)
+
+    def start(self) -> None:
+        """Run the scheduler loop in a background thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop = False
+        self._thread = threading.Thread(target=self._loop, name="cb-engine", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background loop and fail queued and in-flight requests."""
+        with self._wakeup:
+            self._stop = True
+            self._wakeup.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._fail_all(RuntimeError("Continuous-batching engine stopped"))
+
+    def run_until_idle(self) -> None:
+        """Step in the calling thread until no request is left."""
+        while self.has_work():
+            self.step()
+
+    def stats(self) -> Dict[str, float]:
+        """Scheduling and KV memory statistics."""
+        return {
+            "steps": float(self.num_steps),
+            "mean_batch_size": self.batch_size_sum / max(self.num_steps, 1),
+            "finished": float(self.num_finished),
+            "preemptions": float(self.num_preemptions),
+            "kv_blocks_used": float(self.allocator.num_used),
+            "kv_blocks_peak": float(self.allocator.peak_used),
+            "kv_blocks_total": float(self.allocator.num_blocks),
+        }
+
+    def _loop(self) -> None:
+        while True:
+            with self._wakeup:
+                while not self._stop and not (self.waiting or self.running):
+                    self._wakeup.wait()
+                if self._stop:
+                    return
+            try:
+                self.step()
+            except Exception as exc:  # Fail all in-flight requests, keep serving
+                logger.exception("Continuous-batching step failed")
+                self._fail_all(exc)
+
+    def step(self) -> None:
+        """Admit waiting requests, then run one decode step for the batch."""
+        self._admit()
+        if self.running:
+            self._decode_step()
+
+    def _admit(self) -> None:
+        while len(self.running) < self.max_batch_size:
+            with self._lock:
+                if not self.waiting:
+                    return
+                sequence = self.waiting[0]
+                # Prompt positions plus the first decoded token
+                needed = self.allocator.blocks_for(sequence.prompt_len + 1)
+                if needed > self.allocator.num_free:
+                    if not self.running and needed > self.allocator.num_blocks:
+                        self.waiting.popleft()
+                        sequence.future.set_exception(RuntimeError(
+                            f"Request needs {needed} KV blocks; pool has "
+                            f"{self.allocator.num_blocks}"
+                        ))
+                        continue
+                    return
+                self.waiting.popleft()
+
+            self._prefill(sequence)
+            if not sequence.future.done():
+                self.running.append(sequence)
+
+    def _prefill(self, sequence: _Sequence) -> None:
+        inputs_embeds = sequence.inputs_embeds
+        if sequence.token_ids:
+            # Re-admission after preemption: recompute generated tokens too
+            token_ids = torch.tensor([sequence.token_ids], device=inputs_embeds.device)
+            with torch.no_grad():
+                token_embeds = self.model.get_input_embeddings()(token_ids)
+            inputs_embeds = torch.cat([inputs_embeds, token_embeds.to(inputs_embeds.dtype)], dim=1)
+
+        start = time.time()
+        if sequence.first_prefill is None:
+            sequence.first_prefill = start
+
+        with torch.no_grad():
+            outputs = self.model(inputs_embeds=inputs_embeds, use_cache=True)
+        layers = cache_to_tensors(outputs.past_key_values)
+
+        num_tokens = inputs_embeds.shape[1]
+        sequence.block_table = self.allocator.allocate(self.allocator.blocks_for(num_tokens))
+        sequence.num_cached = num_tokens
+
+        keys = torch.stack([k[0] for k, _ in layers])    # [layers, H_kv, T, D]
+        values = torch.stack([v[0] for _, v in layers])
+        self._ensure_pool(keys)
+        slots = self._slots(sequence, 0, num_tokens)
+        self.key_pool[:, slots] = keys.transpose(1, 2)
+        self.value_pool[:, slots] = values.transpose(1, 2)
+
+        next_token = select_next_token(outputs.logits[:, -1], self.do_sample, self.temperature)
+        sequence.prefill_time += time.time() - start
+        self._accept(sequence, int(next_token[0]))
+
+    def _decode_step(self) -> None:
+        # Make room for each sequence's next position, preempting if needed
+        for sequence in list(self.running):
+            if sequence not in self.running:
+                continue
+            while sequence.num_cached >= len(sequence.block_table) * self.allocator.block_size:
+                if self.allocator.num_free > 0:
+                    sequence.block_table += self.allocator.allocate(1)
+                elif not self._preempt(exclude=sequence):
+                    raise RuntimeError("KV pool too small for a single sequence")
+                if sequence not in self.running:
+                    break
+
+        batch = self.running
+        if not batch:
+            return
+        now = time.time()
+        for sequence in batch:
+            if sequence.decode_start is None:
+                sequence.decode_start = now
+
+        lengths = [sequence.num_cached for sequence in batch]
+        cache, attention_mask = self._batch_cache(batch, lengths)
+        device = attention_mask.device
+        # Attend to the cached positions and the new one
+        attention_mask = torch.cat(
+            [attention_mask, attention_mask.new_ones(len(batch), 1)], dim=1
+        )
+        input_ids = torch.tensor([[s.next_token] for s in batch], device=device)
+        position_ids = torch.tensor([[length] for length in lengths], device=device)
+
+        with torch.no_grad():
+            outputs = self.model(
+                input_ids=input_ids,
+                past_key_values=cache,
+                attention_mask=attention_mask,
+                position_ids=position_ids,
+                use_cache=True
+            )
+
+        layers = cache_to_tensors(outputs.past_key_values)
+        new_keys = torch.stack([k[:, :, -1] for k, _ in layers])    # [layers, B, H_kv, D]
+        new_values = torch.stack([v[:, :, -1] for _, v in layers])
+        slots = torch.tensor([self._slot(s, s.num_cached) for s in batch], device=device)
+        self.key_pool[:, slots] = new_keys
+        self.value_pool[:, slots] = new_values
+        self._batch = _BatchCache(
+            list(batch), [length + 1 for length in lengths], outputs.past_key_values, attention_mask
+        )
+
+        next_tokens = select_next_token(outputs.logits[:, -1], self.do_sample, self.temperature)
+
+        self.num_steps += 1
+        self.batch_size_sum += len(batch)
+
+        for sequence, token in zip(batch, next_tokens.tolist()):
+            sequence.num_cached += 1
+            self._accept(sequence, token)
+        self.running = [s for s in self.running if not s.future.done()]
+
+    def _batch_cache(self, batch: List[_Sequence], lengths: List[int]) -> Tuple[Any, torch.Tensor]:
+        """Left-padded cache and attention mask of the batch's cached positions."""
+        previous, self._batch = self._batch, None
+        rows = []
+        if previous is not None:
+            index = {id(s): row for row, s in enumerate(previous.sequences)}
+            for sequence, length in zip(batch, lengths):
+                row = index.get(id(sequence))
+                # Missing or re-prefilled (preempted) rows need a gather
+                if row is None or previous.lengths[row] != length:
+                    rows = None
+                    break
+                rows.append(row)
+
+        if previous is None or rows is None:
+            return self._gather(batch, lengths)
+        if rows == list(range(len(previous.sequences))):
+            return previous.cache, previous.attention_mask
+
+        # Drop finished rows and the left padding only they needed
+        width = previous.attention_mask.shape[1]
+        start = width - max(lengths)
+        rows = torch.tensor(rows, device=previous.attention_mask.device)
+        replace_cache_tensors(previous.cache, [
+            (k.index_select(0, rows)[:, :, start:], v.index_select(0, rows)[:, :, start:])
+            for k, v in cache_to_tensors(previous.cache)
+        ])
+        return previous.cache, previous.attention_mask.index_select(0, rows)[:, start:]
+
+    def _gather(self, batch: List[_Sequence], lengths: List[int]) -> Tuple[Any, torch.Tensor]:
+        """Build the batch cache from the block pool."""
+        max_len = max(lengths)
+        num_layers, _, num_heads, head_dim = self.key_pool.shape
+        shape = (num_layers, len(batch), num_heads, max_len, head_dim)
+        keys = self.key_pool.new_zeros(shape)
+        values = self.value_pool.new_zeros(shape)
+        attention_mask = torch.zeros(len(batch), max_len, dtype=torch.long, device=keys.device)
+
+        for b, (sequence, length) in enumerate(zip(batch, lengths)):
+            slots = self._slots(sequence, 0, length)
+            keys[:, b, :, max_len - length:] = self.key_pool[:, slots].transpose(1, 2)
+            values[:, b, :, max_len - length:] = self.value_pool[:, slots].transpose(1, 2)
+            attention_mask[b, max_len - length:] = 1
+
+        cache = tensors_to_cache([(keys[l], values[l]) for l in range(num_layers)])
+        return cache, attention_mask
+
+    def _accept(self, sequence: _Sequence, token: int) -> None:
+        """Record a sampled token; finish the request on EOS, budget or stop_fn."""
+        if self.eos_token_id is not None and token == self.eos_token_id:
+            self._finish(sequence)
+            return
+        sequence.token_ids.append(token)
+        if len(sequence.token_ids) >= sequence.max_new_tokens:
+            self._finish(sequence)
+        elif sequence.stop_fn is not None and sequence.stop_fn(sequence.token_ids):
+            self._finish(sequence)
+        else:
+            sequence.next_token = token
+
+    def _finish(self, sequence: _Sequence) -> None:
+        self.allocator.free(sequence.block_table)
+        sequence.block_table = []
+        now = time.time()
+        decode_start = sequence.decode_start or now
+        self.num_finished += 1
+        sequence.future.set_result(EngineResult(
+            token_ids=sequence.token_ids,
+            queue_time=sequence.first_prefill - sequence.submit_time,
+            prefill_time=sequence.prefill_time,
+            decode_time=now - decode_start,
+            num_preemptions=sequence.num_preemptions
+        ))
+
+    def _preempt(self, exclude: _Sequence) -> bool:
+        """Free the most recently admitted sequence other than exclude."""
+        for victim in reversed(self.running):
+            if victim is exclude:
+                continue
+            self.running.remove(victim)
+            self.allocator.free(victim.block_table)
+            victim.block_table = []
+            victim.num_cached = 0
+            victim.next_token = None
+            victim.num_preemptions += 1
+            self.num_preemptions += 1
+            with self._lock:
+                self.waiting.appendleft(victim)
+            return True
+        return False
+
+    def _fail_all(self, exc: Exception) -> None:
+        with self._lock:
+            pending = list(self.running) + list(self.waiting)
+            self.running = []
+            self.waiting.clear()
+            self._batch = None
+        for sequence in pending:
+            self.allocator.free(sequence.block_table)
+            sequence.block_table = []
+            if not sequence.future.done():
+                sequence.future.set_exception(exc)
+
+    def _ensure_pool(self, keys: torch.Tensor) -> None:
+        """Allocate the block pool on first use from the model's KV shape."""
+        if self.key_pool is not None:
+            return
+        num_layers, num_heads, _, head_dim = keys.shape
+        num_slots = self.allocator.num_blocks * self.allocator.block_size
+        shape = (num_layers, num_slots, num_heads, head_dim)
+        self.key_pool = keys.new_zeros(shape)
+        self.value_pool = keys.new_zeros(shape)
+
+    def _slot(self, sequence: _Sequence, position: int) -> int:
+        block_size = self.allocator.block_size
+        return sequence.block_table[position // block_size] * block_size + position % block_size
+
+    def _slots(self, sequence: _Sequence, start: int, end: int) -> torch.Tensor:
+        device = self.key_pool.device if self.key_pool is not None else None
+        block_size = self.allocator.block_size
+        blocks = torch.tensor(sequence.block_table, device=device)
+        offsets = torch.arange(block_size, device=device)
+        return (blocks[:, None] * block_size + offsets).flatten()[start:end]
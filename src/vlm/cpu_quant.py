@@ -0,0 +1,266 @@
+"""
+CPU weight-only quantization for Stage 3.
+Replaces the language model's linear layers with int8 (per-channel) or
+int4 (group-wise) weights so LLaVA can caption on CPU-only nodes without
+bitsandbytes. Matmuls use PyTorch's CPU int8/int4 packed kernels when
+available and fall back to dequantize + linear otherwise.
+"""
+
+from typing import Iterable, Optional, Tuple
+import logging
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+logger = logging.getLogger(__name__)
+
+CPU_QUANT_MODES = ["none", "int8", "int4"]
+
+# Quantization names accepted in configs, mapped to the CPU modes
+_CPU_QUANT_ALIASES = {
+    "none": "none",
+    "8bit": "int8",
+    "int8": "int8",
+    "4bit": "int4",
+    "int4": "int4",
+}
+
+# Group sizes supported by the int4 CPU kernel
+INT4_GROUP_SIZES = (32, 64, 128, 256)
+
+
+def cpu_quant_mode(quantization: str) -> str:
+    """Map a quantization setting (4bit, 8bit, int4, int8, none) to a CPU mode."""
+    if quantization not in _CPU_QUANT_ALIASES:
+        raise ValueError(f"Unknown quantization: {quantization}. Supported: {list(_CPU_QUANT_ALIASES)}")
+    return _CPU_QUANT_ALIASES[quantization]
+
+
+def set_cpu_threads(num_threads: int) -> int:
+    """
+    Set the intra-op thread count (0 keeps the PyTorch default).
+
+    Returns:
+        Threads in use
+    """
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+    return torch.get_num_threads()
+
+
+def weight_bytes(model: nn.Module) -> int:
+    """Bytes held by a model's parameters and buffers."""
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+def _probe(kernel, *args) -> bool:
+    try:
+        kernel(*args)
+        return True
+    except (RuntimeError, NotImplementedError):
+        return False
+
+
+class WeightOnlyInt8Linear(nn.Module):
+    """
+    Linear layer with symmetric per-output-channel int8 weights.
+
+    Activations are cast to `compute_dtype` for the matmul and the result
+    back to the input dtype.
+    """
+
+    def __init__(
+        self,
+        weight: torch.Tensor,
+        bias: Optional[torch.Tensor] = None,
+        compute_dtype: torch.dtype = torch.bfloat16
+    ):
+        """
+        Args:
+            weight: Float weight [out_features, in_features]
+            bias: Optional bias [out_features]
+            compute_dtype: Activation dtype of the matmul
+        """
+        super().__init__()
+        self.out_features, self.in_features = weight.shape
+        self.compute_dtype = compute_dtype
+
+        weight = weight.detach().float()
+        scales = weight.abs().amax(dim=1).clamp(min=1e-8) / 127.0
+        quantized = (weight / scales[:, None]).round().clamp(-127, 127).to(torch.int8)
+        self.register_buffer("weight", quantized)
+        self.register_buffer("scales", scales.to(compute_dtype))
+        self.register_buffer("bias", None if bias is None else bias.detach().to(compute_dtype))
+
+        self.use_kernel = hasattr(torch, "_weight_int8pack_mm") and _probe(
+            torch._weight_int8pack_mm,
+            torch.zeros(1, self.in_features, dtype=compute_dtype), self.weight, self.scales
+        )
+
+    @classmethod
+    def from_linear(cls, linear: nn.Linear, compute_dtype: torch.dtype = torch.bfloat16) -> "WeightOnlyInt8Linear":
+        return cls(linear.weight, linear.bias, compute_dtype)
+
+    def dequantize(self) -> torch.Tensor:
+        """Float weight [out_features, in_features] in compute_dtype."""
+        return self.weight.to(self.compute_dtype) * self.scales[:, None]
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        flat = x.reshape(-1, self.in_features).to(self.compute_dtype)
+        if self.use_kernel:
+            out = torch._weight_int8pack_mm(flat, self.weight, self.scales)
+        else:
+            out = F.linear(flat, self.dequantize())
+        if self.bias is not None:
+            out = out + self.bias
+        return out.reshape(*x.shape[:-1], self.out_features).to(x.dtype)
+
+    def extra_repr(self) -> str:
+        return f"in_features={self.in_features}, out_features={self.out_features}, int8"
+
+
+class WeightOnlyInt4Linear(nn.Module):
+    """
+    Linear layer with asymmetric group-wise int4 weights.
+
+    Each group of `group_size` input channels has its own scale and zero
+    point; two 4-bit values are packed per byte. With the CPU int4 kernel
+    the weight is stored in the kernel's packed layout.
+    """
+
+    def __init__(
+        self,
+        weight: torch.Tensor,
+        bias: Optional[torch.Tensor] = None,
+        group_size: int = 64,
+        compute_dtype: torch.dtype = torch.bfloat16
+    ):
+        """
+        Args:
+            weight: Float weight [out_features, in_features]; in_features
+                must be divisible by group_size
+            bias: Optional bias [out_features]
+            group_size: Input channels sharing a scale/zero point
+            compute_dtype: Activation dtype of the matmul
+        """
+        super().__init__()
+        self.out_features, self.in_features = weight.shape
+        if self.in_features % group_size or group_size % 2:
+            raise ValueError(f"in_features {self.in_features} not divisible by group_size {group_size}")
+        self.group_size = group_size
+        self.compute_dtype = compute_dtype
+
+        # q in [0, 15]; w ~= (q - 8) * scale + zero
+        groups = weight.detach().float().reshape(self.out_features, -1, group_size)
+        low = groups.amin(dim=-1, keepdim=True)
+        high = groups.amax(dim=-1, keepdim=True)
+        scales = ((high - low) / 15.0).clamp(min=1e-8)
+        quantized = ((groups - low) / scales).round().clamp(0, 15).to(torch.int32)
+        quantized = quantized.reshape(self.out_features, self.in_features)
+        zeros = low + 8.0 * scales
+
+        # [in_features / group_size, out_features, 2]
+        scales_and_zeros = torch.cat([scales, zeros], dim=-1).transpose(0, 1).contiguous()
+        self.register_buffer("scales_and_zeros", scales_and_zeros.to(compute_dtype))
+        self.register_buffer("bias", None if bias is None else bias.detach().to(compute_dtype))
+
+        self.use_kernel = False
+        if group_size in INT4_GROUP_SIZES and hasattr(torch, "_weight_int4pack_mm_for_cpu"):
+            try:
+                packed = torch._convert_weight_to_int4pack_for_cpu(quantized, 1)
+                self.use_kernel = _probe(
+                    torch._weight_int4pack_mm_for_cpu,
+                    torch.zeros(1, self.in_features, dtype=compute_dtype),
+                    packed, group_size, self.scales_and_zeros
+                )
+            except (AttributeError, RuntimeError, NotImplementedError):
+                pass
+        if not self.use_kernel:
+            packed = (quantized[:, 0::2] | (quantized[:, 1::2] << 4)).to(torch.uint8)
+        self.register_buffer("weight", packed)
+
+    @classmethod
+    def from_linear(
+        cls,
+        linear: nn.Linear,
+        group_size: int = 64,
+        compute_dtype: torch.dtype = torch.bfloat16
+    ) -> "WeightOnlyInt4Linear":
+        return cls(linear.weight, linear.bias, group_size, compute_dtype)
+
+    def dequantize(self) -> torch.Tensor:
+        """Float weight [out_features, in_features] in compute_dtype (fallback layout)."""
+        quantized = torch.stack([self.weight & 0xF, self.weight >> 4], dim=-1)
+        quantized = quantized.reshape(self.out_features, -1, self.group_size).to(self.compute_dtype)
+        scales, zeros = self.scales_and_zeros.transpose(0, 1).unbind(dim=-1)
+        weight = (quantized - 8) * scales[..., None] + zeros[..., None]
+        return weight.reshape(self.out_features, self.in_features)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        flat = x.reshape(-1, self.in_features).to(self.compute_dtype)
+        if self.use_kernel:
+            out = torch._weight_int4pack_mm_for_cpu(flat, self.weight, self.group_size, self.scales_and_zeros)
+        else:
+            out = F.linear(flat, self.dequantize())
+        if self.bias is not None:
+            out = out + self.bias
+        return out.reshape(*x.shape[:-1], self.out_features).to(x.dtype)
+
+    def extra_repr(self) -> str:
+        return (
+            f"in_features={self.in_features}, out_features={self.out_features}, "
+            f"int4, group_size={self.group_size}"
+        )
+
+
+def quantize_model_cpu(
+    model: nn.Module,
+    mode: str = "int8",
+    group_size: int = 64,
+    skip: Iterable[str] = ("lm_head", "vision_tower", "mm_projector"),
+    compute_dtype: torch.dtype = torch.bfloat16
+) -> Tuple[int, int]:
+    """
+    Replace nn.Linear layers with weight-only quantized layers in place.
+
+    Args:
+        model: Model on CPU
+        mode: One of CPU_QUANT_MODES
+        group_size: Input channels per int4 scale group
+        skip: Module name components left in floating point
+        compute_dtype: Activation dtype of the quantized matmuls
+
+    Returns:
+        (layers quantized, layers left in floating point)
+    """
+    if mode not in CPU_QUANT_MODES:
+        raise ValueError(f"Unknown CPU quantization mode: {mode}. Supported: {CPU_QUANT_MODES}")
+    if mode == "none":
+        return 0, 0
+
+    skip = set(skip)
+    targets = [
+        (name, module) for name, module in model.named_modules()
+        if isinstance(module, nn.Linear) and not skip.intersection(name.split("."))
+    ]
+
+    quantized = kept = 0
+    for name, linear in targets:
+        if mode == "int4" and linear.in_features % group_size:
+            kept += 1
+            continue
+        if mode == "int8":
+            replacement = WeightOnlyInt8Linear.from_linear(linear, compute_dtype)
+        else:
+            replacement = WeightOnlyInt4Linear.from_linear(linear, group_size, compute_dtype)
+
+        parent_name, _, child_name = name.rpartition(".")
+        parent = model.get_submodule(parent_name) if parent_name else model
+        setattr(parent, child_name, replacement)
+        quantized += 1
+
+    if kept:
+        logger.info(f"{kept} linear layers not divisible by group size {group_size} kept in float")
+    return quantized, kept
@@ -0,0 +1,225 @@
+"""
+Embedding-level decoding loop for Stage 3.
+Prefills precomputed input embeddings (optionally on top of a cached
+KV prefix) and decodes token by token, optionally streaming each token.
+"""
+
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import Any, Callable, Generator, List, Optional, Tuple
+import time
+
+import torch
+
+
+@dataclass
+class DecodeOutput:
+    """Output of an embedding-level decode."""
+    token_ids: List[int]
+    past_key_values: Any
+    prefill_time: float
+    decode_time: float
+    first_token_time: Optional[float] = None  # Wall-clock time of the first token
+    kv_cache_bytes: int = 0                   # Peak KV bytes held between decode steps
+    peak_memory_bytes: int = 0                # Peak CUDA memory allocated while decoding (0 on CPU)
+    proposed_draft_tokens: int = 0            # Speculative tokens proposed
+    accepted_draft_tokens: int = 0            # Speculative tokens accepted by the target
+
+
+def select_next_token(
+    logits: torch.Tensor,
+    do_sample: bool = False,
+    temperature: float = 1.0
+) -> torch.Tensor:
+    """
+    Pick the next token from last-position logits [B, V].
+
+    Returns:
+        Token ids [B]
+    """
+    if do_sample and temperature > 0:
+        probs = torch.softmax(logits.float() / temperature, dim=-1)
+        return torch.multinomial(probs, num_samples=1).squeeze(-1)
+    return logits.argmax(dim=-1)
+
+
+def stream_from_embeds(
+    model,
+    inputs_embeds: torch.Tensor,
+    past_key_values: Any = None,
+    max_new_tokens: int = 256,
+    eos_token_id: Optional[int] = None,
+    do_sample: bool = False,
+    temperature: float = 1.0,
+    stop_fn: Optional[Callable[[List[int]], bool]] = None,
+    kv_policy: Any = None,
+    visual_span: Optional[Tuple[int, int]] = None
+) -> Generator[int, None, DecodeOutput]:
+    """
+    Prefill input embeddings and yield generated token ids one at a time.
+
+    Arguments are those of generate_from_embeds; the DecodeOutput is the
+    generator's return value (StopIteration.value).
+    """
+    from src.vlm.kv_policy import eager_attention, kv_cache_bytes
+
+    token_ids: List[int] = []
+    first_token_time = None
+    needs_attentions = kv_policy is not None and kv_policy.needs_attentions
+
+    device = inputs_embeds.device
+    if device.type == "cuda":
+        torch.cuda.reset_peak_memory_stats(device)
+        base_memory = torch.cuda.memory_allocated(device)
+
+    with torch.no_grad():
+        start = time.time()
+        position = inputs_embeds.shape[1]
+        if past_key_values is not None:
+            position += past_key_values.get_seq_length()
+
+        with eager_attention(model) if needs_attentions else nullcontext():
+            outputs = model(
+                inputs_embeds=inputs_embeds,
+                past_key_values=past_key_values,
+                use_cache=True,
+                **({"output_attentions": True} if needs_attentions else {})
+            )
+        next_token = select_next_token(outputs.logits[:, -1], do_sample, temperature)
+
+        kv_state = None
+        if kv_policy is not None:
+            kv_state = kv_policy.after_prefill(
+                outputs.past_key_values, getattr(outputs, "attentions", None), visual_span
+            )
+            peak_bytes = kv_state.nbytes
+        else:
+            peak_bytes = kv_cache_bytes(outputs.past_key_values)
+        prefill_time = time.time() - start
+
+        start = time.time()
+        for _ in range(max_new_tokens):
+            token = int(next_token[0])
+            if eos_token_id is not None and token == eos_token_id:
+                break
+            token_ids.append(token)
+            if first_token_time is None:
+                first_token_time = time.time()
+            yield token
+            if len(token_ids) == max_new_tokens:
+                break
+            if stop_fn is not None and stop_fn(token_ids):
+                break
+
+            if kv_state is None:
+                outputs = model(
+                    input_ids=next_token.view(1, 1),
+                    past_key_values=outputs.past_key_values,
+                    use_cache=True
+                )
+            else:
+                # Evictions reorder the cache: keep rotary positions absolute
+                outputs = model(
+                    input_ids=next_token.view(1, 1),
+                    past_key_values=kv_state.cache,
+                    position_ids=torch.tensor([[position]], device=next_token.device),
+                    use_cache=True
+                )
+                kv_state = kv_policy.after_step(outputs.past_key_values, kv_state)
+                peak_bytes = max(peak_bytes, kv_state.nbytes)
+            position += 1
+            next_token = select_next_token(outputs.logits[:, -1], do_sample, temperature)
+        end = time.time()
+
+    if kv_state is None:
+        peak_bytes = max(peak_bytes, kv_cache_bytes(outputs.past_key_values))
+
+    return DecodeOutput(
+        token_ids=token_ids,
+        past_key_values=outputs.past_key_values,
+        prefill_time=prefill_time,
+        decode_time=end - start,
+        first_token_time=first_token_time,
+        kv_cache_bytes=peak_bytes,
+        peak_memory_bytes=(
+            torch.cuda.max_memory_allocated(device) - base_memory if device.type == "cuda" else 0
+        )
+    )
+
+
+def generate_from_embeds(
+    model,
+    inputs_embeds: torch.Tensor,
+    past_key_values: Any = None,
+    max_new_tokens: int = 256,
+    eos_token_id: Optional[int] = None,
+    do_sample: bool = False,
+    temperature: float = 1.0,
+    stop_fn: Optional[Callable[[List[int]], bool]] = None,
+    kv_policy: Any = None,
+    visual_span: Optional[Tuple[int, int]] = None
+) -> DecodeOutput:
+    """
+    Prefill input embeddings and decode with the model's KV cache.
+
+    Args:
+        model: HF causal LM (or LLaVA LM) accepting inputs_embeds
+        inputs_embeds: Input embeddings [1, T, H]
+        past_key_values: Optional KV cache of a prefix preceding inputs_embeds
+            (mutated in place; pass a copy of shared caches)
+        max_new_tokens: Maximum tokens to generate
+        eos_token_id: End-of-sequence token id
+        do_sample: Whether to sample or use greedy decoding
+        temperature: Sampling temperature
+        stop_fn: Optional early-stop check on the generated ids
+        kv_policy: Optional KVCachePolicy compressing the cache during decode
+        visual_span: [start, end) cache positions of the image tokens
+
+    Returns:
+        DecodeOutput with generated token ids and timings
+    """
+    stream = stream_from_embeds(
+        model,
+        inputs_embeds,
+        past_key_values=past_key_values,
+        max_new_tokens=max_new_tokens,
+        eos_token_id=eos_token_id,
+        do_sample=do_sample,
+        temperature=temperature,
+        stop_fn=stop_fn,
+        kv_policy=kv_policy,
+        visual_span=visual_span
+    )
+    while True:
+        try:
+            next(stream)
+        except StopIteration as stop:
+            return stop.value
+
+
+class TimingStreamer:
+    """
+    HF generate streamer that timestamps the first generated token.
+
+    generate() first puts the prompt ids, then one put per decode step.
+    """
+
+    def __init__(self):
+        self.first_token_time: Optional[float] = None
+        self._prompt_seen = False
+
+    def put(self, value: torch.Tensor) -> None:
+        if not self._prompt_seen:
+            self._prompt_seen = True
+        elif self.first_token_time is None:
+            self.first_token_time = time.time()
+
+    def end(self) -> None:
+        pass
+
+
+def tokens_per_second(num_tokens: int, first_token_time: Optional[float], end_time: float) -> float:
+    """Decode throughput after the first token (which belongs to prefill)."""
+    if first_token_time is None or num_tokens < 2 or end_time <= first_token_time:
+        return 0.0
+    return (num_tokens - 1) / (end_time - first_token_time)
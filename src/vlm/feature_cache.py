@@ -0,0 +1,273 @@
+"""
+Visual feature cache for Stage 3.
+Caches vision-tower outputs keyed by a content hash of the preprocessed
+image plus the vision tower ID, so re-encoding the same frame (benchmark
+re-runs, forced VLM passes, prompt-strategy sweeps) only re-runs the LLM.
+"""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+import fcntl
+import hashlib
+import json
+import logging
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(pixel_values: torch.Tensor) -> str:
+    """
+    Fast 128-bit hash of preprocessed pixel values.
+
+    Pixels are hashed as fp16 so dtype changes of the same input hash alike.
+    Uses xxhash when installed, else BLAKE2b.
+    """
+    data = pixel_values.detach().to(torch.float16).contiguous().cpu().numpy().tobytes()
+    try:
+        import xxhash
+        return xxhash.xxh3_128_hexdigest(data)
+    except ImportError:
+        return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class _DiskSlab:
+    """
+    Ring buffer of fp16 features with one fixed shape in a memory-mapped file.
+
+    Slots are reused FIFO once the slab is full; assignments are appended to
+    an index log so the slab can be reopened by later processes. Processes
+    may share a slab concurrently: each holds a flock on the index while it
+    assigns or reads a slot, after replaying the records other processes
+    appended since its last look.
+
+    Each time the ring wraps the index is compacted in place to the live
+    assignments, under a new epoch written as its first record; a process
+    that sees a different epoch replays the index from the start.
+    """
+
+    def __init__(self, directory: Path, shape: Tuple[int, ...], max_entries: int):
+        self.shape = shape
+        self.max_entries = max_entries
+
+        name = "x".join(str(d) for d in shape)
+        data_path = directory / f"features_{name}.f16"
+        self.index_path = directory / f"index_{name}.jsonl"
+
+        self.slots: Dict[str, int] = {}
+        self.slot_keys: Dict[int, str] = {}
+        self.next_slot = 0
+        self._index = open(self.index_path, "a+b")
+        self._offset = 0  # Index bytes replayed so far
+        self._epoch = 0   # Compaction generation of the replayed index
+
+        with self._locked(fcntl.LOCK_EX):
+            mode = "r+" if data_path.exists() else "w+"
+            self.data = np.memmap(data_path, dtype=np.float16, mode=mode, shape=(max_entries, *shape))
+            self._refresh()
+
+    @contextmanager
+    def _locked(self, operation: int):
+        fcntl.flock(self._index, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._index, fcntl.LOCK_UN)
+
+    def _refresh(self) -> None:
+        """Replay index records appended since the last refresh."""
+        self._index.seek(0)
+        first = self._index.readline()
+        epoch = json.loads(first).get("epoch", 0) if first.endswith(b"\n") else 0
+        if epoch != self._epoch:
+            # Compacted by another process: replay from the start
+            self.slots.clear()
+            self.slot_keys.clear()
+            self.next_slot = 0
+            self._offset = 0
+            self._epoch = epoch
+
+        self._index.seek(self._offset)
+        for line in self._index:
+            if not line.endswith(b"\n"):
+                break  # Torn record of a writer that died mid-append
+            record = json.loads(line)
+            self._offset += len(line)
+            if "epoch" in record:
+                continue
+            self._assign(record["key"], record["slot"])
+            self.next_slot = (record["slot"] + 1) % self.max_entries
+
+    def _compact(self) -> None:
+        """Rewrite the index as the live assignments under a new epoch (caller holds LOCK_EX)."""
+        self._epoch += 1
+        records = [{"epoch": self._epoch}] + [
+            {"key": self.slot_keys[slot], "slot": slot} for slot in sorted(self.slot_keys)
+        ]
+        data = b"".join((json.dumps(record) + "\n").encode() for record in records)
+        self._index.truncate(0)
+        self._index.write(data)
+        self._index.flush()
+        self._offset = len(data)
+
+    def _assign(self, key: str, slot: int) -> None:
+        old_key = self.slot_keys.get(slot)
+        if old_key is not None:
+            self.slots.pop(old_key, None)
+        self.slots[key] = slot
+        self.slot_keys[slot] = key
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._locked(fcntl.LOCK_SH):
+            self._refresh()
+            slot = self.slots.get(key)
+            return None if slot is None else np.array(self.data[slot])
+
+    def put(self, key: str, features: np.ndarray) -> None:
+        with self._locked(fcntl.LOCK_EX):
+            self._refresh()
+            if key in self.slots:
+                return
+            self._index.truncate(self._offset)
+
+            slot = self.next_slot
+            self.data[slot] = features
+            record = (json.dumps({"key": key, "slot": slot}) + "\n").encode()
+            self._index.write(record)
+            self._index.flush()
+            self._offset += len(record)
+            self._assign(key, slot)
+            self.next_slot = (slot + 1) % self.max_entries
+            if self.next_slot == 0:
+                self._compact()
+
+    def flush(self) -> None:
+        self.data.flush()
+
+
+class FeatureCache:
+    """
+    Two-tier visual feature cache.
+
+    Tier 1 is an in-memory LRU of feature tensors (kept on their device).
+    Tier 2, enabled with `disk_dir`, stores fp16 copies in memory-mapped
+    slabs (one per feature shape) shared across processes and runs, which
+    may read and write them concurrently; disk hits are promoted to memory.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 64,
+        disk_dir: Optional[str] = None,
+        disk_max_entries: int = 4096
+    ):
+        """
+        Args:
+            max_entries: In-memory LRU capacity
+            disk_dir: Directory of the fp16 memmap tier (None disables it)
+            disk_max_entries: Capacity per feature shape of the disk tier
+        """
+        self.max_entries = max_entries
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_max_entries = disk_max_entries
+
+        self._memory: "OrderedDict[str, torch.Tensor]" = OrderedDict()
+        self._slabs: Dict[Tuple[int, ...], _DiskSlab] = {}
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            for index_path in sorted(self.disk_dir.glob("index_*.jsonl")):
+                shape = tuple(int(d) for d in index_path.stem[len("index_"):].split("x"))
+                self._slab(shape)
+
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """Reset hit/miss statistics."""
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(tower_id: str, pixel_values: torch.Tensor) -> str:
+        """Cache key for preprocessed pixels encoded by a given vision tower."""
+        return f"{tower_id}:{content_hash(pixel_values)}"
+
+    def _slab(self, shape: Tuple[int, ...]) -> _DiskSlab:
+        if shape not in self._slabs:
+            self._slabs[shape] = _DiskSlab(self.disk_dir, shape, self.disk_max_entries)
+        return self._slabs[shape]
+
+    def get(
+        self,
+        key: str,
+        device: Optional[str] = None,
+        dtype: Optional[torch.dtype] = None
+    ) -> Optional[torch.Tensor]:
+        """
+        Look up features, promoting disk hits to memory.
+
+        Args:
+            key: Cache key from make_key
+            device: Device for features loaded from disk
+            dtype: Dtype for features loaded from disk
+
+        Returns:
+            Cached features or None
+        """
+        features = self._memory.get(key)
+        if features is not None:
+            self.memory_hits += 1
+            self._memory.move_to_end(key)
+            return features
+
+        for slab in self._slabs.values():
+            array = slab.get(key)
+            if array is not None:
+                self.disk_hits += 1
+                features = torch.from_numpy(array).to(device=device, dtype=dtype or torch.float16)
+                self._put_memory(key, features)
+                return features
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, features: torch.Tensor) -> None:
+        """Store features in memory and, if enabled, on disk."""
+        self._put_memory(key, features)
+        if self.disk_dir is not None:
+            array = features.detach().to(torch.float16).cpu().numpy()
+            self._slab(tuple(array.shape)).put(key, array)
+
+    def _put_memory(self, key: str, features: torch.Tensor) -> None:
+        self._memory[key] = features
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def flush(self) -> None:
+        """Flush memory-mapped slabs to disk."""
+        for slab in self._slabs.values():
+            slab.flush()
+
+    def clear_memory(self) -> None:
+        """Drop the in-memory tier (the disk tier is kept)."""
+        self._memory.clear()
+
+    def __len__(self) -> int:
+        return len(self._memory)
+
+    def stats(self) -> Dict[str, float]:
+        """Hit statistics per tier."""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": float(self.memory_hits),
+            "disk_hits": float(self.disk_hits),
+            "misses": float(self.misses),
+            "hit_rate": (self.memory_hits + self.disk_hits) / max(lookups, 1),
+            "memory_entries": float(len(self._memory)),
+            "disk_entries": float(sum(len(s.slots) for s in self._slabs.values())),
+        }
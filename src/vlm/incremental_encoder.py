@@ -0,0 +1,244 @@
+"""
+Incremental vision encoding for static surveillance cameras.
+Reuses cached visual features while the watched patches stay unchanged
+and re-encodes only the background patches that changed.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple, Union
+import logging
+
+import torch
+import torch.nn.functional as F
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class IncrementalEncodeStats:
+    """Statistics for a single incremental encode call."""
+    reused: bool                          # Whether cached features were returned
+    changed_fraction: float               # Fraction of background patches that changed
+    mask_changed: bool = False            # Whether any watched (masked) patch changed
+    recomputed: int = 0                   # Changed patches re-encoded into the reused features
+    approx_error: Optional[float] = None  # Relative L2 error vs full encode (if validated)
+
+
+@dataclass
+class _StreamState:
+    """Cached anchor frame for one camera stream."""
+    patch_pixels: torch.Tensor  # [C, S, S] patch-averaged pixels of the anchor frame
+    features: torch.Tensor      # [1, L, D] features of the anchor frame
+
+
+class IncrementalEncoder:
+    """
+    Incremental vision encoder with per-stream feature caching.
+
+    For every stream the pixels and features of the last fully encoded
+    (anchor) frame are cached. A new frame is compared against the anchor
+    with a cheap pixel delta at patch resolution. Any changed patch inside
+    the watched region (the pruning mask, i.e. the hazard regions passed
+    to the VLM) forces a full encode, so kept tokens are never stale.
+    Outside it (the whole grid without a mask), while the fraction of
+    changed patches stays below `refresh_ratio`, the changed patches are
+    re-encoded on their own (input-level pruning, VLM encode_image_masked)
+    and written into the cached features together with their new pixels,
+    so every patch is compared against the pixels its features came from
+    and no drift accumulates. Above the ratio the vision tower is run on
+    the whole frame and the anchor refreshed.
+
+    Re-encoded patches only attend to each other in the ViT, so they
+    approximate a full encode; `recompute_changed=False` instead returns
+    the anchor features unchanged (stale for the changed patches).
+    """
+
+    def __init__(
+        self,
+        vlm,
+        patch_size: int = 14,
+        pixel_threshold: float = 0.1,
+        refresh_ratio: float = 0.1,
+        max_streams: int = 64,
+        validate_every: int = 0,
+        recompute_changed: bool = True
+    ):
+        """
+        Args:
+            vlm: LLaVAWrapper providing preprocess_image / encode_pixels
+            patch_size: ViT patch size
+            pixel_threshold: Mean absolute pixel delta for a patch to count as changed
+            refresh_ratio: Changed background fraction above which features
+                are recomputed (changes inside the mask always recompute)
+            max_streams: Maximum number of cached streams (LRU eviction)
+            validate_every: Compare every N-th reuse against a full encode (0 disables)
+            recompute_changed: Re-encode changed background patches on reuse
+        """
+        self.vlm = vlm
+        self.patch_size = patch_size
+        self.pixel_threshold = pixel_threshold
+        self.refresh_ratio = refresh_ratio
+        self.max_streams = max_streams
+        self.validate_every = validate_every
+        self.recompute_changed = recompute_changed
+
+        self._streams: "OrderedDict[str, _StreamState]" = OrderedDict()
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """Reset accumulated statistics."""
+        self.num_calls = 0
+        self.num_reused = 0
+        self.num_recomputed = 0
+        self.approx_errors = []
+
+    def reset(self, stream_id: Optional[str] = None) -> None:
+        """Drop cached state for one stream, or for all streams."""
+        if stream_id is None:
+            self._streams.clear()
+        else:
+            self._streams.pop(stream_id, None)
+
+    def patch_pixels(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        """Average pixel values over each patch: [1, C, H, W] -> [C, S, S]."""
+        return F.avg_pool2d(pixel_values.float(), self.patch_size)[0]
+
+    def changed_patches(
+        self,
+        patch_pixels: torch.Tensor,
+        reference: torch.Tensor
+    ) -> torch.Tensor:
+        """Binary mask [L] of patches whose mean pixel delta exceeds the threshold."""
+        delta = (patch_pixels - reference).abs().mean(dim=0).flatten()
+        return delta > self.pixel_threshold
+
+    def encode(
+        self,
+        image: Union[np.ndarray, Image.Image, torch.Tensor],
+        stream_id: str = "default",
+        mask: Optional[torch.Tensor] = None,
+        validate: bool = False
+    ) -> Tuple[torch.Tensor, IncrementalEncodeStats]:
+        """
+        Encode image, reusing cached features when the stream is unchanged.
+
+        Args:
+            image: Input image (numpy array, PIL Image or RGB uint8 tensor)
+            stream_id: Camera/stream identifier
+            mask: Optional binary mask [L] of patches that will be kept
+                after pruning; any change inside it forces a full encode
+            validate: Force an approximation-error check against a full encode
+
+        Returns:
+            Visual tokens [1, L, D] and IncrementalEncodeStats
+        """
+        pixel_values = self.vlm.preprocess_image(image)
+        patch_pixels = self.patch_pixels(pixel_values)
+
+        self.num_calls += 1
+        state = self._streams.get(stream_id)
+
+        mask_changed = False
+        changed = None
+        if state is not None and state.patch_pixels.shape == patch_pixels.shape:
+            self._streams.move_to_end(stream_id)
+            changed = self.changed_patches(patch_pixels, state.patch_pixels)
+            background = changed
+            if mask is not None and mask.any():
+                watched = mask.to(changed.device).bool()
+                mask_changed = bool(changed[watched].any())
+                background = changed[~watched]
+            changed_fraction = background.float().mean().item() if background.numel() else 0.0
+        else:
+            changed_fraction = 1.0
+
+        if not mask_changed and changed_fraction <= self.refresh_ratio:
+            self.num_reused += 1
+            stats = IncrementalEncodeStats(reused=True, changed_fraction=changed_fraction)
+
+            if self.recompute_changed and changed.any():
+                self._recompute(state, image, patch_pixels, changed)
+                stats.recomputed = int(changed.sum())
+                self.num_recomputed += stats.recomputed
+
+            if validate or (self.validate_every and self.num_reused % self.validate_every == 0):
+                full = self.vlm.encode_pixels(pixel_values)
+                stats.approx_error = self.approximation_error(state.features, full, mask)
+                self.approx_errors.append(stats.approx_error)
+
+            return state.features, stats
+
+        # Full encode and anchor refresh
+        features = self.vlm.encode_pixels(pixel_values)
+        self._streams[stream_id] = _StreamState(patch_pixels=patch_pixels, features=features)
+        self._streams.move_to_end(stream_id)
+        while len(self._streams) > self.max_streams:
+            self._streams.popitem(last=False)
+
+        return features, IncrementalEncodeStats(
+            reused=False,
+            changed_fraction=changed_fraction,
+            mask_changed=mask_changed
+        )
+
+    def _recompute(
+        self,
+        state: _StreamState,
+        image: Union[np.ndarray, Image.Image, torch.Tensor],
+        patch_pixels: torch.Tensor,
+        changed: torch.Tensor
+    ) -> None:
+        """Re-encode the changed patches into the stream's anchor features and pixels."""
+        indices = changed.nonzero(as_tuple=True)[0]
+        patch_features = self.vlm.encode_image_masked(image, changed.cpu())
+
+        features = state.features.clone()
+        offset = features.shape[1] - changed.shape[0]  # Skip CLS if present
+        features[:, indices.to(features.device) + offset] = patch_features.to(
+            device=features.device, dtype=features.dtype
+        )
+
+        side = patch_pixels.shape[-1]
+        rows, cols = indices // side, indices % side
+        anchor_pixels = state.patch_pixels.clone()
+        anchor_pixels[:, rows, cols] = patch_pixels[:, rows, cols]
+
+        state.features = features
+        state.patch_pixels = anchor_pixels
+
+    @staticmethod
+    def approximation_error(
+        approx: torch.Tensor,
+        full: torch.Tensor,
+        mask: Optional[torch.Tensor] = None
+    ) -> float:
+        """
+        Relative L2 error ||approx - full|| / ||full|| over the masked patches.
+
+        Args:
+            approx: Reused features [1, L, D]
+            full: Freshly computed features [1, L, D]
+            mask: Optional binary patch mask [L] (a leading CLS token is skipped)
+        """
+        approx = approx.float()
+        full = full.float()
+        if mask is not None:
+            offset = full.shape[1] - mask.shape[0]
+            kept = mask.nonzero(as_tuple=True)[0].to(full.device) + offset
+            approx = approx[:, kept]
+            full = full[:, kept]
+
+        return (torch.norm(approx - full) / torch.norm(full).clamp(min=1e-8)).item()
+
+    def summary(self) -> Dict[str, float]:
+        """Aggregate reuse ratio and approximation error."""
+        return {
+            "calls": float(self.num_calls),
+            "reuse_ratio": self.num_reused / max(self.num_calls, 1),
+            "recomputed_patches": float(self.num_recomputed),
+            "approx_error_mean": float(np.mean(self.approx_errors)) if self.approx_errors else 0.0,
+            "approx_error_max": float(np.max(self.approx_errors)) if self.approx_errors else 0.0,
+        }
@@ -0,0 +1,325 @@
+"""
+KV-cache compression policies for Stage 3 decoding.
+Bound the KV states read at every decode step by evicting low-value
+positions (unattended visual tokens, tokens outside a sliding window).
+Policies can also round the cache through int8 to simulate the accuracy
+of an int8 KV store; that rounding does not reduce memory.
+"""
+
+from contextlib import contextmanager
+from typing import Any, List, Optional, Tuple
+import logging
+
+import torch
+
+from src.vlm.continuous_batching import cache_to_tensors, replace_cache_tensors
+
+logger = logging.getLogger(__name__)
+
+KV_POLICIES = ["dense", "visual_topk", "sink_window"]
+
+
+def kv_cache_bytes(cache: Any) -> int:
+    """Bytes held by an HF KV cache."""
+    return sum(
+        keys.numel() * keys.element_size() + values.numel() * values.element_size()
+        for keys, values in cache_to_tensors(cache)
+    )
+
+
+def quantize_int8(tensor: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Symmetric per-token int8 quantization over the head dim: (int8 values, fp16 scales)."""
+    scale = tensor.abs().amax(dim=-1, keepdim=True).float().clamp(min=1e-8) / 127.0
+    quantized = (tensor.float() / scale).round().clamp(-127, 127).to(torch.int8)
+    return quantized, scale.to(torch.float16)
+
+
+def dequantize_int8(quantized: torch.Tensor, scale: torch.Tensor, dtype: torch.dtype) -> torch.Tensor:
+    return (quantized.float() * scale.float()).to(dtype)
+
+
+@contextmanager
+def eager_attention(model):
+    """Temporarily switch a model to eager attention so it can return attention maps."""
+    previous = getattr(getattr(model, "config", None), "_attn_implementation", None)
+    if previous in (None, "eager") or not hasattr(model, "set_attn_implementation"):
+        yield
+        return
+    model.set_attn_implementation("eager")
+    try:
+        yield
+    finally:
+        model.set_attn_implementation(previous)
+
+
+def _round_int8(tensor: torch.Tensor) -> torch.Tensor:
+    return dequantize_int8(*quantize_int8(tensor), tensor.dtype)
+
+
+class KVState:
+    """
+    KV cache held between decode steps.
+
+    `cache` is the model's own working cache, reused by every forward pass.
+    Evicted slots are refilled with the newest positions instead of
+    shifting the cache, so `positions` records the absolute position held
+    by each slot (keys already carry their rotary positions).
+    """
+
+    def __init__(self, cache: Any, positions: torch.Tensor, quantized: bool):
+        self.cache = cache
+        self.positions = positions
+        self.quantized = quantized
+        self.next_position = int(positions.max()) + 1 if positions.numel() else 0
+
+    @property
+    def seq_length(self) -> int:
+        return self.positions.numel()
+
+    @property
+    def nbytes(self) -> int:
+        return kv_cache_bytes(self.cache)
+
+
+class KVCachePolicy:
+    """
+    Dense KV cache, optionally rounded to int8 precision (accuracy simulation).
+
+    Subclasses choose which positions to keep after prefill and which to
+    evict after each decode step. Each step only touches the positions it
+    added or evicted; since evictions reorder the cache, the decode loop
+    passes explicit position ids so rotary positions stay absolute.
+    """
+
+    name = "dense"
+    needs_attentions = False
+
+    def __init__(self, quantize_int8: bool = False):
+        """
+        Args:
+            quantize_int8: Round each cached position through per-token int8
+                as it is added (the accuracy of an int8 KV store). The working
+                cache stays in the model dtype, so this does not reduce memory
+                without an int8 attention kernel.
+        """
+        self.quantize_int8 = quantize_int8
+
+    def describe(self) -> str:
+        return f"{self.name}+int8" if self.quantize_int8 else self.name
+
+    def prefill_keep(
+        self,
+        seq_length: int,
+        attentions: Optional[Tuple[torch.Tensor, ...]] = None,
+        visual_span: Optional[Tuple[int, int]] = None
+    ) -> Optional[torch.Tensor]:
+        """Positions kept after prefill (None keeps all)."""
+        return None
+
+    def step_evict(self, positions: torch.Tensor) -> Optional[torch.Tensor]:
+        """
+        Slots evicted after a decode step (None evicts nothing).
+
+        Args:
+            positions: Absolute position held by each cache slot
+        """
+        return None
+
+    def after_prefill(
+        self,
+        cache: Any,
+        attentions: Optional[Tuple[torch.Tensor, ...]] = None,
+        visual_span: Optional[Tuple[int, int]] = None
+    ) -> KVState:
+        """
+        Compress the KV cache produced by the prefill (in place).
+
+        Args:
+            cache: HF KV cache after prefill
+            attentions: Per-layer prefill attention maps [B, H, T_q, T_kv]
+                (requested when needs_attentions is set)
+            visual_span: [start, end) cache positions of the image tokens
+
+        Returns:
+            KVState whose cache is passed to the next forward pass
+        """
+        layers = cache_to_tensors(cache)
+        seq_length = layers[0][0].shape[2]
+        keep = self.prefill_keep(seq_length, attentions, visual_span)
+        if keep is not None:
+            layers = [
+                (k.index_select(2, keep.to(k.device)), v.index_select(2, keep.to(v.device)))
+                for k, v in layers
+            ]
+        if self.quantize_int8:
+            layers = [(_round_int8(k), _round_int8(v)) for k, v in layers]
+        if keep is not None or self.quantize_int8:
+            replace_cache_tensors(cache, layers)
+
+        positions = torch.arange(seq_length) if keep is None else keep.cpu()
+        return KVState(cache, positions, self.quantize_int8)
+
+    def after_step(self, cache: Any, state: KVState) -> KVState:
+        """Process the positions a decode step appended to the cache and evict."""
+        layers = cache_to_tensors(cache)
+        old_length = state.seq_length
+        num_new = layers[0][0].shape[2] - old_length
+        if self.quantize_int8:
+            for k, v in layers:
+                k[:, :, old_length:] = _round_int8(k[:, :, old_length:])
+                v[:, :, old_length:] = _round_int8(v[:, :, old_length:])
+
+        state.positions = torch.cat([
+            state.positions, torch.arange(state.next_position, state.next_position + num_new)
+        ])
+        state.next_position += num_new
+        state.cache = cache
+
+        evict = self.step_evict(state.positions)
+        if evict is not None and evict.numel():
+            self._evict(state, layers, evict)
+        return state
+
+    @staticmethod
+    def _evict(state: KVState, layers: List[Tuple[torch.Tensor, torch.Tensor]], evict: torch.Tensor) -> None:
+        """Move the last slots into the evicted ones and drop the tail."""
+        seq_length = state.seq_length
+        new_length = seq_length - evict.numel()
+        dropped = torch.zeros(seq_length, dtype=torch.bool)
+        dropped[evict] = True
+        holes = dropped[:new_length].nonzero().squeeze(1)
+        movers = (~dropped[new_length:]).nonzero().squeeze(1) + new_length
+
+        state.positions[holes] = state.positions[movers]
+        state.positions = state.positions[:new_length]
+        trimmed = []
+        for k, v in layers:
+            if holes.numel():
+                k[:, :, holes.to(k.device)] = k[:, :, movers.to(k.device)]
+                v[:, :, holes.to(v.device)] = v[:, :, movers.to(v.device)]
+            trimmed.append((k[:, :, :new_length], v[:, :, :new_length]))
+        replace_cache_tensors(state.cache, trimmed)
+
+
+class VisualTopKPolicy(KVCachePolicy):
+    """
+    Keep KV states of the most-attended image tokens only.
+
+    Image tokens are scored by the attention the text after the image pays
+    them during prefill (averaged over layers and heads); text positions
+    are always kept.
+    """
+
+    name = "visual_topk"
+    needs_attentions = True
+
+    def __init__(self, keep_ratio: float = 0.25, min_tokens: int = 16, **kwargs):
+        """
+        Args:
+            keep_ratio: Fraction of image tokens kept
+            min_tokens: Lower bound on kept image tokens
+        """
+        super().__init__(**kwargs)
+        self.keep_ratio = keep_ratio
+        self.min_tokens = min_tokens
+
+    def prefill_keep(
+        self,
+        seq_length: int,
+        attentions: Optional[Tuple[torch.Tensor, ...]] = None,
+        visual_span: Optional[Tuple[int, int]] = None
+    ) -> Optional[torch.Tensor]:
+        attentions = [a for a in (attentions or ()) if a is not None]
+        if visual_span is None or not attentions:
+            if visual_span is not None:
+                logger.warning("No prefill attention maps; keeping all image tokens")
+            return None
+
+        start, end = visual_span
+        num_visual = end - start
+        num_keep = min(num_visual, max(self.min_tokens, int(round(num_visual * self.keep_ratio))))
+        if num_keep >= num_visual:
+            return None
+
+        # Query rows of the prefill map cover its last T_q cache positions
+        num_queries = attentions[0].shape[-2]
+        first_query = seq_length - num_queries
+        rows = slice(max(end - first_query, 0), None) if end < seq_length else slice(-1, None)
+
+        scores = torch.stack([
+            a[0, :, rows, start:end].float().mean(dim=(0, 1)) for a in attentions
+        ]).mean(dim=0)
+        top = scores.topk(num_keep).indices.cpu() + start
+
+        keep = torch.cat([torch.arange(0, start), top, torch.arange(end, seq_length)])
+        return keep.sort().values
+
+
+class SinkWindowPolicy(KVCachePolicy):
+    """
+    Attention sinks plus a sliding window (StreamingLLM).
+
+    Keeps the first `num_sinks` positions and the most recent `window`
+    positions, bounding the cache at num_sinks + window entries.
+    """
+
+    name = "sink_window"
+
+    def __init__(self, num_sinks: int = 4, window: int = 256, **kwargs):
+        """
+        Args:
+            num_sinks: Leading positions always kept
+            window: Most recent positions kept
+        """
+        super().__init__(**kwargs)
+        self.num_sinks = num_sinks
+        self.window = window
+
+    def step_evict(self, positions: torch.Tensor) -> Optional[torch.Tensor]:
+        excess = positions.numel() - (self.num_sinks + self.window)
+        if excess <= 0:
+            return None
+        # Oldest positions after the sinks
+        return positions.argsort()[self.num_sinks:self.num_sinks + excess]
+
+    def prefill_keep(
+        self,
+        seq_length: int,
+        attentions: Optional[Tuple[torch.Tensor, ...]] = None,
+        visual_span: Optional[Tuple[int, int]] = None
+    ) -> Optional[torch.Tensor]:
+        if seq_length <= self.num_sinks + self.window:
+            return None
+        return torch.cat([
+            torch.arange(0, self.num_sinks),
+            torch.arange(seq_length - self.window, seq_length)
+        ])
+
+
+def get_kv_policy(
+    name: str = "dense",
+    quantize_int8: bool = False,
+    visual_keep_ratio: float = 0.25,
+    num_sinks: int = 4,
+    window: int = 256
+) -> Optional[KVCachePolicy]:
+    """
+    Build a KV-cache policy by name.
+
+    Args:
+        name: One of KV_POLICIES
+        quantize_int8: Simulate int8 KV precision (no memory saving)
+        visual_keep_ratio: Image tokens kept by visual_topk
+        num_sinks: Sink positions kept by sink_window
+        window: Recent positions kept by sink_window
+
+    Returns:
+        Policy, or None for the plain dense cache
+    """
+    if name == "dense":
+        return KVCachePolicy(quantize_int8=True) if quantize_int8 else None
+    if name == "visual_topk":
+        return VisualTopKPolicy(keep_ratio=visual_keep_ratio, quantize_int8=quantize_int8)
+    if name == "sink_window":
+        return SinkWindowPolicy(num_sinks=num_sinks, window=window, quantize_int8=quantize_int8)
+    raise ValueError(f"Unknown KV policy: {name}. Supported: {KV_POLICIES}")
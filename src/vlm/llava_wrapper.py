@@ -3,8 +3,9 @@ LLaVA Wrapper for Stage 3: VLM Integration.
 Supports 4-bit quantization for efficient inference.
 """
 
+from concurrent.futures import Future
 from dataclasses import dataclass
-from typing import List, Optional, Dict, Any, Union
+from typing import List, Optional, Dict, Any, Generator, Iterator, Tuple, Union
 import logging
 
 import torch
@@ -12,6 +13,17 @@ import torch.nn as nn
 import numpy as np
 from PIL import Image
 
+from src.vlm.continuous_batching import ContinuousBatchingEngine
+from src.vlm.cpu_quant import cpu_quant_mode, quantize_model_cpu, set_cpu_threads, weight_bytes
+from src.vlm.decoding import TimingStreamer, stream_from_embeds, tokens_per_second
+from src.vlm.feature_cache import FeatureCache
+from src.vlm.kv_policy import KVCachePolicy, get_kv_policy
+from src.vlm.prefix_cache import PrefixKVCache, PromptTokenCache
+from src.vlm.preprocessing import TensorPreprocessor
+from src.vlm.speculative import get_drafter, speculative_from_embeds
+from src.vlm.stopping import CaptionStopper, count_numbered_fields, hf_stopping_criteria, strip_prompt_ids
+from src.utils.latency import LatencyModel
+
 logger = logging.getLogger(__name__)
 
 
@@ -23,6 +35,26 @@ class VLMOutput:
     confidence: float
     tokens_used: int
     generation_time: float
+    prefix_tokens_cached: int = 0  # Prompt-prefix tokens served from the KV cache
+    generated_tokens: int = 0      # Decoded tokens (after early stopping)
+    prefill_time: float = 0.0          # Prompt + image prefill until the first token
+    time_to_first_token: float = 0.0   # Call start (incl. encoding/queueing) to first token
+    decode_tokens_per_sec: float = 0.0 # Decode throughput after the first token
+    kv_cache_bytes: int = 0            # Peak KV-cache bytes during decoding
+    peak_memory_bytes: int = 0         # Peak CUDA memory allocated while decoding (0 on CPU)
+    draft_acceptance_rate: float = 0.0 # Accepted / proposed speculative tokens
+
+
+@dataclass
+class StreamChunk:
+    """Incremental caption text from generate_stream."""
+    text: str                            # Newly decoded text
+    num_tokens: int                      # Tokens decoded so far
+    output: Optional[VLMOutput] = None   # Complete output, set on the final chunk
+    
+    @property
+    def done(self) -> bool:
+        return self.output is not None
 
 
 class LLaVAWrapper:
@@ -39,6 +71,12 @@ class LLaVAWrapper:
         "llava-1.6-vicuna-13b",
     ]
     
+    # Models using anyres (base image + high-resolution tiles) encoding
+    ANYRES_MODELS = [
+        "llava-1.6-vicuna-7b",
+        "llava-1.6-vicuna-13b",
+    ]
+    
     def __init__(
         self,
         model_name: str = "llava-1.5-7b",
@@ -47,17 +85,81 @@ class LLaVAWrapper:
         max_new_tokens: int = 256,
         temperature: float = 0.2,
         do_sample: bool = False,
-        torch_dtype: torch.dtype = torch.float16
+        torch_dtype: torch.dtype = torch.float16,
+        prefix_cache: bool = False,
+        prefix_cache_size: int = 8,
+        max_batch_size: int = 8,
+        kv_block_size: int = 16,
+        kv_num_blocks: int = 512,
+        token_budgets: Optional[Dict[str, int]] = None,
+        structured_stop: bool = False,
+        stop_sequences: Optional[List[str]] = None,
+        repetition_ngram: int = 0,
+        repetition_max: int = 3,
+        tensor_preprocess: bool = False,
+        feature_cache: bool = False,
+        feature_cache_size: int = 64,
+        feature_cache_dir: Optional[str] = None,
+        feature_cache_disk_entries: int = 4096,
+        kv_policy: str = "dense",
+        kv_int8: bool = False,
+        kv_visual_keep_ratio: float = 0.25,
+        kv_sink_tokens: int = 4,
+        kv_window: int = 256,
+        speculative: str = "off",
+        draft_model: Optional[Union[str, nn.Module]] = None,
+        num_draft_tokens: int = 4,
+        prompt_lookup_ngram: int = 3,
+        cpu_threads: int = 0,
+        quant_group_size: int = 64,
+        prompt_token_cache_size: int = 256
     ):
         """
         Args:
             model_name: LLaVA model variant
-            quantization: Quantization mode (4bit, 8bit, none)
+            quantization: Quantization mode (4bit, 8bit, none); on CPU,
+                weight-only int4/int8 of the language model (int4/int8
+                are accepted as aliases)
             device: Target device
             max_new_tokens: Maximum tokens to generate
             temperature: Sampling temperature
             do_sample: Whether to sample or use greedy decoding
             torch_dtype: Torch dtype for model
+            prefix_cache: Cache KV states of image-independent prompt prefixes
+            prefix_cache_size: Maximum cached prefixes
+            max_batch_size: Maximum sequences decoded together by submit()
+            kv_block_size: Tokens per KV block of the batching engine
+            kv_num_blocks: KV blocks in the batching engine's pool
+            token_budgets: Max new tokens per hazard level (falls back to
+                max_new_tokens)
+            structured_stop: Stop once the prompt's numbered fields are filled
+            stop_sequences: Section terminators that end a caption
+            repetition_ngram: N-gram size for stop-on-repetition (0 = off)
+            repetition_max: Repeats of the trailing n-gram that stop decoding
+            tensor_preprocess: Validate the tensor preprocessing path against
+                the HF processor when it is first used
+            feature_cache: Cache vision features by preprocessed-image hash
+            feature_cache_size: In-memory feature cache entries
+            feature_cache_dir: Directory of the fp16 memmap disk tier (optional)
+            feature_cache_disk_entries: Disk tier entries per feature shape
+            kv_policy: KV-cache policy for single-caption decoding
+                (dense, visual_topk, sink_window)
+            kv_int8: Round the KV cache through int8 during decoding, to
+                measure the caption accuracy of an int8 KV store (the cache
+                stays in the model dtype: no memory saving)
+            kv_visual_keep_ratio: Image tokens kept in the cache by visual_topk
+            kv_sink_tokens: Attention-sink positions kept by sink_window
+            kv_window: Recent positions kept by sink_window
+            speculative: Speculative decoding mode for greedy captions
+                (off, draft, prompt_lookup)
+            draft_model: Draft LM (HF model id or loaded model) sharing the
+                target's tokenizer, for the draft mode
+            num_draft_tokens: Tokens proposed per speculative step
+            prompt_lookup_ngram: Longest n-gram matched by prompt_lookup
+            cpu_threads: Intra-op threads on CPU (0 = PyTorch default)
+            quant_group_size: Input channels per scale group of CPU int4
+            prompt_token_cache_size: Prompt texts whose token ids are
+                memoized (0 = tokenize every call)
         """
         self.model_name = model_name
         self.quantization = quantization
@@ -67,13 +169,83 @@ class LLaVAWrapper:
         self.do_sample = do_sample
         self.torch_dtype = torch_dtype
         
+        self.cpu_threads = cpu_threads
+        self.quant_group_size = quant_group_size
+        if self.is_cpu and torch_dtype == torch.float16:
+            # fp16 matmuls are slow or unsupported on CPU
+            self.torch_dtype = torch.bfloat16
+        
         self.model = None
         self.tokenizer = None
         self.image_processor = None
         self.vision_tower = None
         
+        self.prefix_cache = PrefixKVCache(prefix_cache_size) if prefix_cache else None
+        self.prompt_token_cache = (
+            PromptTokenCache(prompt_token_cache_size) if prompt_token_cache_size > 0 else None
+        )
+        
+        self.max_batch_size = max_batch_size
+        self.kv_block_size = kv_block_size
+        self.kv_num_blocks = kv_num_blocks
+        self.engine: Optional[ContinuousBatchingEngine] = None
+        
+        self.token_budgets = dict(token_budgets or {})
+        self.structured_stop = structured_stop
+        self.stop_sequences = list(stop_sequences or [])
+        self.repetition_ngram = repetition_ngram
+        self.repetition_max = repetition_max
+        
+        self.tensor_preprocess = tensor_preprocess
+        self.tensor_preprocessor: Optional[TensorPreprocessor] = None
+        
+        self.feature_cache = (
+            FeatureCache(feature_cache_size, feature_cache_dir, feature_cache_disk_entries)
+            if feature_cache else None
+        )
+        
+        self.kv_policy: Optional[KVCachePolicy] = get_kv_policy(
+            kv_policy,
+            quantize_int8=kv_int8,
+            visual_keep_ratio=kv_visual_keep_ratio,
+            num_sinks=kv_sink_tokens,
+            window=kv_window
+        )
+        
+        self.speculative = speculative
+        self.draft_model = draft_model
+        self.num_draft_tokens = num_draft_tokens
+        self.prompt_lookup_ngram = prompt_lookup_ngram
+        self.drafter = None
+        if speculative != "off" and do_sample:
+            logger.warning("Speculative decoding keeps greedy outputs only; disabled with do_sample")
+            self.speculative = "off"
+        if self.speculative != "off" and self.kv_policy is not None:
+            logger.warning(
+                f"kv_policy '{self.kv_policy.describe()}' is ignored: "
+                "speculative decoding keeps the dense KV cache"
+            )
+        
         self._loaded = False
     
+    @property
+    def vision_tower_id(self) -> str:
+        """Identifier of the vision tower + feature selection, for feature caching."""
+        self.load_model()
+        select_layer = getattr(self.vision_tower, "select_layer", -2)
+        select_feature = getattr(self.vision_tower, "select_feature", "patch")
+        return f"{self.model_name}:layer{select_layer}:{select_feature}"
+    
+    @property
+    def is_cpu(self) -> bool:
+        """Whether the model runs on CPU (weight-only quantization path)."""
+        return str(self.device).startswith("cpu")
+    
+    @property
+    def is_anyres(self) -> bool:
+        """Whether the model encodes images as anyres tiles."""
+        return self.model_name in self.ANYRES_MODELS
+    
     def load_model(self) -> None:
         """Load LLaVA model with optional quantization."""
         if self._loaded:
@@ -96,15 +268,18 @@ class LLaVAWrapper:
             if not model_path:
                 raise ValueError(f"Unknown model: {self.model_name}")
             
-            # Quantization config
-            if self.quantization == "4bit":
+            # Quantization config (bitsandbytes needs CUDA; CPU quantizes after loading)
+            quantization = {"int4": "4bit", "int8": "8bit"}.get(self.quantization, self.quantization)
+            if self.is_cpu:
+                quantization_config = None
+            elif quantization == "4bit":
                 quantization_config = BitsAndBytesConfig(
                     load_in_4bit=True,
                     bnb_4bit_compute_dtype=self.torch_dtype,
                     bnb_4bit_use_double_quant=True,
                     bnb_4bit_quant_type="nf4"
                 )
-            elif self.quantization == "8bit":
+            elif quantization == "8bit":
                 quantization_config = BitsAndBytesConfig(
                     load_in_8bit=True
                 )
@@ -127,6 +302,9 @@ class LLaVAWrapper:
             self.image_processor = image_processor
             self.context_len = context_len
             self.vision_tower = model.get_vision_tower()
+            if self.is_cpu:
+                self.model.to(dtype=self.torch_dtype)
+                self._quantize_for_cpu()
             
             self._loaded = True
             logger.info(f"Model loaded successfully on {self.device}")
@@ -136,51 +314,185 @@ class LLaVAWrapper:
             logger.error("Install with: pip install llava")
             raise
     
-    def encode_image(self, image: Union[np.ndarray, Image.Image]) -> torch.Tensor:
+    def _quantize_for_cpu(self) -> None:
+        """Set the CPU thread count and quantize the language model weights."""
+        threads = set_cpu_threads(self.cpu_threads)
+        mode = cpu_quant_mode(self.quantization)
+        before = weight_bytes(self.model)
+        quantized, _ = quantize_model_cpu(self.model, mode, group_size=self.quant_group_size)
+        logger.info(
+            f"CPU {mode}: {quantized} linear layers quantized, weights "
+            f"{before / 2**20:.1f} -> {weight_bytes(self.model) / 2**20:.1f} MiB, {threads} threads"
+        )
+    
+    def preprocess_image(self, image: Union[np.ndarray, Image.Image, torch.Tensor]) -> torch.Tensor:
         """
-        Encode image to visual tokens.
+        Preprocess image into vision tower pixel values.
         
         Args:
-            image: Input image (numpy array or PIL Image)
+            image: Input image (numpy array or PIL Image), or an RGB uint8
+                tensor [H, W, 3] / [B, H, W, 3] for the tensor-native path
             
         Returns:
-            Visual tokens [1, L, D]
+            Pixel values [1, 3, H, W] on the target device
         """
         self.load_model()
         
+        if isinstance(image, torch.Tensor):
+            if not self.is_anyres:
+                return self.get_tensor_preprocessor()(image)
+            # Anyres tiling still goes through the llava/PIL path
+            image = image.cpu().numpy()
+        
         if isinstance(image, np.ndarray):
             image = Image.fromarray(image)
         
-        # Process image
-        image_tensor = self.image_processor.preprocess(
-            image,
-            return_tensors="pt"
-        )["pixel_values"]
+        if self.is_anyres:
+            # Base image + tiles: [1 + T, 3, H, W]
+            from llava.mm_utils import process_images
+            image_tensor = process_images([image], self.image_processor, self.model.config)
+            if isinstance(image_tensor, list):
+                image_tensor = image_tensor[0]
+        else:
+            image_tensor = self.image_processor.preprocess(
+                image,
+                return_tensors="pt"
+            )["pixel_values"]
         
-        image_tensor = image_tensor.to(
+        return image_tensor.to(
             device=self.device,
             dtype=self.torch_dtype
         )
+    
+    def get_tensor_preprocessor(self) -> TensorPreprocessor:
+        """Tensor-native preprocessor mirroring the model's image processor."""
+        if self.tensor_preprocessor is None:
+            self.load_model()
+            self.tensor_preprocessor = TensorPreprocessor.from_image_processor(
+                self.image_processor,
+                device=self.device,
+                dtype=self.torch_dtype
+            )
+            if self.tensor_preprocess:
+                error = self.tensor_preprocessor.validate(self.image_processor)
+                logger.info(f"Tensor preprocessing max abs error vs HF processor: {error:.4f}")
+        return self.tensor_preprocessor
+    
+    def encode_pixels(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        """
+        Run the vision tower on preprocessed pixel values.
+        
+        Args:
+            pixel_values: Pixel values [B, 3, H, W]
+            
+        Returns:
+            Visual tokens [B, L, D]
+        """
+        self.load_model()
         
-        # Get visual features
         with torch.no_grad():
-            image_features = self.vision_tower(image_tensor)
+            image_features = self.vision_tower(pixel_values)
+        
+        return image_features
+    
+    def encode_image_masked(
+        self,
+        image: Union[np.ndarray, Image.Image],
+        mask: torch.Tensor,
+        prune_after_layer: int = 0,
+        summary_weights: Optional[torch.Tensor] = None
+    ) -> torch.Tensor:
+        """
+        Encode only the patches kept by a pruning mask (input-level pruning).
+        
+        Args:
+            image: Input image (numpy array or PIL Image)
+            mask: Binary patch mask [L]
+            prune_after_layer: ViT layers to run on the full sequence first
+            summary_weights: Optional background summary pooling weights
+                [K_s, L] over the patches (TokenPruner.summary_weights)
+            
+        Returns:
+            Visual tokens [1, K (+ K_s), D]: the kept patches, then the
+            summary tokens
+        """
+        from src.vlm.masked_vision import encode_kept_patches
+        
+        pixel_values = self.preprocess_image(image)
+        kept_indices = mask.nonzero(as_tuple=True)[0]
+        
+        return encode_kept_patches(
+            self.vision_tower,
+            pixel_values,
+            kept_indices,
+            select_layer=getattr(self.vision_tower, "select_layer", -2),
+            prune_after_layer=prune_after_layer,
+            summary_weights=summary_weights
+        )
+    
+    def encode_image(self, image: Union[np.ndarray, Image.Image]) -> torch.Tensor:
+        """
+        Encode image to visual tokens.
+        
+        Args:
+            image: Input image (numpy array or PIL Image)
+            
+        Returns:
+            Visual tokens [1, L, D]; for anyres models the base image and
+            tiles are concatenated into [1, (1 + T) * L, D] and projected
+            into the LLM embedding space, where AnyResTokenPruner packs
+            them with image_newline
+        """
+        pixel_values = self.preprocess_image(image)
+        
+        if self.feature_cache is not None:
+            key = FeatureCache.make_key(self.vision_tower_id, pixel_values)
+            image_features = self.feature_cache.get(key, self.device, self.torch_dtype)
+            if image_features is None:
+                image_features = self.encode_pixels(pixel_values)
+                self.feature_cache.put(key, image_features)
+        else:
+            image_features = self.encode_pixels(pixel_values)
+        
+        if self.is_anyres:
+            image_features = self._project_image_features(
+                image_features.reshape(1, -1, image_features.shape[-1])
+            )
         
         return image_features
     
+    def image_newline(self) -> Optional[torch.Tensor]:
+        """
+        LLaVA-1.6 row separator embedding [D] of anyres packing.
+        
+        Returns:
+            The model's image_newline, or None for models without one
+        """
+        if not self.is_anyres:
+            return None
+        self.load_model()
+        model = self.model.get_model() if hasattr(self.model, "get_model") else self.model
+        newline = getattr(model, "image_newline", None)
+        return newline.detach() if newline is not None else None
+    
     def generate(
         self,
         image: Union[np.ndarray, Image.Image],
         prompt: str,
-        pruned_tokens: Optional[torch.Tensor] = None
+        pruned_tokens: Optional[torch.Tensor] = None,
+        prompt_suffix: Optional[str] = None,
+        hazard_level: Optional[str] = None
     ) -> VLMOutput:
         """
         Generate caption for image.
         
         Args:
             image: Input image
-            prompt: Text prompt
+            prompt: Text prompt (the shared template when prompt_suffix is given)
             pruned_tokens: Optional pre-pruned visual tokens
+            prompt_suffix: Optional per-frame text placed after the image
+                (e.g. "Detected objects: ..."); enables prefix KV caching
+            hazard_level: Hazard level selecting the token budget
             
         Returns:
             VLMOutput with generated caption
@@ -188,6 +500,14 @@ class LLaVAWrapper:
         import time
         self.load_model()
         
+        if self._decodes_from_embeds(prompt_suffix):
+            return self._generate_from_stream(
+                image, prompt, prompt_suffix, pruned_tokens, hazard_level
+            )
+        if prompt_suffix:
+            # No prefix cache: the suffix is part of the full prompt
+            prompt = f"{prompt}\n{prompt_suffix}"
+        
         start_time = time.time()
         
         # Encode image if tokens not provided
@@ -198,50 +518,604 @@ class LLaVAWrapper:
         
         tokens_used = image_features.shape[1] if image_features.dim() > 1 else 0
         
-        # Prepare prompt
-        full_prompt = self._format_prompt(prompt)
+        # Tokenize the formatted prompt (memoized per prompt text)
+        input_ids = self._tokenize(self._format_prompt(prompt))
         
-        # Tokenize
-        input_ids = self.tokenizer(
-            full_prompt,
-            return_tensors="pt"
-        ).input_ids.to(self.device)
+        budget = self.token_budget(hazard_level)
+        stopper = self.make_stopper(prompt)
+        stop_kwargs = {}
+        if stopper is not None:
+            # Output rows hold only new tokens when LLaVA's generate() decodes
+            # from inputs_embeds, else the prompt first: strip it either way
+            stop_kwargs["stopping_criteria"] = hf_stopping_criteria(
+                [stopper], [budget], prompt_ids=input_ids[0]
+            )
         
         # Generate
+        streamer = TimingStreamer()
+        lm_start = time.time()
         with torch.no_grad():
             output_ids = self.model.generate(
                 input_ids,
                 images=image_features if pruned_tokens is None else None,
                 image_features=pruned_tokens,
-                max_new_tokens=self.max_new_tokens,
+                max_new_tokens=budget,
                 temperature=self.temperature,
                 do_sample=self.do_sample,
-                use_cache=True
+                use_cache=True,
+                streamer=streamer,
+                **stop_kwargs
             )
+        end_time = time.time()
         
-        # Decode
-        caption = self.tokenizer.decode(
-            output_ids[0],
-            skip_special_tokens=True
-        )
-        
-        # Remove prompt from output
-        caption = caption.replace(full_prompt, "").strip()
+        # Decode only the generated ids (either output shape)
+        generated_ids = self._strip_prompt_ids(output_ids[0], input_ids[0])
+        caption = self.tokenizer.decode(generated_ids, skip_special_tokens=True).strip()
+        if stopper is not None:
+            caption = stopper.trim(caption)
         
-        generation_time = time.time() - start_time
+        generation_time = end_time - start_time
+        generated_tokens = len(self._strip_special(generated_ids))
+        first_token_time = streamer.first_token_time or end_time
         
         return VLMOutput(
             caption=caption,
             hazard_level="unknown",  # Set by caller
             confidence=1.0,
             tokens_used=tokens_used,
-            generation_time=generation_time
+            generation_time=generation_time,
+            generated_tokens=generated_tokens,
+            prefill_time=first_token_time - lm_start,
+            time_to_first_token=first_token_time - start_time,
+            decode_tokens_per_sec=tokens_per_second(generated_tokens, first_token_time, end_time)
+        )
+    
+    def generate_stream(
+        self,
+        image: Union[np.ndarray, Image.Image],
+        prompt: str,
+        pruned_tokens: Optional[torch.Tensor] = None,
+        prompt_suffix: Optional[str] = None,
+        hazard_level: Optional[str] = None
+    ) -> Iterator[StreamChunk]:
+        """
+        Generate a caption incrementally, yielding text as it is decoded.
+        
+        Text that could still turn into a stop sequence is held back, so the
+        concatenated chunks equal the final caption. The last chunk carries
+        the complete VLMOutput with prefill/TTFT/decode timings.
+        
+        Args:
+            image: Input image
+            prompt: Text prompt (the shared template when prompt_suffix is given)
+            pruned_tokens: Optional pre-pruned visual tokens
+            prompt_suffix: Optional per-frame text placed after the image;
+                served from the prefix KV-cache when it is enabled
+            hazard_level: Hazard level selecting the token budget
+            
+        Yields:
+            StreamChunk per decoded text delta, then a final chunk
+        """
+        import time
+        self.load_model()
+        start_time = time.time()
+        
+        image_features = self.encode_image(image) if pruned_tokens is None else pruned_tokens
+        if image_features.dim() == 2:
+            image_features = image_features.unsqueeze(0)
+        
+        past_key_values = None
+        prefix_tokens = 0
+        if self.prefix_cache is not None and prompt_suffix is not None:
+            prefix_text, suffix_text = self._format_prompt_parts(prompt, prompt_suffix)
+            entry = self.prefix_cache.lookup(prefix_text, self.model, self.tokenizer, self.device)
+            past_key_values = entry.past_key_values
+            prefix_tokens = entry.num_tokens
+            
+            # Suffix embeddings: text before <image>, image tokens, text after
+            before, after = suffix_text.split("<image>", 1)
+            with torch.no_grad():
+                parts = [self._project_image_features(image_features)]
+                if before:
+                    parts.insert(0, self._embed_text(before))
+                parts.append(self._embed_text(after))
+            prompt_text = prefix_text + suffix_text
+        else:
+            full_prompt = f"{prompt}\n{prompt_suffix}" if prompt_suffix else prompt
+            parts = self._embed_prompt_parts(image_features, full_prompt)
+            prompt_text = self._format_prompt(full_prompt)
+        
+        inputs_embeds = torch.cat(parts, dim=1)
+        visual_start = prefix_tokens + inputs_embeds.shape[1] - parts[-1].shape[1] - parts[-2].shape[1]
+        visual_span = (visual_start, visual_start + parts[-2].shape[1])
+        
+        stopper = self.make_stopper(prompt)
+        drafter = self.get_drafter()
+        lm_start = time.time()
+        if drafter is not None:
+            # Drafts condition on the prompt text, incl. detected classes
+            context_ids = self._tokenize(prompt_text.replace("<image>", ""))[0].tolist()
+            stream = speculative_from_embeds(
+                self.model,
+                inputs_embeds,
+                drafter,
+                context_ids,
+                past_key_values=past_key_values,
+                max_new_tokens=self.token_budget(hazard_level),
+                eos_token_id=self.tokenizer.eos_token_id,
+                stop_fn=stopper
+            )
+        else:
+            stream = stream_from_embeds(
+                self.model,
+                inputs_embeds,
+                past_key_values=past_key_values,
+                max_new_tokens=self.token_budget(hazard_level),
+                eos_token_id=self.tokenizer.eos_token_id,
+                do_sample=self.do_sample,
+                temperature=self.temperature,
+                stop_fn=stopper,
+                kv_policy=self.kv_policy,
+                visual_span=visual_span
+            )
+        
+        token_ids: List[int] = []
+        emitted = ""
+        while True:
+            try:
+                token_ids.append(next(stream))
+            except StopIteration as stop:
+                decoded = stop.value
+                break
+            
+            text = self.tokenizer.decode(token_ids, skip_special_tokens=True).strip()
+            if stopper is not None:
+                text = stopper.safe_prefix(text)
+            if len(text) > len(emitted) and text.startswith(emitted):
+                yield StreamChunk(text=text[len(emitted):], num_tokens=len(token_ids))
+                emitted = text
+        end_time = time.time()
+        
+        caption = self.tokenizer.decode(decoded.token_ids, skip_special_tokens=True).strip()
+        if stopper is not None:
+            caption = stopper.trim(caption)
+        
+        first_token_time = decoded.first_token_time or end_time
+        output = VLMOutput(
+            caption=caption,
+            hazard_level="unknown",  # Set by caller
+            confidence=1.0,
+            tokens_used=image_features.shape[1],
+            generation_time=end_time - start_time,
+            prefix_tokens_cached=prefix_tokens,
+            generated_tokens=len(decoded.token_ids),
+            prefill_time=first_token_time - lm_start,
+            time_to_first_token=first_token_time - start_time,
+            decode_tokens_per_sec=tokens_per_second(
+                len(decoded.token_ids), decoded.first_token_time, end_time
+            ),
+            kv_cache_bytes=decoded.kv_cache_bytes,
+            peak_memory_bytes=decoded.peak_memory_bytes,
+            draft_acceptance_rate=(
+                decoded.accepted_draft_tokens / max(decoded.proposed_draft_tokens, 1)
+            )
         )
+        remainder = caption[len(emitted):] if caption.startswith(emitted) else ""
+        yield StreamChunk(text=remainder, num_tokens=len(token_ids), output=output)
+    
+    def generate_batch(
+        self,
+        images_or_features: List[Union[np.ndarray, Image.Image, torch.Tensor]],
+        prompts: List[str],
+        hazard_levels: Optional[List[str]] = None
+    ) -> List[VLMOutput]:
+        """
+        Generate captions for a batch of images in one generate call.
+        
+        Each item is embedded as prompt text around its own (possibly
+        pruned, variable-length) visual tokens; sequences are left-padded
+        to a common length with an attention mask.
+        
+        Args:
+            images_or_features: Images, or visual tokens [L, D] / [1, L, D]
+            prompts: Text prompt per item
+            hazard_levels: Optional hazard level per item selecting its budget
+            
+        Returns:
+            One VLMOutput per item with amortized generation time
+        """
+        import time
+        self.load_model()
+        
+        if len(images_or_features) != len(prompts):
+            raise ValueError(
+                f"Got {len(images_or_features)} images but {len(prompts)} prompts"
+            )
+        if not prompts:
+            return []
+        
+        start_time = time.time()
+        
+        item_embeds = []
+        tokens_used = []
+        for item, prompt in zip(images_or_features, prompts):
+            features = item if isinstance(item, torch.Tensor) else self.encode_image(item)
+            if features.dim() == 2:
+                features = features.unsqueeze(0)
+            tokens_used.append(features.shape[1])
+            item_embeds.append(self._build_inputs_embeds(features, prompt))
+        
+        inputs_embeds, attention_mask = self._left_pad(item_embeds)
+        
+        # Per-row budgets and early stops; the batch ends when every row stopped
+        budgets = [self.token_budget(level) for level in (hazard_levels or [None] * len(prompts))]
+        stoppers = [self.make_stopper(prompt) for prompt in prompts]
+        stop_kwargs = {}
+        if any(stoppers) or len(set(budgets)) > 1:
+            stop_kwargs["stopping_criteria"] = hf_stopping_criteria(stoppers, budgets)
+        
+        streamer = TimingStreamer()
+        lm_start = time.time()
+        with torch.no_grad():
+            output_ids = self._lm_generate(
+                inputs_embeds=inputs_embeds,
+                attention_mask=attention_mask,
+                max_new_tokens=max(budgets),
+                streamer=streamer,
+                **stop_kwargs
+            )
+        end_time = time.time()
+        
+        amortized_time = (end_time - start_time) / len(prompts)
+        first_token_time = streamer.first_token_time or end_time
+        
+        outputs = []
+        for ids, num_tokens, budget, stopper in zip(output_ids, tokens_used, budgets, stoppers):
+            ids = self._strip_special(ids)[:budget]
+            caption = self.tokenizer.decode(ids, skip_special_tokens=True).strip()
+            outputs.append(VLMOutput(
+                caption=stopper.trim(caption) if stopper is not None else caption,
+                hazard_level="unknown",  # Set by caller
+                confidence=1.0,
+                tokens_used=num_tokens,
+                generation_time=amortized_time,
+                generated_tokens=len(ids),
+                prefill_time=first_token_time - lm_start,
+                time_to_first_token=first_token_time - start_time,
+                decode_tokens_per_sec=tokens_per_second(len(ids), first_token_time, end_time)
+            ))
+        return outputs
+    
+    def submit(
+        self,
+        image: Union[np.ndarray, Image.Image],
+        prompt: str,
+        pruned_tokens: Optional[torch.Tensor] = None,
+        hazard_level: Optional[str] = None
+    ) -> Future:
+        """
+        Queue a caption request on the continuous-batching engine.
+        
+        The request joins the running decode batch at the next token
+        boundary and leaves as soon as it finishes, so a long caption
+        does not hold back shorter ones.
+        
+        Args:
+            image: Input image (ignored if pruned_tokens is given)
+            prompt: Full text prompt
+            pruned_tokens: Optional pre-pruned visual tokens
+            hazard_level: Hazard level selecting the token budget
+            
+        Returns:
+            Future resolving to a VLMOutput
+        """
+        engine = self.get_engine()
+        
+        image_features = pruned_tokens if pruned_tokens is not None else self.encode_image(image)
+        if image_features.dim() == 2:
+            image_features = image_features.unsqueeze(0)
+        tokens_used = image_features.shape[1]
+        
+        inputs_embeds = self._build_inputs_embeds(image_features, prompt)
+        stopper = self.make_stopper(prompt)
+        
+        output: Future = Future()
+        
+        def _on_done(request: Future) -> None:
+            try:
+                result = request.result()
+            except Exception as exc:
+                output.set_exception(exc)
+                return
+            caption = self.tokenizer.decode(result.token_ids, skip_special_tokens=True).strip()
+            output.set_result(VLMOutput(
+                caption=stopper.trim(caption) if stopper is not None else caption,
+                hazard_level="unknown",  # Set by caller
+                confidence=1.0,
+                tokens_used=tokens_used,
+                generation_time=result.queue_time + result.prefill_time + result.decode_time,
+                generated_tokens=len(result.token_ids),
+                prefill_time=result.prefill_time,
+                time_to_first_token=result.queue_time + result.prefill_time,
+                decode_tokens_per_sec=(
+                    (len(result.token_ids) - 1) / result.decode_time
+                    if len(result.token_ids) > 1 and result.decode_time > 0 else 0.0
+                )
+            ))
+        
+        engine.submit(
+            inputs_embeds,
+            max_new_tokens=self.token_budget(hazard_level),
+            stop_fn=stopper
+        ).add_done_callback(_on_done)
+        return output
+    
+    def get_engine(self) -> ContinuousBatchingEngine:
+        """Create and start the continuous-batching engine on first use."""
+        if self.engine is None:
+            self.load_model()
+            self.engine = ContinuousBatchingEngine(
+                self.model,
+                eos_token_id=self.tokenizer.eos_token_id,
+                max_new_tokens=self.max_new_tokens,
+                max_batch_size=self.max_batch_size,
+                block_size=self.kv_block_size,
+                num_blocks=self.kv_num_blocks,
+                do_sample=self.do_sample,
+                temperature=self.temperature
+            )
+            self.engine.start()
+        return self.engine
+    
+    def get_drafter(self):
+        """Speculative drafter, loading the draft model on first use (None when off)."""
+        if self.speculative == "off":
+            return None
+        if self.drafter is None:
+            draft_model = self.draft_model
+            if isinstance(draft_model, str):
+                from transformers import AutoModelForCausalLM
+                
+                logger.info(f"Loading draft model: {draft_model}")
+                draft_model = AutoModelForCausalLM.from_pretrained(
+                    draft_model, torch_dtype=self.torch_dtype
+                ).eval().to(self.device)
+            self.drafter = get_drafter(
+                self.speculative,
+                num_tokens=self.num_draft_tokens,
+                draft_model=draft_model,
+                max_ngram=self.prompt_lookup_ngram,
+                device=self.device
+            )
+        return self.drafter
+    
+    def close(self) -> None:
+        """Stop the continuous-batching engine if it is running."""
+        if self.engine is not None:
+            self.engine.stop()
+            self.engine = None
+    
+    def benchmark_kv_policies(
+        self,
+        image: Union[np.ndarray, Image.Image],
+        prompt: str,
+        policies: Optional[Dict[str, Optional[KVCachePolicy]]] = None,
+        num_runs: int = 3
+    ) -> Dict[str, Dict[str, float]]:
+        """
+        Compare KV-cache policies with the dense cache on one frame.
+        
+        All policies decode through the same embedding-level loop from the
+        same image features, so differences come from the cache alone.
+        
+        Args:
+            image: Input image
+            prompt: Text prompt
+            policies: Policies by name (default: visual_topk, sink_window).
+                int8 rounding (quantize_int8) only simulates int8 accuracy;
+                such entries are flagged int8_simulated and their memory
+                reflects eviction alone
+            num_runs: Runs averaged per policy
+            
+        Returns:
+            Per policy: kv_cache_bytes, peak_memory_bytes (CUDA only),
+            ms_per_token, memory_ratio and latency_ratio vs dense,
+            whether the caption matches dense, and int8_simulated
+        """
+        from src.vlm.kv_policy import SinkWindowPolicy, VisualTopKPolicy
+        
+        if policies is None:
+            policies = {
+                "visual_topk": VisualTopKPolicy(),
+                "sink_window": SinkWindowPolicy(),
+            }
+        
+        if self.speculative != "off":
+            logger.warning("Speculative decoding ignores kv_policy; all policies will match dense")
+        
+        self.load_model()
+        image_features = self.encode_image(image)
+        configured = self.kv_policy
+        results = {}
+        try:
+            for name, policy in [("dense", None), *policies.items()]:
+                self.kv_policy = policy
+                outputs = [
+                    self._generate_from_stream(image, prompt, pruned_tokens=image_features)
+                    for _ in range(num_runs)
+                ]
+                rates = [o.decode_tokens_per_sec for o in outputs if o.decode_tokens_per_sec > 0]
+                results[name] = {
+                    "kv_cache_bytes": float(outputs[-1].kv_cache_bytes),
+                    "peak_memory_bytes": float(outputs[-1].peak_memory_bytes),
+                    "ms_per_token": float(1000.0 / np.mean(rates)) if rates else 0.0,
+                    "caption": outputs[-1].caption,
+                    "int8_simulated": float(policy is not None and policy.quantize_int8),
+                }
+        finally:
+            self.kv_policy = configured
+        
+        dense = results["dense"]
+        dense_caption = dense["caption"]
+        for metrics in results.values():
+            metrics["memory_ratio"] = metrics["kv_cache_bytes"] / max(dense["kv_cache_bytes"], 1.0)
+            metrics["latency_ratio"] = (
+                metrics["ms_per_token"] / dense["ms_per_token"] if dense["ms_per_token"] else 0.0
+            )
+            metrics["caption_match"] = float(metrics.pop("caption") == dense_caption)
+        return results
+    
+    def token_budget(self, hazard_level: Optional[str] = None) -> int:
+        """Max new tokens for a hazard level (global max_new_tokens if unset)."""
+        if hazard_level is None:
+            return self.max_new_tokens
+        return self.token_budgets.get(hazard_level, self.max_new_tokens)
+    
+    def make_stopper(self, prompt: str) -> Optional[CaptionStopper]:
+        """Early-stop criterion for a prompt, or None if all rules are off."""
+        stopper = CaptionStopper(
+            self.tokenizer,
+            num_fields=count_numbered_fields(prompt) if self.structured_stop else 0,
+            stop_sequences=self.stop_sequences,
+            repetition_ngram=self.repetition_ngram,
+            repetition_max=self.repetition_max
+        )
+        return stopper if stopper.enabled else None
+    
+    def _strip_special(self, ids: torch.Tensor) -> List[int]:
+        """Generated ids up to the first EOS/pad token."""
+        stop_ids = {self.tokenizer.eos_token_id, getattr(self.tokenizer, "pad_token_id", None)}
+        tokens = []
+        for token in ids.tolist():
+            if token in stop_ids:
+                break
+            tokens.append(token)
+        return tokens
+    
+    def _build_inputs_embeds(self, image_features: torch.Tensor, prompt: str) -> torch.Tensor:
+        """Embed a formatted prompt with image tokens at <image>: [1, T, H]."""
+        return torch.cat(self._embed_prompt_parts(image_features, prompt), dim=1)
+    
+    def _embed_prompt_parts(self, image_features: torch.Tensor, prompt: str) -> List[torch.Tensor]:
+        """Embeddings of (text before <image> with BOS, image tokens, text after)."""
+        before, after = self._format_prompt(prompt).split("<image>", 1)
+        
+        with torch.no_grad():
+            bos_ids = self._tokenize(before)
+            return [
+                self.model.get_input_embeddings()(bos_ids),
+                self._project_image_features(image_features),
+                self._embed_text(after)
+            ]
+    
+    def _left_pad(self, item_embeds: List[torch.Tensor]) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Left-pad [1, T_i, H] embeddings into [B, T, H] plus attention mask [B, T]."""
+        max_len = max(e.shape[1] for e in item_embeds)
+        batch = item_embeds[0].new_zeros(len(item_embeds), max_len, item_embeds[0].shape[-1])
+        attention_mask = torch.zeros(len(item_embeds), max_len, dtype=torch.long, device=batch.device)
+        
+        for i, embeds in enumerate(item_embeds):
+            length = embeds.shape[1]
+            batch[i, max_len - length:] = embeds[0]
+            attention_mask[i, max_len - length:] = 1
+        
+        return batch, attention_mask
+    
+    def _lm_generate(self, **kwargs) -> torch.Tensor:
+        """
+        Run HF generation on input embeddings.
+        
+        LLaVA's own generate() rejects inputs_embeds, so the base
+        GenerationMixin implementation is called directly.
+        """
+        from transformers import GenerationMixin
+        
+        pad_token_id = getattr(self.tokenizer, "pad_token_id", None)
+        if pad_token_id is None:
+            pad_token_id = self.tokenizer.eos_token_id
+        
+        generation_kwargs = dict(
+            max_new_tokens=self.max_new_tokens,
+            do_sample=self.do_sample,
+            pad_token_id=pad_token_id,
+            eos_token_id=self.tokenizer.eos_token_id,
+            use_cache=True
+        )
+        if self.do_sample:
+            generation_kwargs["temperature"] = self.temperature
+        generation_kwargs.update(kwargs)
+        
+        return GenerationMixin.generate(self.model, **generation_kwargs)
     
     def _format_prompt(self, prompt: str) -> str:
         """Format prompt for LLaVA."""
         return f"USER: <image>\n{prompt}\nASSISTANT:"
     
+    def _format_prompt_parts(self, prompt: str, suffix: str) -> Tuple[str, str]:
+        """
+        Format prompt as (shared prefix, per-frame suffix).
+        
+        The image-independent template comes first so its KV states can be
+        cached; the image placeholder and per-frame text follow.
+        """
+        suffix = f"{suffix}\n" if suffix else ""
+        return f"USER: {prompt}\n", f"<image>\n{suffix}ASSISTANT:"
+    
+    def _embed_text(self, text: str) -> torch.Tensor:
+        """Embed text without special tokens: [1, T, H]."""
+        input_ids = self._tokenize(text, add_special_tokens=False)
+        return self.model.get_input_embeddings()(input_ids)
+    
+    def _tokenize(self, text: str, add_special_tokens: bool = True) -> torch.Tensor:
+        """Token ids [1, T] on the device, from the prompt token cache when enabled."""
+        if self.prompt_token_cache is not None:
+            return self.prompt_token_cache.lookup(text, self.tokenizer, self.device, add_special_tokens)
+        return self.tokenizer(
+            text,
+            return_tensors="pt",
+            add_special_tokens=add_special_tokens
+        ).input_ids.to(self.device)
+    
+    @staticmethod
+    def _strip_prompt_ids(output_ids: torch.Tensor, prompt_ids: torch.Tensor) -> torch.Tensor:
+        """
+        Generated ids of a generate() output row.
+        
+        LLaVA releases whose generate() decodes from input embeddings
+        return only new tokens; generation from input ids returns the
+        prompt first, which is sliced off.
+        """
+        return strip_prompt_ids(output_ids, prompt_ids)
+    
+    def _project_image_features(self, image_features: torch.Tensor) -> torch.Tensor:
+        """Project vision-tower features into the LLM embedding space."""
+        embed_dim = self.model.get_input_embeddings().embedding_dim
+        if image_features.shape[-1] != embed_dim and hasattr(self.model, "get_model"):
+            image_features = self.model.get_model().mm_projector(image_features)
+        return image_features.to(
+            device=self.model.get_input_embeddings().weight.device,
+            dtype=self.model.get_input_embeddings().weight.dtype
+        )
+    
+    def _decodes_from_embeds(self, prompt_suffix: Optional[str]) -> bool:
+        """Whether generate() needs the embedding-level decode loop."""
+        return self.kv_policy is not None or self.speculative != "off" or (
+            self.prefix_cache is not None and prompt_suffix is not None
+        )
+    
+    def _generate_from_stream(
+        self,
+        image: Union[np.ndarray, Image.Image],
+        prompt: str,
+        prompt_suffix: Optional[str] = None,
+        pruned_tokens: Optional[torch.Tensor] = None,
+        hazard_level: Optional[str] = None
+    ) -> VLMOutput:
+        """Generate with the embedding-level loop (prefix KV-cache, KV policies)."""
+        for chunk in self.generate_stream(image, prompt, pruned_tokens, prompt_suffix, hazard_level):
+            pass
+        return chunk.output
+    
     def get_vision_tower_config(self) -> Dict[str, Any]:
         """Get vision tower configuration."""
         self.load_model()
@@ -257,32 +1131,368 @@ class LLaVAWrapper:
 class MockLLaVAWrapper(LLaVAWrapper):
     """
     Mock LLaVA wrapper for testing without GPU.
-    Returns dummy outputs for development and unit testing.
+    
+    Returns seeded dummy outputs and, with a latency model, blocks for the
+    prefill/decode time a real model would take, so schedulers, batching
+    and caches can be load-tested on CPU. Visual features are preallocated
+    once and shared by every call.
     """
     
-    def __init__(self, **kwargs):
+    CAPTION = "[Mock] A worker is performing a task in an industrial setting."
+    
+    def __init__(
+        self,
+        seed: int = 0,
+        latency: Optional[LatencyModel] = None,
+        num_visual_tokens: int = 576,
+        feature_dim: int = 4096,
+        caption_tokens: Tuple[int, int] = (24, 96),
+        **kwargs
+    ):
+        """
+        Args:
+            seed: Seed of the features, caption lengths and jitter
+            latency: Latency model (per_call = vision encoding per image)
+            num_visual_tokens: Visual tokens per image
+            feature_dim: Visual feature dimension
+            caption_tokens: Range of generated tokens per caption (capped by
+                the hazard-level token budget)
+        """
+        kwargs.setdefault("device", "cpu")
         super().__init__(**kwargs)
+        self.seed = seed
+        self.latency = latency or LatencyModel()
+        self.caption_tokens = caption_tokens
+        self.rng = np.random.default_rng(seed)
+        
+        generator = torch.Generator().manual_seed(seed)
+        self._features = torch.randn(1, num_visual_tokens, feature_dim, generator=generator)
         self._loaded = True  # Skip actual loading
     
     def load_model(self) -> None:
         pass  # No-op
     
+    def reset(self) -> None:
+        """Restart the seeded caption-length and jitter sequence for a new run."""
+        self.rng = np.random.default_rng(self.seed)
+    
+    def preprocess_image(self, image: Union[np.ndarray, Image.Image, torch.Tensor]) -> torch.Tensor:
+        # Resize to the CLIP input resolution without normalization
+        if isinstance(image, torch.Tensor):
+            image = image.cpu().numpy()
+        array = np.asarray(image, dtype=np.float32) / 255.0
+        pixels = torch.from_numpy(array).permute(2, 0, 1).unsqueeze(0)
+        return torch.nn.functional.interpolate(
+            pixels, size=(336, 336), mode="bilinear", align_corners=False
+        )
+    
+    def encode_pixels(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        # Shared dummy tokens [B, N, D]
+        self.latency.wait(pixel_values.shape[0] * self.latency.cost(rng=self.rng))
+        return self._features.expand(pixel_values.shape[0], -1, -1)
+    
     def encode_image(self, image: Union[np.ndarray, Image.Image]) -> torch.Tensor:
-        # Return dummy tokens [1, 576, 4096]
-        return torch.randn(1, 576, 4096)
+        # Shared dummy tokens [1, N, D]
+        self.latency.wait(self.latency.cost(rng=self.rng))
+        return self._features
+    
+    def encode_image_masked(
+        self,
+        image: Union[np.ndarray, Image.Image],
+        mask: torch.Tensor,
+        prune_after_layer: int = 0,
+        summary_weights: Optional[torch.Tensor] = None
+    ) -> torch.Tensor:
+        # Shared dummy tokens [1, K (+ K_s), D]
+        self.latency.wait(self.latency.cost(rng=self.rng))
+        num_summary = summary_weights.shape[-2] if summary_weights is not None else 0
+        return self._features[:, :int(mask.sum()) + num_summary]
     
     def generate(
         self,
         image: Union[np.ndarray, Image.Image],
         prompt: str,
-        pruned_tokens: Optional[torch.Tensor] = None
+        pruned_tokens: Optional[torch.Tensor] = None,
+        prompt_suffix: Optional[str] = None,
+        hazard_level: Optional[str] = None
     ) -> VLMOutput:
-        tokens_used = pruned_tokens.shape[1] if pruned_tokens is not None else 576
+        return self._run(self._simulate(
+            [image], [prompt], [pruned_tokens], [hazard_level], prompt_suffix
+        ))[0]
+    
+    def generate_batch(
+        self,
+        images_or_features: List[Union[np.ndarray, Image.Image, torch.Tensor]],
+        prompts: List[str],
+        hazard_levels: Optional[List[str]] = None
+    ) -> List[VLMOutput]:
+        images = [None if isinstance(item, torch.Tensor) else item for item in images_or_features]
+        features = [item if isinstance(item, torch.Tensor) else None for item in images_or_features]
+        return self._run(self._simulate(
+            images, prompts, features, hazard_levels or [None] * len(prompts)
+        ))
+    
+    def generate_stream(
+        self,
+        image: Union[np.ndarray, Image.Image],
+        prompt: str,
+        pruned_tokens: Optional[torch.Tensor] = None,
+        prompt_suffix: Optional[str] = None,
+        hazard_level: Optional[str] = None
+    ) -> Iterator[StreamChunk]:
+        words = self.CAPTION.split(" ")
+        stream = self._simulate(
+            [image], [prompt], [pruned_tokens], [hazard_level], prompt_suffix, chunks=len(words)
+        )
+        while True:
+            try:
+                i = next(stream)
+            except StopIteration as stop:
+                yield StreamChunk(text=words[-1], num_tokens=len(words), output=stop.value[0])
+                return
+            yield StreamChunk(text=words[i] + " ", num_tokens=i + 1)
+    
+    def submit(
+        self,
+        image: Union[np.ndarray, Image.Image],
+        prompt: str,
+        pruned_tokens: Optional[torch.Tensor] = None,
+        hazard_level: Optional[str] = None
+    ) -> Future:
+        future: Future = Future()
+        future.set_result(self.generate(image, prompt, pruned_tokens, hazard_level=hazard_level))
+        return future
+    
+    def _simulate(
+        self,
+        images: List[Any],
+        prompts: List[str],
+        features: List[Optional[torch.Tensor]],
+        hazard_levels: List[Optional[str]],
+        prompt_suffix: Optional[str] = None,
+        chunks: int = 1
+    ) -> Generator[int, None, List[VLMOutput]]:
+        """
+        Simulate one batched prefill and decode.
         
-        return VLMOutput(
-            caption="[Mock] A worker is performing a task in an industrial setting.",
-            hazard_level="standard",
-            confidence=0.95,
-            tokens_used=tokens_used,
-            generation_time=0.1
+        Sequences are prefilled together, then decoded in lockstep until the
+        longest caption is done. The decode is split into `chunks` equal
+        slices; the index of each slice but the last is yielded, and the
+        outputs are the generator's return value.
+        """
+        import time
+        start_time = time.time()
+        
+        tokens_used = []
+        for image, item in zip(images, features):
+            if item is None:
+                item = self.encode_image(image)
+            tokens_used.append(item.shape[1] if item.dim() > 1 else 0)
+        
+        num_tokens = [
+            min(int(self.rng.integers(self.caption_tokens[0], self.caption_tokens[1] + 1)),
+                self.token_budget(level))
+            for level in hazard_levels
+        ]
+        suffix_tokens = len(prompt_suffix) // 4 if prompt_suffix else 0
+        prefill_tokens = sum(
+            used + len(prompt) // 4 + suffix_tokens for used, prompt in zip(tokens_used, prompts)
+        )
+        
+        lm_start = time.time()
+        self.latency.wait(self.latency.cost(prefill_tokens=prefill_tokens, rng=self.rng, include_call=False))
+        first_token_time = time.time()
+        decode_time = self.latency.cost(decode_tokens=max(num_tokens), rng=self.rng, include_call=False)
+        
+        for i in range(chunks):
+            self.latency.wait(decode_time / chunks)
+            if i < chunks - 1:
+                yield i
+        end_time = time.time()
+        
+        return [
+            VLMOutput(
+                caption=self.CAPTION,
+                hazard_level=level or "standard",
+                confidence=0.95,
+                tokens_used=used,
+                generation_time=end_time - start_time,
+                generated_tokens=n,
+                prefill_time=first_token_time - lm_start,
+                time_to_first_token=first_token_time - start_time,
+                decode_tokens_per_sec=tokens_per_second(n, first_token_time, end_time)
+            )
+            for used, n, level in zip(tokens_used, num_tokens, hazard_levels)
+        ]
+    
+    @staticmethod
+    def _run(simulation: Generator[int, None, List[VLMOutput]]) -> List[VLMOutput]:
+        while True:
+            try:
+                next(simulation)
+            except StopIteration as stop:
+                return stop.value
+
+
+class ByteTokenizer:
+    """
+    Byte-level tokenizer for the tiny test model.
+    
+    Ids 0-2 are pad/BOS/EOS; byte b maps to id b + 3.
+    """
+    
+    pad_token_id = 0
+    bos_token_id = 1
+    eos_token_id = 2
+    vocab_size = 259
+    
+    class _Encoding:
+        def __init__(self, input_ids: torch.Tensor):
+            self.input_ids = input_ids
+    
+    def __call__(self, text: str, return_tensors: str = "pt", add_special_tokens: bool = True):
+        ids = [b + 3 for b in text.encode("utf-8")]
+        if add_special_tokens:
+            ids = [self.bos_token_id] + ids
+        return self._Encoding(torch.tensor([ids]))
+    
+    def decode(self, ids, skip_special_tokens: bool = True) -> str:
+        ids = [int(i) for i in ids]
+        return bytes(i - 3 for i in ids if i >= 3).decode("utf-8", errors="ignore")
+
+
+class TinyLLaVAWrapper(LLaVAWrapper):
+    """
+    Randomly initialized tiny LLaVA-style model for CPU testing.
+    
+    Unlike MockLLaVAWrapper, it runs the real embedding-level generation
+    paths (batching, KV caches, decoding engines) on a small Llama with a
+    linear patch projector, without downloading weights. Captions are
+    meaningless but deterministic for a given seed.
+    """
+    
+    def __init__(
+        self,
+        hidden_size: int = 32,
+        num_layers: int = 2,
+        num_heads: int = 4,
+        patch_size: int = 14,
+        image_size: int = 336,
+        seed: int = 0,
+        **kwargs
+    ):
+        """
+        Args:
+            hidden_size: LLM hidden size
+            num_layers: LLM decoder layers
+            num_heads: LLM attention heads
+            patch_size: Projector patch size
+            image_size: Input resolution
+            seed: Weight initialization seed
+        """
+        kwargs.setdefault("model_name", "tiny")
+        kwargs.setdefault("device", "cpu")
+        kwargs.setdefault("quantization", "none")
+        kwargs["torch_dtype"] = torch.float32
+        super().__init__(**kwargs)
+        
+        self.hidden_size = hidden_size
+        self.num_layers = num_layers
+        self.num_heads = num_heads
+        self.patch_size = patch_size
+        self.image_size = image_size
+        self.seed = seed
+        self.patch_projector = None
+    
+    @property
+    def vision_tower_id(self) -> str:
+        return f"tiny-h{self.hidden_size}-p{self.patch_size}-s{self.seed}"
+    
+    def load_model(self) -> None:
+        """Build the tiny Llama and patch projector."""
+        if self._loaded:
+            return
+        
+        from transformers import LlamaConfig, LlamaForCausalLM
+        
+        torch.manual_seed(self.seed)
+        config = LlamaConfig(
+            vocab_size=ByteTokenizer.vocab_size,
+            hidden_size=self.hidden_size,
+            intermediate_size=2 * self.hidden_size,
+            num_hidden_layers=self.num_layers,
+            num_attention_heads=self.num_heads,
+            num_key_value_heads=self.num_heads,
+            pad_token_id=ByteTokenizer.pad_token_id,
+            bos_token_id=ByteTokenizer.bos_token_id,
+            eos_token_id=ByteTokenizer.eos_token_id
+        )
+        self.model = LlamaForCausalLM(config).eval().to(self.device)
+        self.patch_projector = nn.Linear(
+            3 * self.patch_size ** 2, self.hidden_size
+        ).eval().to(self.device)
+        self.tokenizer = ByteTokenizer()
+        if self.is_cpu:
+            self._quantize_for_cpu()
+        
+        self._loaded = True
+    
+    def preprocess_image(self, image: Union[np.ndarray, Image.Image, torch.Tensor]) -> torch.Tensor:
+        if isinstance(image, torch.Tensor):
+            image = image.cpu().numpy()
+        array = np.asarray(image, dtype=np.float32) / 255.0
+        pixels = torch.from_numpy(array).permute(2, 0, 1).unsqueeze(0)
+        return torch.nn.functional.interpolate(
+            pixels, size=(self.image_size, self.image_size), mode="bilinear", align_corners=False
+        ).to(self.device)
+    
+    def encode_pixels(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        self.load_model()
+        # [B, 3*P*P, N] -> [B, N, hidden]
+        patches = torch.nn.functional.unfold(
+            pixel_values, kernel_size=self.patch_size, stride=self.patch_size
         )
+        with torch.no_grad():
+            return self.patch_projector(patches.transpose(1, 2))
+    
+    def encode_image_masked(
+        self,
+        image: Union[np.ndarray, Image.Image],
+        mask: torch.Tensor,
+        prune_after_layer: int = 0,
+        summary_weights: Optional[torch.Tensor] = None
+    ) -> torch.Tensor:
+        # Patches are projected independently: pool after encoding
+        features = self.encode_image(image)
+        kept = features[:, mask.flatten().bool().to(features.device)]
+        if summary_weights is None:
+            return kept
+        weights = summary_weights.to(device=features.device, dtype=features.dtype)
+        if weights.dim() == 2:
+            weights = weights.unsqueeze(0)
+        return torch.cat([kept, torch.bmm(weights, features)], dim=1)
+    
+    def generate(
+        self,
+        image: Union[np.ndarray, Image.Image],
+        prompt: str,
+        pruned_tokens: Optional[torch.Tensor] = None,
+        prompt_suffix: Optional[str] = None,
+        hazard_level: Optional[str] = None
+    ) -> VLMOutput:
+        if self._decodes_from_embeds(prompt_suffix):
+            return super().generate(image, prompt, pruned_tokens, prompt_suffix, hazard_level)
+        
+        if prompt_suffix:
+            prompt = f"{prompt}\n{prompt_suffix}"
+        image_features = pruned_tokens if pruned_tokens is not None else self.encode_image(image)
+        return self.generate_batch([image_features], [prompt], [hazard_level])[0]
+
+
+def get_vlm(model_name: str = "llava-1.5-7b", **kwargs) -> LLaVAWrapper:
+    """Factory function to get the VLM wrapper by name ("tiny"/"mock" for CPU testing)."""
+    if model_name == "tiny":
+        return TinyLLaVAWrapper(**kwargs)
+    if model_name == "mock":
+        return MockLLaVAWrapper(model_name=model_name, **kwargs)
+    return LLaVAWrapper(model_name=model_name, **kwargs)
@@ -0,0 +1,163 @@
+"""
+Input-level token pruning for the CLIP vision tower.
+Drops masked-out patches before (or early inside) the ViT so that
+vision-tower FLOPs scale with the kept-token count.
+"""
+
+from typing import Dict, Optional
+import inspect
+import logging
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+logger = logging.getLogger(__name__)
+
+
+def _unwrap_clip(vision_model: nn.Module) -> nn.Module:
+    """Return the module holding embeddings / pre_layrnorm / encoder."""
+    # LLaVA CLIPVisionTower -> HF CLIPVisionModel -> CLIPVisionTransformer
+    vision_model = getattr(vision_model, "vision_tower", vision_model)
+    return getattr(vision_model, "vision_model", vision_model)
+
+
+def _run_layer(layer: nn.Module, hidden_states: torch.Tensor) -> torch.Tensor:
+    """Run one CLIP encoder layer across transformers versions."""
+    params = inspect.signature(layer.forward).parameters
+    if "causal_attention_mask" in params:
+        outputs = layer(hidden_states, None, None)
+    else:
+        outputs = layer(hidden_states, None)
+    return outputs[0] if isinstance(outputs, tuple) else outputs
+
+
+def num_layers_for_select(select_layer: int, num_layers: int) -> int:
+    """
+    Number of encoder layers to run to reach `hidden_states[select_layer]`.
+
+    hidden_states[0] is the pre-layernormed embedding output and
+    hidden_states[i] the output of layer i, so LLaVA's default
+    select_layer=-2 runs all but the last layer.
+    """
+    return select_layer if select_layer >= 0 else num_layers + 1 + select_layer
+
+
+def _drop_patches(
+    hidden_states: torch.Tensor,
+    keep: torch.Tensor,
+    summary_weights: Optional[torch.Tensor] = None,
+    offset: int = 0
+) -> torch.Tensor:
+    """Keep the `keep` positions and append summary tokens pooled over patches[offset:]."""
+    kept = hidden_states[:, keep]
+    if summary_weights is None:
+        return kept
+
+    patches = hidden_states[:, offset:]
+    weights = summary_weights.to(device=patches.device, dtype=patches.dtype)
+    if weights.dim() == 2:
+        weights = weights.unsqueeze(0)
+    summary = torch.bmm(weights.expand(patches.shape[0], -1, -1), patches)
+    return torch.cat([kept, summary], dim=1)
+
+
+def encode_kept_patches(
+    vision_model: nn.Module,
+    pixel_values: torch.Tensor,
+    kept_indices: torch.Tensor,
+    select_layer: int = -2,
+    prune_after_layer: int = 0,
+    keep_cls: bool = False,
+    summary_weights: Optional[torch.Tensor] = None
+) -> torch.Tensor:
+    """
+    Encode only the kept patches of an image with a CLIP ViT.
+
+    Patch embeddings receive their original positional embeddings before
+    the unkept patches are dropped, so the kept tokens see the same
+    positions as in a full encode. With prune_after_layer > 0 the first
+    layers run on the full sequence (more context, less saving).
+    With summary_weights, background summary tokens pooled from the
+    dropped patches at the pruning point are encoded after the kept ones.
+
+    Args:
+        vision_model: HF CLIPVisionModel / CLIPVisionTransformer or LLaVA CLIPVisionTower
+        pixel_values: Pixel values [B, 3, H, W]
+        kept_indices: Indices of kept patches (row-major, without CLS)
+        select_layer: Hidden-state index used as output (LLaVA mm_vision_select_layer)
+        prune_after_layer: Number of layers to run before dropping patches
+        keep_cls: Whether to return the CLS token first
+        summary_weights: Optional pooling weights [K_s, L] or [B, K_s, L]
+            over all patches (TokenPruner.summary_weights)
+
+    Returns:
+        Visual tokens [B, K (+ K_s), D] (K = len(kept_indices), +1 with keep_cls)
+    """
+    clip = _unwrap_clip(vision_model)
+    embeddings = clip.embeddings
+    layers = clip.encoder.layers
+
+    pixel_values = pixel_values.to(dtype=embeddings.patch_embedding.weight.dtype)
+    kept_indices = kept_indices.to(pixel_values.device)
+
+    num_layers = num_layers_for_select(select_layer, len(layers))
+    prune_after_layer = min(prune_after_layer, num_layers)
+
+    # Keep CLS in the sequence during encoding, as in the full ViT
+    keep = torch.cat([
+        torch.zeros(1, dtype=torch.long, device=kept_indices.device),
+        kept_indices + 1
+    ])
+
+    with torch.no_grad():
+        # Patch + positional embeddings (mirrors CLIPVisionEmbeddings.forward)
+        patch_embeds = embeddings.patch_embedding(pixel_values).flatten(2).transpose(1, 2)
+        position_embeds = embeddings.position_embedding.weight
+        patch_embeds = patch_embeds + position_embeds[1:].unsqueeze(0)
+        cls_embeds = (embeddings.class_embedding + position_embeds[0]).expand(
+            patch_embeds.shape[0], 1, -1
+        )
+
+        if prune_after_layer == 0:
+            patch_embeds = _drop_patches(patch_embeds, kept_indices, summary_weights)
+        hidden_states = clip.pre_layrnorm(torch.cat([cls_embeds, patch_embeds], dim=1))
+
+        for layer_idx in range(num_layers):
+            if layer_idx == prune_after_layer and prune_after_layer > 0:
+                hidden_states = _drop_patches(hidden_states, keep, summary_weights, offset=1)
+            hidden_states = _run_layer(layers[layer_idx], hidden_states)
+
+        if prune_after_layer == num_layers and prune_after_layer > 0:
+            hidden_states = _drop_patches(hidden_states, keep, summary_weights, offset=1)
+
+    return hidden_states if keep_cls else hidden_states[:, 1:]
+
+
+def compare_encodings(
+    full_features: torch.Tensor,
+    masked_features: torch.Tensor,
+    kept_indices: torch.Tensor
+) -> Dict[str, float]:
+    """
+    Quality comparison between input-pruned and full encodes.
+
+    Args:
+        full_features: Full encode [B, L, D] (patch tokens, no CLS)
+        masked_features: Input-pruned encode [B, K, D]
+        kept_indices: Indices of kept patches
+
+    Returns:
+        Dict with cosine similarity (mean/min) and relative L2 error
+    """
+    reference = full_features[:, kept_indices.to(full_features.device)].float()
+    masked = masked_features.float()
+
+    cosine = F.cosine_similarity(reference, masked, dim=-1)
+    rel_l2 = torch.norm(reference - masked) / torch.norm(reference).clamp(min=1e-8)
+
+    return {
+        "cosine_mean": cosine.mean().item(),
+        "cosine_min": cosine.min().item(),
+        "rel_l2": rel_l2.item(),
+    }
@@ -0,0 +1,203 @@
+"""
+Prefix KV-cache for the fixed hazard prompt templates.
+Precomputes the KV states of the image-independent prompt prefix once per
+template so each event frame only prefills image tokens and its suffix,
+and memoizes prompt token ids.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+import copy
+import logging
+import time
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PrefixCacheEntry:
+    """Cached KV states for one prompt prefix."""
+    input_ids: torch.Tensor   # [1, P] prefix token ids
+    past_key_values: Any      # KV cache after prefilling the prefix
+    prefill_time: float       # Time spent prefilling the prefix once
+
+    @property
+    def num_tokens(self) -> int:
+        return self.input_ids.shape[1]
+
+
+class PrefixKVCache:
+    """
+    Bounded LRU cache of prefix KV states keyed by prefix text.
+
+    Entries are never mutated: `lookup` returns a copy of the cached KV
+    states for the caller's decode to extend. The copies are timed and
+    deducted from the reported prefill time saved.
+    """
+
+    def __init__(self, max_entries: int = 8):
+        """
+        Args:
+            max_entries: Maximum cached prefixes (one per prompt template)
+        """
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, PrefixCacheEntry]" = OrderedDict()
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """Reset hit/miss statistics."""
+        self.hits = 0
+        self.misses = 0
+        self.prefill_time_saved = 0.0
+        self.copy_time = 0.0
+        self.tokens_saved = 0
+
+    def clear(self) -> None:
+        """Drop all cached prefixes."""
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def build(self, model, input_ids: torch.Tensor) -> PrefixCacheEntry:
+        """Prefill prefix token ids and capture the KV cache."""
+        with torch.no_grad():
+            start = time.time()
+            outputs = model(input_ids=input_ids, use_cache=True)
+            prefill_time = time.time() - start
+
+        return PrefixCacheEntry(
+            input_ids=input_ids,
+            past_key_values=outputs.past_key_values,
+            prefill_time=prefill_time
+        )
+
+    def lookup(
+        self,
+        prefix_text: str,
+        model,
+        tokenizer,
+        device: Optional[str] = None
+    ) -> PrefixCacheEntry:
+        """
+        Get the KV states for a prefix, building them on a miss.
+
+        Args:
+            prefix_text: Image-independent prompt prefix
+            model: Language model used to prefill the prefix
+            tokenizer: Tokenizer for the prefix (adds BOS)
+            device: Device for the prefix token ids
+
+        Returns:
+            PrefixCacheEntry whose past_key_values is a private copy
+        """
+        entry = self._entries.get(prefix_text)
+
+        if entry is None:
+            self.misses += 1
+            input_ids = tokenizer(prefix_text, return_tensors="pt").input_ids
+            if device is not None:
+                input_ids = input_ids.to(device)
+            entry = self.build(model, input_ids)
+            self._entries[prefix_text] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        else:
+            self.hits += 1
+            self.prefill_time_saved += entry.prefill_time
+            self.tokens_saved += entry.num_tokens
+            self._entries.move_to_end(prefix_text)
+
+        start = time.time()
+        past_key_values = copy.deepcopy(entry.past_key_values)
+        copy_time = time.time() - start
+        self.copy_time += copy_time
+        self.prefill_time_saved -= copy_time
+
+        return PrefixCacheEntry(
+            input_ids=entry.input_ids,
+            past_key_values=past_key_values,
+            prefill_time=entry.prefill_time
+        )
+
+    def stats(self) -> Dict[str, float]:
+        """Cache hit statistics and prefill time saved (net of KV copies)."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": float(self.hits),
+            "misses": float(self.misses),
+            "hit_rate": self.hits / max(lookups, 1),
+            "prefill_time_saved": self.prefill_time_saved,
+            "copy_time": self.copy_time,
+            "prefix_tokens_saved": float(self.tokens_saved),
+        }
+
+
+class PromptTokenCache:
+    """
+    Bounded LRU cache of prompt token ids keyed by prompt text.
+
+    Prompts are a hazard template plus a detected-class suffix, so the
+    same few texts are tokenized for every event frame.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        """
+        Args:
+            max_entries: Maximum cached prompt texts
+        """
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, bool], torch.Tensor]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        """Drop all cached token ids."""
+        self._entries.clear()
+
+    def lookup(
+        self,
+        text: str,
+        tokenizer,
+        device: Optional[str] = None,
+        add_special_tokens: bool = True
+    ) -> torch.Tensor:
+        """
+        Token ids [1, T] of `text`, tokenizing on a miss.
+
+        The returned tensor is shared with the cache and must not be
+        modified in place.
+        """
+        key = (text, add_special_tokens)
+        input_ids = self._entries.get(key)
+
+        if input_ids is None:
+            self.misses += 1
+            input_ids = tokenizer(
+                text, return_tensors="pt", add_special_tokens=add_special_tokens
+            ).input_ids
+            if device is not None:
+                input_ids = input_ids.to(device)
+            self._entries[key] = input_ids
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+
+        return input_ids
+
+    def stats(self) -> Dict[str, float]:
+        """Cache hit statistics."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": float(self.hits),
+            "misses": float(self.misses),
+            "hit_rate": self.hits / max(lookups, 1),
+        }
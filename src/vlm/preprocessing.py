@@ -0,0 +1,183 @@
+"""
+Tensor-native CLIP preprocessing for Stage 3.
+Resizes, center-crops and normalizes decoded uint8 frames as batched torch
+ops on the target device, replacing the PIL/numpy image processor path.
+"""
+
+from typing import Any, List, Optional, Sequence, Union
+import logging
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+logger = logging.getLogger(__name__)
+
+CLIP_MEAN = (0.48145466, 0.4578275, 0.40821073)
+CLIP_STD = (0.26862954, 0.26130258, 0.27577711)
+
+# PIL resample codes used by HF image processors
+_RESAMPLE_MODES = {2: "bilinear", 3: "bicubic"}
+
+
+def _size_value(size: Any, key: str) -> Optional[int]:
+    """Read a field of an HF size dict/SizeDict (or an int size)."""
+    if isinstance(size, int):
+        return size
+    if isinstance(size, dict):
+        return size.get(key)
+    return getattr(size, key, None)
+
+
+class TensorPreprocessor:
+    """
+    CLIP image preprocessing as torch ops.
+
+    Mirrors CLIPImageProcessor: resize the shortest edge to `size`
+    (antialiased bicubic, rounded back to uint8 like PIL), center-crop to
+    `crop_size`, rescale to [0, 1] and normalize with the CLIP mean/std.
+    """
+
+    def __init__(
+        self,
+        size: int = 336,
+        crop_size: int = 336,
+        mean: Sequence[float] = CLIP_MEAN,
+        std: Sequence[float] = CLIP_STD,
+        interpolation: str = "bicubic",
+        device: str = "cpu",
+        dtype: torch.dtype = torch.float32
+    ):
+        """
+        Args:
+            size: Target length of the shortest edge
+            crop_size: Center-crop side length
+            mean: Per-channel normalization mean
+            std: Per-channel normalization std
+            interpolation: Resize mode (bicubic or bilinear)
+            device: Device the frames are processed on
+            dtype: Output dtype
+        """
+        self.size = size
+        self.crop_size = crop_size
+        self.interpolation = interpolation
+        self.device = device
+        self.dtype = dtype
+
+        self.mean = torch.tensor(mean, device=device).view(1, 3, 1, 1)
+        self.std = torch.tensor(std, device=device).view(1, 3, 1, 1)
+
+    @classmethod
+    def from_image_processor(cls, image_processor, **kwargs) -> "TensorPreprocessor":
+        """Build from an HF CLIP image processor's settings."""
+        resample = getattr(image_processor, "resample", 3)
+        return cls(
+            size=_size_value(image_processor.size, "shortest_edge"),
+            crop_size=_size_value(image_processor.crop_size, "height"),
+            mean=image_processor.image_mean,
+            std=image_processor.image_std,
+            interpolation=_RESAMPLE_MODES.get(int(resample), "bicubic"),
+            **kwargs
+        )
+
+    def to_tensor(
+        self,
+        frames: Union[np.ndarray, torch.Tensor, List[np.ndarray]],
+        bgr: bool = False
+    ) -> torch.Tensor:
+        """
+        Move uint8 HWC frames to the device as a [B, 3, H, W] float batch.
+
+        Args:
+            frames: Frame [H, W, 3], batch [B, H, W, 3], or list of same-size frames
+            bgr: Whether frames are BGR (OpenCV) and need a channel flip
+        """
+        if isinstance(frames, list):
+            frames = np.stack(frames)
+        if isinstance(frames, np.ndarray):
+            frames = torch.from_numpy(np.ascontiguousarray(frames))
+        if frames.dim() == 3:
+            frames = frames.unsqueeze(0)
+
+        pixels = frames.to(self.device, non_blocking=True).permute(0, 3, 1, 2)
+        if bgr:
+            pixels = pixels.flip(1)
+        return pixels.float()
+
+    def output_size(self, height: int, width: int) -> tuple:
+        """Resized (height, width) with the shortest edge at `size`."""
+        short, long = (height, width) if height <= width else (width, height)
+        new_long = int(self.size * long / short)
+        return (self.size, new_long) if height <= width else (new_long, self.size)
+
+    def __call__(
+        self,
+        frames: Union[np.ndarray, torch.Tensor, List[np.ndarray]],
+        bgr: bool = False
+    ) -> torch.Tensor:
+        """
+        Preprocess uint8 frames into CLIP pixel values.
+
+        Args:
+            frames: Frame [H, W, 3], batch [B, H, W, 3], or list of same-size frames
+            bgr: Whether frames are BGR (OpenCV) and need a channel flip
+
+        Returns:
+            Pixel values [B, 3, crop_size, crop_size]
+        """
+        pixels = self.to_tensor(frames, bgr=bgr)
+        height, width = pixels.shape[-2:]
+
+        pixels = F.interpolate(
+            pixels,
+            size=self.output_size(height, width),
+            mode=self.interpolation,
+            align_corners=False,
+            antialias=True
+        )
+        # PIL resizes in uint8; round and clip to match
+        pixels = pixels.round().clamp(0, 255)
+
+        height, width = pixels.shape[-2:]
+        top = (height - self.crop_size) // 2
+        left = (width - self.crop_size) // 2
+        pixels = pixels[..., top:top + self.crop_size, left:left + self.crop_size]
+
+        pixels = (pixels / 255.0 - self.mean) / self.std
+        return pixels.to(self.dtype)
+
+    def validate(self, image_processor, atol: float = 0.05) -> float:
+        """
+        Check agreement with the HF processor on a synthetic smooth frame.
+
+        Logs a warning when the max absolute error exceeds atol.
+
+        Returns:
+            Max absolute error
+        """
+        y, x = np.mgrid[0:480, 0:640].astype(np.float32)
+        frame = np.stack([
+            127.5 + 127.5 * np.sin(x / 37.0),
+            127.5 + 127.5 * np.cos(y / 23.0),
+            255.0 * (x + y) / (480 + 640)
+        ], axis=-1).astype(np.uint8)
+
+        error = self.max_abs_error(image_processor, frame)
+        if error > atol:
+            logger.warning(
+                f"Tensor preprocessing deviates from the HF processor by {error:.4f} "
+                f"(tolerance {atol})"
+            )
+        return error
+
+    def max_abs_error(self, image_processor, frame: np.ndarray) -> float:
+        """
+        Max absolute difference to the HF processor on one RGB uint8 frame.
+
+        Args:
+            image_processor: HF CLIP image processor
+            frame: RGB frame [H, W, 3]
+        """
+        reference = image_processor.preprocess(frame, return_tensors="pt")["pixel_values"]
+        ours = self(frame).float().cpu()
+        return float((ours - reference.float()).abs().max())
@@ -4,7 +4,7 @@ Dynamically selects prompts based on detected hazard severity.
 """
 
 from dataclasses import dataclass, field
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
@@ -175,6 +175,33 @@ class HazardPriorityPrompting:
         
         return template.format()
     
+    def select_prompt_parts(
+        self,
+        hazard_level: str,
+        detected_classes: Optional[List[str]] = None
+    ) -> Tuple[str, str]:
+        """
+        Select prompt split into (template, per-frame suffix).
+        
+        The template depends only on the hazard level, so its KV states can
+        be cached; the suffix carries the detected classes.
+        
+        Args:
+            hazard_level: Maximum hazard level from detections
+            detected_classes: Optional list of detected class names
+            
+        Returns:
+            (template prompt, suffix) where suffix may be empty
+        """
+        template = self.prompt_bank.get_prompt(hazard_level)
+        
+        suffix = ""
+        if detected_classes:
+            classes_str = ", ".join(detected_classes[:5])  # Limit to 5
+            suffix = f"Detected objects: {classes_str}"
+        
+        return template.format(), suffix
+    
     def select_prompt_by_weight(
         self,
         max_weight: float,
@@ -0,0 +1,242 @@
+"""
+Speculative decoding for Stage 3.
+A cheap drafter (a small language model sharing the target's tokenizer, or
+n-gram lookup in the prompt and detected-class text) proposes several
+tokens; the target verifies them in one forward pass. Greedy outputs are
+unchanged, only the number of target passes drops.
+"""
+
+from typing import Any, Callable, Generator, List, Optional
+import logging
+import time
+
+import torch
+
+from src.vlm.decoding import DecodeOutput, select_next_token
+
+logger = logging.getLogger(__name__)
+
+SPECULATIVE_MODES = ["off", "draft", "prompt_lookup"]
+
+
+def crop_cache(cache: Any, length: int) -> None:
+    """Truncate an HF KV cache to its first `length` positions."""
+    excess = cache.get_seq_length() - length
+    if excess > 0:
+        cache.crop(-excess)
+
+
+class PromptLookupDrafter:
+    """
+    Draft by copying what followed the latest n-gram match in the context.
+
+    Captions repeat phrases of the prompt and detected-class list, so the
+    tokens after an earlier occurrence of the trailing n-gram are likely
+    continuations.
+    """
+
+    def __init__(self, num_tokens: int = 4, max_ngram: int = 3):
+        """
+        Args:
+            num_tokens: Tokens proposed per step
+            max_ngram: Longest trailing n-gram matched (shorter ones are tried next)
+        """
+        self.num_tokens = num_tokens
+        self.max_ngram = max_ngram
+        self.context: List[int] = []
+
+    def reset(self, context_ids: List[int]) -> None:
+        """Start a new sequence with the prompt/context token ids."""
+        self.context = list(context_ids)
+
+    def propose(self, generated: List[int]) -> List[int]:
+        """Propose up to num_tokens continuations of context + generated ids."""
+        tokens = self.context + generated
+        for n in range(min(self.max_ngram, len(tokens) - 1), 0, -1):
+            tail = tokens[-n:]
+            # Latest earlier occurrence of the trailing n-gram
+            for start in range(len(tokens) - n - 1, -1, -1):
+                if tokens[start:start + n] == tail:
+                    follow = tokens[start + n:start + n + self.num_tokens]
+                    if follow:
+                        return follow
+        return []
+
+
+class DraftModelDrafter:
+    """
+    Draft greedily with a small causal LM over the text context.
+
+    The draft sees the prompt text (without image tokens) and keeps its own
+    KV cache, cropped back to the verified tokens after every step.
+    """
+
+    def __init__(self, model, num_tokens: int = 4, device: Optional[str] = None):
+        """
+        Args:
+            model: Draft causal LM sharing the target's tokenizer
+            num_tokens: Tokens proposed per step
+            device: Device of the draft's input ids
+        """
+        self.model = model
+        self.num_tokens = num_tokens
+        self.device = device
+        self.context: List[int] = []
+        self._cache: Any = None
+        self._cached_ids: List[int] = []
+
+    def reset(self, context_ids: List[int]) -> None:
+        """Start a new sequence with the prompt/context token ids."""
+        self.context = list(context_ids)
+        self._cache = None
+        self._cached_ids = []
+
+    def propose(self, generated: List[int]) -> List[int]:
+        """Greedily propose num_tokens continuations of context + generated ids."""
+        tokens = self.context + generated
+
+        # Reuse the cached prefix shared with the verified tokens
+        common = 0
+        for cached, token in zip(self._cached_ids, tokens):
+            if cached != token:
+                break
+            common += 1
+        common = min(common, len(tokens) - 1)
+        if self._cache is not None:
+            crop_cache(self._cache, common)
+        self._cached_ids = tokens[:common]
+
+        proposal: List[int] = []
+        pending = tokens[common:]
+        with torch.no_grad():
+            for _ in range(self.num_tokens):
+                input_ids = torch.tensor([pending], device=self.device)
+                outputs = self.model(input_ids=input_ids, past_key_values=self._cache, use_cache=True)
+                self._cache = outputs.past_key_values
+                self._cached_ids += pending
+
+                token = int(outputs.logits[0, -1].argmax())
+                proposal.append(token)
+                pending = [token]
+        return proposal
+
+
+def speculative_from_embeds(
+    model,
+    inputs_embeds: torch.Tensor,
+    drafter,
+    context_ids: List[int],
+    past_key_values: Any = None,
+    max_new_tokens: int = 256,
+    eos_token_id: Optional[int] = None,
+    stop_fn: Optional[Callable[[List[int]], bool]] = None
+) -> Generator[int, None, DecodeOutput]:
+    """
+    Greedy speculative decoding on input embeddings.
+
+    Yields generated token ids like stream_from_embeds; the DecodeOutput
+    (with draft proposal/acceptance counts) is the return value.
+
+    Args:
+        model: Target HF causal LM accepting inputs_embeds
+        inputs_embeds: Input embeddings [1, T, H]
+        drafter: PromptLookupDrafter or DraftModelDrafter
+        context_ids: Text token ids of the prompt the drafter conditions on
+        past_key_values: Optional KV cache of a prefix preceding inputs_embeds
+        max_new_tokens: Maximum tokens to generate
+        eos_token_id: End-of-sequence token id
+        stop_fn: Optional early-stop check on the generated ids
+
+    Returns:
+        DecodeOutput
+    """
+    token_ids: List[int] = []
+    first_token_time = None
+    proposed = accepted = 0
+    drafter.reset(context_ids)
+
+    with torch.no_grad():
+        start = time.time()
+        outputs = model(inputs_embeds=inputs_embeds, past_key_values=past_key_values, use_cache=True)
+        cache = outputs.past_key_values
+        pending = [int(select_next_token(outputs.logits[:, -1])[0])]
+        prefill_time = time.time() - start
+
+        start = time.time()
+        done = False
+        while not done:
+            # Emit verified tokens; the last one is not yet in the target cache
+            for token in pending:
+                if eos_token_id is not None and token == eos_token_id:
+                    done = True
+                    break
+                token_ids.append(token)
+                if first_token_time is None:
+                    first_token_time = time.time()
+                yield token
+                if len(token_ids) == max_new_tokens or (stop_fn is not None and stop_fn(token_ids)):
+                    done = True
+                    break
+            if done:
+                break
+
+            draft = drafter.propose(token_ids)[:max_new_tokens - len(token_ids)]
+            proposed += len(draft)
+
+            # Verify [last token, draft...] in one target pass
+            cache_length = cache.get_seq_length()
+            input_ids = torch.tensor([[token_ids[-1]] + draft], device=inputs_embeds.device)
+            outputs = model(input_ids=input_ids, past_key_values=cache, use_cache=True)
+            cache = outputs.past_key_values
+            predictions = select_next_token(outputs.logits[0]).tolist()
+
+            num_accepted = 0
+            while num_accepted < len(draft) and draft[num_accepted] == predictions[num_accepted]:
+                num_accepted += 1
+            accepted += num_accepted
+
+            # Keep KV states of the last token and the accepted drafts
+            crop_cache(cache, cache_length + 1 + num_accepted)
+            pending = draft[:num_accepted] + [predictions[num_accepted]]
+        end = time.time()
+
+    return DecodeOutput(
+        token_ids=token_ids,
+        past_key_values=cache,
+        prefill_time=prefill_time,
+        decode_time=end - start,
+        first_token_time=first_token_time,
+        proposed_draft_tokens=proposed,
+        accepted_draft_tokens=accepted
+    )
+
+
+def get_drafter(
+    mode: str,
+    num_tokens: int = 4,
+    draft_model: Any = None,
+    max_ngram: int = 3,
+    device: Optional[str] = None
+):
+    """
+    Build a drafter for a speculative mode.
+
+    Args:
+        mode: One of SPECULATIVE_MODES
+        num_tokens: Tokens proposed per step
+        draft_model: Loaded draft LM (draft mode)
+        max_ngram: Longest n-gram matched (prompt_lookup mode)
+        device: Device of the draft's input ids
+
+    Returns:
+        Drafter, or None when speculation is off
+    """
+    if mode == "off":
+        return None
+    if mode == "prompt_lookup":
+        return PromptLookupDrafter(num_tokens=num_tokens, max_ngram=max_ngram)
+    if mode == "draft":
+        if draft_model is None:
+            raise ValueError("Speculative mode 'draft' requires a draft model")
+        return DraftModelDrafter(draft_model, num_tokens=num_tokens, device=device)
+    raise ValueError(f"Unknown speculative mode: {mode}. Supported: {SPECULATIVE_MODES}")
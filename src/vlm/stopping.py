@@ -0,0 +1,227 @@
+"""
+Early-stopping rules for Stage 3 decoding.
+Stops a caption once the prompt's numbered fields are answered, a section
+terminator appears, or the output starts repeating itself.
+"""
+
+from collections import Counter
+from typing import List, Optional, Sequence
+import re
+
+import torch
+
+_FIELD_PATTERN = re.compile(r"^\s*(\d+)[.)]\s", re.MULTILINE)
+
+
+def count_numbered_fields(prompt: str) -> int:
+    """Number of numbered fields ("1. ...", "2. ...") requested by a prompt."""
+    numbers = [int(n) for n in _FIELD_PATTERN.findall(prompt)]
+    return max(numbers) if numbers else 0
+
+
+class CaptionStopper:
+    """
+    Per-sequence stop criterion over generated token ids.
+
+    A sequence stops when any enabled rule fires:
+    - structured: the last numbered field of the prompt has been written
+      and its line terminated
+    - terminator: a stop sequence (e.g. a new "USER:" turn) is generated
+    - repetition: the trailing n-gram has occurred `repetition_max` times
+    """
+
+    def __init__(
+        self,
+        tokenizer,
+        num_fields: int = 0,
+        stop_sequences: Sequence[str] = (),
+        repetition_ngram: int = 0,
+        repetition_max: int = 3
+    ):
+        """
+        Args:
+            tokenizer: Tokenizer used to decode generated ids
+            num_fields: Numbered fields to fill before stopping (0 = off)
+            stop_sequences: Section terminators ending the caption
+            repetition_ngram: N-gram size for repetition detection (0 = off)
+            repetition_max: Occurrences of the trailing n-gram that stop decoding
+        """
+        self.tokenizer = tokenizer
+        self.num_fields = num_fields
+        self.stop_sequences = [s for s in stop_sequences if s]
+        self.repetition_ngram = repetition_ngram
+        self.repetition_max = repetition_max
+
+        self._field_start = re.compile(rf"\s*{num_fields}[.)]") if num_fields > 0 else None
+        self._stop_window = max((len(s) for s in self.stop_sequences), default=1) - 1
+        self.reset()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._field_start or self.stop_sequences or self.repetition_ngram > 0)
+
+    def reset(self) -> None:
+        """Forget the sequence seen so far."""
+        self.reason: Optional[str] = None
+        self._seen = 0
+        self._last_token: Optional[int] = None
+        self._ngrams: Counter = Counter()
+        # Incremental detokenization: ids [prefix_offset, read_offset) are
+        # re-decoded with the new ids so merges at the boundary decode right
+        self._prefix_offset = 0
+        self._read_offset = 0
+        self._tail = ""
+        self._line = ""
+        self._field_pending = False
+
+    def __call__(self, token_ids: List[int]) -> bool:
+        """
+        Whether decoding should stop after token_ids.
+
+        Called with the growing id list of one sequence, each call only
+        processes the ids added since the previous call. A list that does
+        not extend the previous one starts a new sequence.
+        """
+        if len(token_ids) < self._seen or (
+            self._seen and token_ids[self._seen - 1] != self._last_token
+        ):
+            self.reset()
+        if self.reason is not None:
+            return True
+        if len(token_ids) == self._seen:
+            return False
+
+        seen, self._seen = self._seen, len(token_ids)
+        self._last_token = token_ids[-1]
+
+        if self.repetition_ngram > 0 and self._is_repeating(token_ids, seen):
+            self.reason = "repetition"
+            return True
+
+        if self._field_start is None and not self.stop_sequences:
+            return False
+
+        text = self._decode_tail(token_ids)
+        if self.stop_sequences and self._has_terminator(text):
+            self.reason = "terminator"
+            return True
+        if self._field_start is not None and self._has_last_field(text):
+            self.reason = "structured"
+            return True
+        return False
+
+    def _is_repeating(self, token_ids: List[int], seen: int) -> bool:
+        n = self.repetition_ngram
+        for end in range(max(seen + 1, n), len(token_ids) + 1):
+            self._ngrams[tuple(token_ids[end - n:end])] += 1
+        if len(token_ids) < n * self.repetition_max:
+            return False
+        return self._ngrams[tuple(token_ids[-n:])] >= self.repetition_max
+
+    def _decode_tail(self, token_ids: List[int]) -> str:
+        """Text added by the ids since the last decoded call."""
+        prefix = self.tokenizer.decode(
+            token_ids[self._prefix_offset:self._read_offset], skip_special_tokens=True
+        )
+        window = self.tokenizer.decode(token_ids[self._prefix_offset:], skip_special_tokens=True)
+        if len(window) <= len(prefix) or window.endswith("\ufffd"):
+            # Incomplete character: wait for the ids that finish it
+            return ""
+        self._prefix_offset, self._read_offset = self._read_offset, len(token_ids)
+        return window[len(prefix):]
+
+    def _has_terminator(self, text: str) -> bool:
+        window = self._tail + text
+        self._tail = window[-self._stop_window:] if self._stop_window else ""
+        return any(s in window for s in self.stop_sequences)
+
+    def _has_last_field(self, text: str) -> bool:
+        """Whether a completed line wrote the last numbered field."""
+        self._line += text
+        while "\n" in self._line:
+            line, _, self._line = self._line.partition("\n")
+            if self._field_pending:
+                if line.strip():
+                    return True
+                continue
+            match = self._field_start.match(line)
+            if match is not None:
+                if line[match.end():].strip():
+                    return True
+                # Field number on its own line: its text follows
+                self._field_pending = True
+        return False
+
+    def trim(self, caption: str) -> str:
+        """Cut a decoded caption at the first stop sequence."""
+        for stop in self.stop_sequences:
+            index = caption.find(stop)
+            if index >= 0:
+                caption = caption[:index]
+        return caption.strip()
+
+    def safe_prefix(self, text: str) -> str:
+        """
+        Part of partially decoded text that can be shown while streaming.
+
+        Cuts at a complete stop sequence and holds back a trailing partial
+        match of one, which may still become a terminator.
+        """
+        text = self.trim(text) if any(s in text for s in self.stop_sequences) else text
+        for stop in self.stop_sequences:
+            for length in range(min(len(stop) - 1, len(text)), 0, -1):
+                if text.endswith(stop[:length]):
+                    text = text[:-length]
+                    break
+        return text.rstrip()
+
+
+def strip_prompt_ids(output_ids: torch.Tensor, prompt_ids: Optional[torch.Tensor]) -> torch.Tensor:
+    """
+    Generated ids of one generate() row.
+
+    Generation from input embeddings returns only the new tokens;
+    generation from input ids returns the prompt followed by the new
+    tokens. A row that starts with the prompt has it sliced off.
+
+    Args:
+        output_ids: Output row [T]
+        prompt_ids: Prompt ids [P] (None: the row holds only new tokens)
+    """
+    if prompt_ids is None:
+        return output_ids
+    length = prompt_ids.shape[0]
+    if output_ids.shape[0] >= length and torch.equal(output_ids[:length], prompt_ids.to(output_ids.device)):
+        return output_ids[length:]
+    return output_ids
+
+
+def hf_stopping_criteria(
+    stoppers: List[Optional[CaptionStopper]],
+    max_new_tokens: List[int],
+    prompt_ids: Optional[torch.Tensor] = None
+):
+    """
+    Wrap per-row stoppers and token budgets as an HF StoppingCriteriaList.
+
+    Args:
+        stoppers: CaptionStopper (or None) per batch row
+        max_new_tokens: Token budget per batch row
+        prompt_ids: Prompt ids [P] of generation from input ids; rows that
+            start with them are stripped before the checks (see
+            strip_prompt_ids)
+
+    Returns:
+        StoppingCriteriaList returning a per-row stop mask
+    """
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    class _PerRowCriteria(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            done = torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+            for row, (stopper, budget) in enumerate(zip(stoppers, max_new_tokens)):
+                ids = strip_prompt_ids(input_ids[row], prompt_ids).tolist()
+                done[row] = len(ids) >= budget or (stopper is not None and stopper(ids))
+            return done
+
+    return StoppingCriteriaList([_PerRowCriteria()])